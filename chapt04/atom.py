@@ -13,12 +13,43 @@ from pyglet.gl import *
 from pyglet import window
 from pyglet.window import key
 
+import sys
+sys.path.append("../shared")
+from fakeglu import gluNewQuadric, gluDeleteQuadric, gluQuadricTexture, gluSphere
+from scenegraph import SceneNode, DrawScene
+
 xRot = 0.0
 yRot = 0.0
 
 # Angle of revolution around the nucleus
 fElect1 = 0.0
 
+def DrawSphere(radius):
+    sphere = gluNewQuadric()
+    gluQuadricTexture(sphere, True)
+    gluSphere(sphere, radius, 15, 15)
+    gluDeleteQuadric(sphere)
+
+# Red Nucleus
+def DrawNucleus():
+    glColor3ub(255, 0, 0)
+    DrawSphere(10.0)
+
+# Yellow Electrons
+def DrawElectron():
+    glColor3ub(255, 255, 0)
+    DrawSphere(6.0)
+
+# The nucleus, and each electron tilted onto its orbit, turned by the angle
+# of revolution and moved out to its orbit distance
+nucleus = SceneNode(DrawNucleus)
+electronOrbits = []
+for (tilt, x, z) in ((0.0, 90.0, 0.0), (45.0, -70.0, 0.0), (360.0-45.0, 0.0, 60.0)):
+    electron = nucleus.AddChild(SceneNode(DrawElectron))
+    electron.Rotate(tilt, 0.0, 0.0, 1.0)
+    electronOrbits.append((electron, electron.Rotate(fElect1, 0.0, 1.0, 0.0)))
+    electron.Translate(x, 0.0, z)
+
 class MainWindow(window.Window):
     def __init__(self, *args, **kwargs):
         window.Window.__init__(self, *args, **kwargs)
@@ -36,6 +67,8 @@ class MainWindow(window.Window):
         fElect1 += 10.0
         if(fElect1 > 360.0):
             fElect1 = 0.0
+        for (electron, iOrbit) in electronOrbits:
+            electron.SetRotation(iOrbit, fElect1)
 
     # Called to draw scene
     def on_draw(self):
@@ -51,57 +84,9 @@ class MainWindow(window.Window):
         # Translate the whole scene out and into view
         # This is the initial viewing transformation
         glTranslatef(0.0, 0.0, -100.0)
-        
-        # Red Nucleus
-        glColor3ub(255, 0, 0)
-        sphere = gluNewQuadric()
-        gluQuadricTexture(sphere, True)
-        gluSphere(sphere, 10.0, 15, 15)
-        gluDeleteQuadric(sphere)
-
-        # Yellow Electrons
-        glColor3ub(255, 255, 0)
-        
-        # First Electron Orbit
-        # Save viewing transformation
-        glPushMatrix()
-        
-        # Rotate by angle of revolution
-        glRotatef(fElect1, 0.0, 1.0, 0.0)
-        
-        # Translate out from origin to orbit distance
-        glTranslatef(90.0, 0.0, 0.0)
-        
-        # Draw the electron
-        sphere = gluNewQuadric()
-        gluQuadricTexture(sphere, True)
-        gluSphere(sphere, 6.0,15, 15)    
-        gluDeleteQuadric(sphere)
-        
-        # Restore the viewing transformation
-        glPopMatrix()
-        
-        # Second Electron Orbit
-        glPushMatrix()
-        glRotatef(45.0, 0.0, 0.0, 1.0)
-        glRotatef(fElect1, 0.0, 1.0, 0.0)
-        glTranslatef(-70.0, 0.0, 0.0)
-        sphere = gluNewQuadric()
-        gluQuadricTexture(sphere, True)
-        gluSphere(sphere, 6.0, 15, 15)    
-        gluDeleteQuadric(sphere)
-        glPopMatrix()
-
-        # Third Electron Orbit
-        glPushMatrix()
-        glRotatef(360.0-45.0,0.0, 0.0, 1.0)
-        glRotatef(fElect1, 0.0, 1.0, 0.0)
-        glTranslatef(0.0, 0.0, 60.0)
-        sphere = gluNewQuadric()
-        gluQuadricTexture(sphere, True)
-        gluSphere(sphere, 6.0, 15, 15)    
-        gluDeleteQuadric(sphere)
-        glPopMatrix()
+
+        # The nucleus and electrons
+        DrawScene(nucleus)
 
     # Called when the window has changed size (including when the window is created)
     def on_resize(self, w, h):
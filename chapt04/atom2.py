@@ -13,6 +13,10 @@ from pyglet.gl import *
 from pyglet import window
 from pyglet.window import key
 
+import sys
+sys.path.append("../shared")
+from fakeglu import gluNewQuadric, gluDeleteQuadric, gluQuadricTexture, gluSphere
+
 xRot = 0.0
 yRot = 0.0
 
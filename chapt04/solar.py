@@ -13,6 +13,12 @@ from pyglet.gl import *
 from pyglet import window
 from pyglet.window import key
 
+import sys
+sys.path.append("../shared")
+from fakeglu import gluNewQuadric, gluDeleteQuadric, gluQuadricTexture, gluSphere
+from lod import LevelOfDetail
+from scenegraph import SceneNode, DrawScene
+
 xRot = 0.0
 yRot = 0.0
 
@@ -22,6 +28,48 @@ fMoonRot = 0.0
 fEarthRot = 0.0
 lightPos = lightArrayType(0.0, 0.0, 0.0, 1.0)
 
+# Picks how finely to draw the spheres from their size on screen
+lod = LevelOfDetail()
+
+# Draw the sphere of node. Its world matrix is the modelview matrix it is
+# drawn with, so the level of detail is picked from that rather than GL's.
+def DrawSphere(radius, node):
+    sphere = gluNewQuadric()
+    gluQuadricTexture(sphere, True)
+    (slices, stacks) = lod.SphereLevel(radius, 30, 17, mModelView = node.GetWorldMatrix())
+    gluSphere(sphere, radius, slices, stacks)
+    gluDeleteQuadric(sphere)
+
+def DrawSun():
+    # The light is at the sun, which is unlit itself
+    glLightfv(GL_LIGHT0,GL_POSITION,lightPos)
+    glDisable(GL_LIGHTING)
+    glColor3ub(255, 255, 0)
+    DrawSphere(15.0, sun)
+    glEnable(GL_LIGHTING)
+
+def DrawEarth():
+    glColor3ub(0,0,255)
+    DrawSphere(15.0, earth)
+
+def DrawMoon():
+    glColor3ub(200,200,200)
+    DrawSphere(6.0, moon)
+
+# The sun, with the earth going round it and the moon round the earth. Only
+# the orbits' angles change, so only they are kept to set. The whole scene is
+# translated out and into view at the root, so the world matrices are the
+# modelview matrices the bodies are drawn with.
+scene = SceneNode()
+scene.Translate(0.0, 0.0, -300.0)
+sun = scene.AddChild(SceneNode(DrawSun))
+earth = sun.AddChild(SceneNode(DrawEarth))
+iEarthOrbit = earth.Rotate(fEarthRot, 0.0, 1.0, 0.0)
+earth.Translate(105.0,0.0,0.0)
+moon = earth.AddChild(SceneNode(DrawMoon))
+iMoonOrbit = moon.Rotate(fMoonRot,0.0, 1.0, 0.0)
+moon.Translate(30.0, 0.0, 0.0)
+
 class MainWindow(window.Window):
     def __init__(self, *args, **kwargs):
         window.Window.__init__(self, *args, **kwargs)
@@ -63,42 +111,8 @@ class MainWindow(window.Window):
         glMatrixMode(GL_MODELVIEW)
         glPushMatrix()
 
-        # Translate the whole scene out and into view	
-        glTranslatef(0.0, 0.0, -300.0)
-        
-        # Set material color, Red
-        # Sun
-        glDisable(GL_LIGHTING)
-        glColor3ub(255, 255, 0)
-        sphere = gluNewQuadric()
-        gluQuadricTexture(sphere, True)
-        gluSphere(sphere, 15.0, 30, 17)    
-        gluDeleteQuadric(sphere)
-        glEnable(GL_LIGHTING)
-
-        # Move the light after we draw the sun!
-        glLightfv(GL_LIGHT0,GL_POSITION,lightPos)
-
-        # Rotate coordinate system
-        glRotatef(fEarthRot, 0.0, 1.0, 0.0)
-
-        # Draw the Earth
-        glColor3ub(0,0,255)
-        glTranslatef(105.0,0.0,0.0)
-        sphere = gluNewQuadric()
-        gluQuadricTexture(sphere, True)
-        gluSphere(sphere, 15.0, 30, 17)    
-        gluDeleteQuadric(sphere)
-
-        # Rotate from Earth based coordinates and draw Moon
-        glColor3ub(200,200,200)
-        glRotatef(fMoonRot,0.0, 1.0, 0.0)
-        glTranslatef(30.0, 0.0, 0.0)
-
-        sphere = gluNewQuadric()
-        gluQuadricTexture(sphere, True)
-        gluSphere(sphere, 6.0, 30, 17)    
-        gluDeleteQuadric(sphere)
+        # The sun, earth and moon, translated out and into view
+        DrawScene(scene)
 
         # Restore the matrix state
         glPopMatrix()	# Modelview matrix
@@ -119,6 +133,7 @@ class MainWindow(window.Window):
 
         # field of view of 45 degrees, near and far planes 1.0 and 425
         gluPerspective(45.0, fAspect, 1.0, 425.0)
+        lod.SetProjection()
         glMatrixMode(GL_MODELVIEW)
         glLoadIdentity()
 
@@ -147,6 +162,9 @@ class MainWindow(window.Window):
         if(fMoonRot > 360.0):
             fMoonRot = 0.0
 
+        earth.SetRotation(iEarthOrbit, fEarthRot)
+        moon.SetRotation(iMoonOrbit, fMoonRot)
+
 # Main program entry point
 if __name__ == '__main__':
     w = MainWindow(800, 600, caption="Earth/Moon/Sun System", resizable=True)
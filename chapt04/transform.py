@@ -16,59 +16,29 @@ from pyglet.window import key
 import sys
 sys.path.append("../shared")
 
-from math import cos, sin
+import numpy
 
-from math3d import M3D_PI, M3DVector3f, M3DMatrix44f, m3dTransformVector3, m3dDegToRad, m3dRotationMatrix44
+from math3d import M3DMatrix44f, m3dTransformVector3Array, m3dDegToRad, m3dRotationMatrix44
+from gltools import gltMakeTorus
 
 xRot = 0.0
 yRot = 0.0
 
+numMajor = 40
+numMinor = 20
+(torusVertices, torusIndices) = gltMakeTorus(0.35, 0.15, numMajor, numMinor)
+objectVertices = numpy.ascontiguousarray(torusVertices[:, 5:])          # Vertices in object/eye space
+transformedVertices = numpy.empty_like(objectVertices)                  # New Transformed vertices
+
 # Draw a torus (doughnut), using the current 1D texture for light shading
 def DrawTorus(mTransform):
-    majorRadius = 0.35
-    minorRadius = 0.15
-    numMajor = 40
-    numMinor = 20
-    objectVertex = M3DVector3f()         # Vertex in object/eye space
-    transformedVertex = M3DVector3f()    # New Transformed vertex   
-    majorStep = 2.0 
-    majorStep = 2.0 * M3D_PI / float(numMajor)
-    minorStep = 2.0 * M3D_PI / float(numMinor)
-    
-    i = 0
-    while (i < numMajor):
-        a0 = i * majorStep
-        a1 = a0 + majorStep
-        x0 = cos(a0)
-        y0 = sin(a0)
-        x1 = cos(a1)
-        y1 = sin(a1)
-
-        glBegin(GL_TRIANGLE_STRIP)
-        j = 0
-        # BS some sort of rounding error keeps a strip from being drawn
-        while (j < numMinor + 1):
-            b = j * minorStep
-            c = cos(b)
-            r = minorRadius * c + majorRadius
-            z = minorRadius * sin(b)
-
-            # First point
-            objectVertex[0] = x0*r
-            objectVertex[1] = y0*r
-            objectVertex[2] = z
-            m3dTransformVector3(transformedVertex, objectVertex, mTransform)
-            glVertex3fv(transformedVertex)
+    # Transform every vertex in one go
+    m3dTransformVector3Array(transformedVertices, objectVertices, mTransform)
 
-            # Second point
-            objectVertex[0] = x1*r
-            objectVertex[1] = y1*r
-            objectVertex[2] = z
-            m3dTransformVector3(transformedVertex, objectVertex, mTransform)
-            glVertex3fv(transformedVertex)
-            j += 1
-        glEnd()
-        i += 1
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glVertexPointer(3, GL_FLOAT, 0, transformedVertices.ctypes.data)
+    glDrawElements(GL_TRIANGLE_STRIP, len(torusIndices), GL_UNSIGNED_INT, torusIndices.ctypes.data)
+    glDisableClientState(GL_VERTEX_ARRAY)
 
 
 class MainWindow(window.Window):
@@ -13,12 +13,116 @@ from pyglet.gl import *
 from pyglet import window
 from pyglet.window import key
 
+import sys
+sys.path.append("../shared")
+from immediate import Recording, glBegin, glEnd, glVertex3f, glColor3ub
+
 
 xRot = 0.0
 yRot = 0.0
 
 lightArrayType = GLfloat * 4
 
+# The jet, recorded into vertex arrays the first time it is drawn
+jet = Recording()
+
+# Draw the jet, a triangle at a time
+def DrawJet():
+    # Nose Cone ##############/
+    # Bright Green
+    glColor3ub(0, 255, 0)
+    glBegin(GL_TRIANGLES)
+    
+    glVertex3f(0.0, 0.0, 60.0)
+    glVertex3f(-15.0, 0.0, 30.0)
+    glVertex3f(15.0,0.0,30.0)
+
+    glVertex3f(15.0,0.0,30.0)
+    glVertex3f(0.0, 15.0, 30.0)
+    glVertex3f(0.0, 0.0, 60.0)
+
+    glVertex3f(0.0, 0.0, 60.0)
+    glVertex3f(0.0, 15.0, 30.0)
+    glVertex3f(-15.0,0.0,30.0)
+
+    # Body of the Plane ############
+    # light gray
+    glColor3ub(192,192,192)
+    glVertex3f(-15.0,0.0,30.0)
+    glVertex3f(0.0, 15.0, 30.0)
+    glVertex3f(0.0, 0.0, -56.0)
+
+    glVertex3f(0.0, 0.0, -56.0)
+    glVertex3f(0.0, 15.0, 30.0)
+    glVertex3f(15.0,0.0,30.0)	
+
+    glVertex3f(15.0,0.0,30.0)
+    glVertex3f(-15.0, 0.0, 30.0)
+    glVertex3f(0.0, 0.0, -56.0)
+
+    #######################
+    # Left wing
+    # Dark gray
+    glColor3ub(64,64,64)
+    glVertex3f(0.0,2.0,27.0)
+    glVertex3f(-60.0, 2.0, -8.0)
+    glVertex3f(60.0, 2.0, -8.0)
+
+    glVertex3f(60.0, 2.0, -8.0)
+    glVertex3f(0.0, 7.0, -8.0)
+    glVertex3f(0.0,2.0,27.0)
+
+    glVertex3f(60.0, 2.0, -8.0)
+    glVertex3f(-60.0, 2.0, -8.0)
+    glVertex3f(0.0,7.0,-8.0)
+
+
+    # Other wing top section
+    glVertex3f(0.0,2.0,27.0)
+    glVertex3f(0.0, 7.0, -8.0)
+    glVertex3f(-60.0, 2.0, -8.0)
+
+    # Tail section###############/
+    # Bottom of back fin
+    glColor3ub(255,255,0)
+    glVertex3f(-30.0, -0.50, -57.0)
+    glVertex3f(30.0, -0.50, -57.0)
+    glVertex3f(0.0,-0.50,-40.0)
+
+    # top of left side
+    glVertex3f(0.0,-0.0,-40.0)
+    glVertex3f(30.0, -0.0, -57.0)
+    glVertex3f(0.0, 4.0, -57.0)
+
+    # top of right side
+    glVertex3f(0.0, 4.0, -57.0)
+    glVertex3f(-30.0, -0.0, -57.0)
+    glVertex3f(0.0,-0.0,-40.0)
+
+    # back of bottom of tail
+    glVertex3f(30.0,-0.0,-57.0)
+    glVertex3f(-30.0, -0.0, -57.0)
+    glVertex3f(0.0, 4.0, -57.0)
+
+
+    # Top of Tail section left
+    glColor3ub(255,0,0)
+    glVertex3f(0.0,0.0,-40.0)
+    glVertex3f(3.0, 0.0, -57.0)
+    glVertex3f(0.0, 25.0, -65.0)
+
+    glVertex3f(0.0, 25.0, -65.0)
+    glVertex3f(-3.0, 0.0, -57.0)
+    glVertex3f(0.0,0.0,-40.0)
+
+
+    # Back of horizontal section
+    glVertex3f(3.0,0.0,-57.0)
+    glVertex3f(-3.0, 0.0, -57.0)
+    glVertex3f(0.0, 25.0, -65.0)
+    glEnd()
+
+
 class MainWindow(window.Window):
     def __init__(self, *args, **kwargs):
         window.Window.__init__(self, *args, **kwargs)
@@ -42,99 +146,8 @@ class MainWindow(window.Window):
         glRotatef(xRot, 1.0, 0.0, 0.0)
         glRotatef(yRot, 0.0, 1.0, 0.0)
 
-        # Nose Cone ##############/
-        # Bright Green
-        glColor3ub(0, 255, 0)
-        glBegin(GL_TRIANGLES)
-        
-        glVertex3f(0.0, 0.0, 60.0)
-        glVertex3f(-15.0, 0.0, 30.0)
-        glVertex3f(15.0,0.0,30.0)
-
-        glVertex3f(15.0,0.0,30.0)
-        glVertex3f(0.0, 15.0, 30.0)
-        glVertex3f(0.0, 0.0, 60.0)
-
-        glVertex3f(0.0, 0.0, 60.0)
-        glVertex3f(0.0, 15.0, 30.0)
-        glVertex3f(-15.0,0.0,30.0)
-
-        # Body of the Plane ############
-        # light gray
-        glColor3ub(192,192,192)
-        glVertex3f(-15.0,0.0,30.0)
-        glVertex3f(0.0, 15.0, 30.0)
-        glVertex3f(0.0, 0.0, -56.0)
-
-        glVertex3f(0.0, 0.0, -56.0)
-        glVertex3f(0.0, 15.0, 30.0)
-        glVertex3f(15.0,0.0,30.0)	
-
-        glVertex3f(15.0,0.0,30.0)
-        glVertex3f(-15.0, 0.0, 30.0)
-        glVertex3f(0.0, 0.0, -56.0)
-
-        #######################
-        # Left wing
-        # Dark gray
-        glColor3ub(64,64,64)
-        glVertex3f(0.0,2.0,27.0)
-        glVertex3f(-60.0, 2.0, -8.0)
-        glVertex3f(60.0, 2.0, -8.0)
-
-        glVertex3f(60.0, 2.0, -8.0)
-        glVertex3f(0.0, 7.0, -8.0)
-        glVertex3f(0.0,2.0,27.0)
-
-        glVertex3f(60.0, 2.0, -8.0)
-        glVertex3f(-60.0, 2.0, -8.0)
-        glVertex3f(0.0,7.0,-8.0)
-
-
-        # Other wing top section
-        glVertex3f(0.0,2.0,27.0)
-        glVertex3f(0.0, 7.0, -8.0)
-        glVertex3f(-60.0, 2.0, -8.0)
-
-        # Tail section###############/
-        # Bottom of back fin
-        glColor3ub(255,255,0)
-        glVertex3f(-30.0, -0.50, -57.0)
-        glVertex3f(30.0, -0.50, -57.0)
-        glVertex3f(0.0,-0.50,-40.0)
-
-        # top of left side
-        glVertex3f(0.0,-0.0,-40.0)
-        glVertex3f(30.0, -0.0, -57.0)
-        glVertex3f(0.0, 4.0, -57.0)
-
-        # top of right side
-        glVertex3f(0.0, 4.0, -57.0)
-        glVertex3f(-30.0, -0.0, -57.0)
-        glVertex3f(0.0,-0.0,-40.0)
-
-        # back of bottom of tail
-        glVertex3f(30.0,-0.0,-57.0)
-        glVertex3f(-30.0, -0.0, -57.0)
-        glVertex3f(0.0, 4.0, -57.0)
-
-
-        # Top of Tail section left
-        glColor3ub(255,0,0)
-        glVertex3f(0.0,0.0,-40.0)
-        glVertex3f(3.0, 0.0, -57.0)
-        glVertex3f(0.0, 25.0, -65.0)
-
-        glVertex3f(0.0, 25.0, -65.0)
-        glVertex3f(-3.0, 0.0, -57.0)
-        glVertex3f(0.0,0.0,-40.0)
-
-
-        # Back of horizontal section
-        glVertex3f(3.0,0.0,-57.0)
-        glVertex3f(-3.0, 0.0, -57.0)
-        glVertex3f(0.0, 25.0, -65.0)
-        glEnd()
+        # Recorded the first time through, and drawn from vertex arrays after
+        jet.Draw(DrawJet)
 
         glPopMatrix()
         
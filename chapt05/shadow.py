@@ -30,6 +30,35 @@ specref = (GLfloat * 4)(1.0, 1.0, 1.0, 1.0)
 
 shadowMat = M3DMatrix44f()
 
+# The panels of the jet that need a normal calculated, three points each,
+# wound counter clockwise. Built once rather than on every draw.
+jetPanels = [
+    (M3DVector3f(15.0, 0.0, 30.0), M3DVector3f(0.0, 15.0, 30.0), M3DVector3f(0.0, 0.0, 60.0)),
+    (M3DVector3f(0.0, 0.0, 60.0), M3DVector3f(0.0, 15.0, 30.0), M3DVector3f(-15.0, 0.0, 30.0)),
+    (M3DVector3f(-15.0, 0.0, 30.0), M3DVector3f(0.0, 15.0, 30.0), M3DVector3f(0.0, 0.0, -56.0)),
+    (M3DVector3f(0.0, 0.0, -56.0), M3DVector3f(0.0, 15.0, 30.0), M3DVector3f(15.0, 0.0, 30.0)),
+    (M3DVector3f(0.0, 2.0, 27.0), M3DVector3f(-60.0, 2.0, -8.0), M3DVector3f(60, 2.0, -8.0)),
+    (M3DVector3f(60.0, 2.0, -8.0), M3DVector3f(0.0, 7.0, -8.0), M3DVector3f(0.0, 2.0, 27.0)),
+    (M3DVector3f(60.0, 2.0, -8.0), M3DVector3f(-60.0, 2.0, -8.0), M3DVector3f(0.0, 7.0, -8.0)),
+    (M3DVector3f(0.0, 2.0, 27.0), M3DVector3f(0.0, 7.0, -8.0), M3DVector3f(-60.0, 2.0, -8.0)),
+    (M3DVector3f(0.0, -0.5, -40.0), M3DVector3f(30.0, -0.5, -57.0), M3DVector3f(0.0, 4.0, -57.0)),
+    (M3DVector3f(0.0, 4.0, -57.0), M3DVector3f(-30.0, -0.5, -57.0), M3DVector3f(0.0, -0.5, -40.0)),
+    (M3DVector3f(30.0, -0.5, -57.0), M3DVector3f(-30.0, -0.5, -57.0), M3DVector3f(0.0, 4.0, -57.0)),
+    (M3DVector3f(0.0, 0.5, -40.0), M3DVector3f(3.0, 0.5, -57.0), M3DVector3f(0.0, 25.0, -65.0)),
+    (M3DVector3f(0.0, 25.0, -65.0), M3DVector3f(-3.0, 0.5, -57.0), M3DVector3f(0.0, 0.5, -40.0)),
+    (M3DVector3f(3.0, 0.5, -57.0), M3DVector3f(-3.0, 0.5, -57.0), M3DVector3f(0.0, 25.0, -65.0)),
+    ]
+
+vNormal = M3DVector3f()   # Scratch space for the panel normals
+
+# Draw one panel of the jet, working out its normal first
+def DrawPanel(vPoints):
+    m3dFindNormal(vPoints[0], vPoints[1], vPoints[2], vNormal)
+    glNormal3fv(vNormal)
+    glVertex3fv(vPoints[0])
+    glVertex3fv(vPoints[1])
+    glVertex3fv(vPoints[2])
+
 def DrawJet(nShadow):
     
     # Set material color, note we only have to set to black
@@ -51,49 +80,14 @@ def DrawJet(nShadow):
             
 
     # Verticies for this panel
-    vPoints = [ M3DVector3f(15.0, 0.0, 30.0),
-                M3DVector3f(0.0, 15.0, 30.0),
-                M3DVector3f(0.0, 0.0, 60.0)]
-                
-    # Calculate the normal for the plane
-    vNormal = m3dFindNormal(vPoints[0], vPoints[1], vPoints[2])
-    glNormal3fv(vNormal)
-    glVertex3fv(vPoints[0])
-    glVertex3fv(vPoints[1])
-    glVertex3fv(vPoints[2])
+    DrawPanel(jetPanels[0])
     
-    vPoints = [ M3DVector3f(0.0, 0.0, 60.0),
-                M3DVector3f(0.0, 15.0, 30.0),
-                M3DVector3f(-15.0, 0.0, 30.0)]
-                
-    vNormal = m3dFindNormal(vPoints[0], vPoints[1], vPoints[2])
-    glNormal3fv(vNormal)
-    glVertex3fv(vPoints[0])
-    glVertex3fv(vPoints[1])
-    glVertex3fv(vPoints[2])
-    
-
+    DrawPanel(jetPanels[1])
 
     # Body of the Plane ############
-    vPoints = [ M3DVector3f(-15.0, 0.0, 30.0),
-                M3DVector3f(0.0, 15.0, 30.0),
-                M3DVector3f(0.0, 0.0, -56.0)]
-                
-    vNormal = m3dFindNormal(vPoints[0], vPoints[1], vPoints[2])
-    glNormal3fv(vNormal)
-    glVertex3fv(vPoints[0])
-    glVertex3fv(vPoints[1])
-    glVertex3fv(vPoints[2])
+    DrawPanel(jetPanels[2])
         
-    vPoints = [ M3DVector3f(0.0, 0.0, -56.0),
-                M3DVector3f(0.0, 15.0, 30.0),
-                M3DVector3f(15.0, 0.0, 30.0)]
-                
-    vNormal = m3dFindNormal(vPoints[0], vPoints[1], vPoints[2])
-    glNormal3fv(vNormal)
-    glVertex3fv(vPoints[0])
-    glVertex3fv(vPoints[1])
-    glVertex3fv(vPoints[2])
+    DrawPanel(jetPanels[3])
     
     glNormal3f(0.0, -1.0, 0.0)
     glVertex3f(15.0,0.0,30.0)
@@ -104,47 +98,14 @@ def DrawJet(nShadow):
     # Left wing
     # Large triangle for bottom of wing
     
-    vPoints = [ M3DVector3f(0.0, 2.0, 27.0),
-                M3DVector3f(-60.0, 2.0, -8.0),
-                M3DVector3f(60, 2.0, -8.0)]
-                
-    vNormal = m3dFindNormal(vPoints[0], vPoints[1], vPoints[2])
-    glNormal3fv(vNormal)
-    glVertex3fv(vPoints[0])
-    glVertex3fv(vPoints[1])
-    glVertex3fv(vPoints[2])
+    DrawPanel(jetPanels[4])
     
-    vPoints = [ M3DVector3f(60.0, 2.0, -8.0),
-                M3DVector3f(0.0, 7.0, -8.0),
-                M3DVector3f(0.0, 2.0, 27.0)]
-                
-    vNormal = m3dFindNormal(vPoints[0], vPoints[1], vPoints[2])
-    glNormal3fv(vNormal)
-    glVertex3fv(vPoints[0])
-    glVertex3fv(vPoints[1])
-    glVertex3fv(vPoints[2])
+    DrawPanel(jetPanels[5])
     
-    vPoints = [ M3DVector3f(60.0, 2.0, -8.0),
-                M3DVector3f(-60.0, 2.0, -8.0),
-                M3DVector3f(0.0, 7.0, -8.0)]
-
-    vNormal = m3dFindNormal(vPoints[0], vPoints[1], vPoints[2])
-    glNormal3fv(vNormal)
-    glVertex3fv(vPoints[0])
-    glVertex3fv(vPoints[1])
-    glVertex3fv(vPoints[2])
+    DrawPanel(jetPanels[6])
     
-    vPoints = [ M3DVector3f(0.0, 2.0, 27.0),
-                M3DVector3f(0.0, 7.0, -8.0),
-                M3DVector3f(-60.0, 2.0, -8.0)]
-    vNormal = m3dFindNormal(vPoints[0], vPoints[1], vPoints[2])
-    glNormal3fv(vNormal)
-    glVertex3fv(vPoints[0])
-    glVertex3fv(vPoints[1])
-    glVertex3fv(vPoints[2])
-    
-            
-                    
+    DrawPanel(jetPanels[7])
+
     # Tail section###############
     # Bottom of back fin
     glNormal3f(0.0, -1.0, 0.0)
@@ -152,66 +113,17 @@ def DrawJet(nShadow):
     glVertex3f(30.0, -0.50, -57.0)
     glVertex3f(0.0,-0.50,-40.0)
 
-    vPoints = [ M3DVector3f(0.0, -0.5, -40.0),
-                M3DVector3f(30.0, -0.5, -57.0),
-                M3DVector3f(0.0, 4.0, -57.0)]
-
-    vNormal = m3dFindNormal(vPoints[0], vPoints[1], vPoints[2])
-    glNormal3fv(vNormal)
-    glVertex3fv(vPoints[0])
-    glVertex3fv(vPoints[1])
-    glVertex3fv(vPoints[2])
+    DrawPanel(jetPanels[8])
     
-    vPoints = [ M3DVector3f(0.0, 4.0, -57.0),
-                M3DVector3f(-30.0, -0.5, -57.0),
-                M3DVector3f(0.0, -0.5, -40.0)]
-    vNormal = m3dFindNormal(vPoints[0], vPoints[1], vPoints[2])
-    glNormal3fv(vNormal)
-    glVertex3fv(vPoints[0])
-    glVertex3fv(vPoints[1])
-    glVertex3fv(vPoints[2])
-    
-    vPoints = [ M3DVector3f(30.0, -0.5, -57.0),
-                M3DVector3f(-30.0, -0.5, -57.0),
-                M3DVector3f(0.0, 4.0, -57.0)]
-    vNormal = m3dFindNormal(vPoints[0], vPoints[1], vPoints[2])
-    glNormal3fv(vNormal)
-    glVertex3fv(vPoints[0])
-    glVertex3fv(vPoints[1])
-    glVertex3fv(vPoints[2])
+    DrawPanel(jetPanels[9])
     
+    DrawPanel(jetPanels[10])
 
-    vPoints = [ M3DVector3f(0.0, 0.5, -40.0),
-                M3DVector3f(3.0, 0.5, -57.0),
-                M3DVector3f(0.0, 25.0, -65.0)]
+    DrawPanel(jetPanels[11])
 
-    vNormal = m3dFindNormal(vPoints[0], vPoints[1], vPoints[2])
-    glNormal3fv(vNormal)
-    glVertex3fv(vPoints[0])
-    glVertex3fv(vPoints[1])
-    glVertex3fv(vPoints[2])
-    
-                 
-    vPoints = [ M3DVector3f(0.0, 25.0, -65.0),
-                M3DVector3f(-3.0, 0.5, -57.0),
-                M3DVector3f(0.0, 0.5, -40.0)]
-
-    vNormal = m3dFindNormal(vPoints[0], vPoints[1], vPoints[2])
-    glNormal3fv(vNormal)
-    glVertex3fv(vPoints[0])
-    glVertex3fv(vPoints[1])
-    glVertex3fv(vPoints[2])
+    DrawPanel(jetPanels[12])
     
-    vPoints = [ M3DVector3f(3.0, 0.5, -57.0),
-                M3DVector3f(-3.0, 0.5, -57.0),
-                M3DVector3f(0.0, 25.0, -65.0)]
-
-    vNormal = m3dFindNormal(vPoints[0], vPoints[1], vPoints[2])
-    glNormal3fv(vNormal)
-    glVertex3fv(vPoints[0])
-    glVertex3fv(vPoints[1])
-    glVertex3fv(vPoints[2])
-
+    DrawPanel(jetPanels[13])
 
     glEnd()
 
@@ -18,15 +18,25 @@ from math import cos, sin
 import sys
 sys.path.append("../shared")
 
-from math3d import M3D_PI, M3DVector3f, M3DMatrix44f, m3dTransformVector3, m3dDegToRad, m3dRotationMatrix44, m3dGetPlaneEquation, m3dMakePlanarShadowMatrix
+import numpy
+
+from math3d import M3D_PI, M3DVector3f, M3DMatrix44f, m3dTransformVector3, m3dDegToRad, m3dRotationMatrix44, m3dGetPlaneEquation, m3dMakePlanarShadowMatrix, m3dExtractFrustumPlanes, m3dSpheresInFrustum
 from glframe import GLFrame
-from fakeglut import glutSolidSphere
+from fakeglut import glutSolidSphere, glutSolidIcosphere
 from gltools import gltDrawTorus
+from immediate import Recording, glBegin, glEnd, glVertex3f, glNormal3f
 
 NUM_SPHERES = 50
 spheres = [GLFrame() for i in range(NUM_SPHERES)]
 frameCamera = GLFrame()
 
+# For culling the spheres that are out of view
+SPHERE_RADIUS = 0.3
+sphereCenters = numpy.zeros((NUM_SPHERES, 3), numpy.float32)
+frustumPlanes = numpy.zeros((6, 4), numpy.float32)
+mProjection = M3DMatrix44f()
+mModelView = M3DMatrix44f()
+
 # Light and material data
 
 # pyglet reverses y direction
@@ -41,6 +51,9 @@ yRot = 0.0 # Rotation angle for animation
 
 mShadowMatrix = M3DMatrix44f()
 
+# The ground, recorded into vertex arrays the first time it is drawn
+ground = Recording()
+
 # Draw a gridded ground
 def DrawGround():
     fExtent = 20.0
@@ -65,6 +78,13 @@ def DrawGround():
         glEnd()
         iStrip += fStep
 
+# Indices of the spheres that are inside the view frustum, using the
+# projection saved in on_resize and the modelview as it is now
+def VisibleSpheres():
+    glGetFloatv(GL_MODELVIEW_MATRIX, mModelView)
+    m3dExtractFrustumPlanes(frustumPlanes, mProjection, mModelView)
+    return numpy.flatnonzero(m3dSpheresInFrustum(frustumPlanes, sphereCenters, SPHERE_RADIUS))
+
 # Draw random inhabitants and the rotating torus/sphere duo
 def DrawInhabitants(nShadow):
     global yRot
@@ -78,11 +98,19 @@ def DrawInhabitants(nShadow):
     if nShadow == 0:
         glColor3f(0.0, 1.0, 0.0)
 
-    for sphere in spheres:
+    # Skip the spheres the camera can't see. Shadows are squashed onto the
+    # ground from wherever their sphere is, so in the shadow pass they are
+    # all drawn.
+    if nShadow == 0:
+        visible = VisibleSpheres()
+    else:
+        visible = range(NUM_SPHERES)
+    for i in visible:
+        sphere = spheres[i]
         glPushMatrix()
         
         sphere.ApplyActorTransform()
-        glutSolidSphere(0.3, 17, 9)
+        glutSolidIcosphere(0.3, 2)
         
         glPopMatrix()
         
@@ -150,9 +178,10 @@ class MainWindow(window.Window):
         glMateriali(GL_FRONT, GL_SHININESS, 128)
       
         # Randomly place sphere inhabitants
-        for sphere in spheres:
+        for (i, sphere) in enumerate(spheres):
             # Pick a random location between -20 and 20 at .1 increments
             sphere.setOrigin(float(randint(-200, 200)) * 0.1, 0.0, float(randint(-200, 200)) * 0.1)
+            sphereCenters[i] = sphere.vOrigin
 
     def update(self, blah):
         global yRot
@@ -172,7 +201,7 @@ class MainWindow(window.Window):
         
         # Draw the ground
         glColor3f(0.60, 0.40, 0.10)
-        DrawGround()
+        ground.Draw(DrawGround)
         
         # Draw shadows first
         glDisable(GL_DEPTH_TEST)
@@ -221,6 +250,7 @@ class MainWindow(window.Window):
 
         # Set the clipping volume
         gluPerspective(35.0, fAspect, 1.0, 50.0)
+        glGetFloatv(GL_PROJECTION_MATRIX, mProjection)
 
         # Reset Model view matrix stack
         glMatrixMode(GL_MODELVIEW)
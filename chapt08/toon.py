@@ -9,13 +9,15 @@
 
 import pyglet
 from pyglet.gl import *
-from math import sin, cos
 from pyglet import window
 
 import sys
 sys.path.append("../shared")
 
-from math3d import M3DVector3f, M3DMatrix44f, M3D_PI, m3dInvertMatrix44, m3dNormalizeVector, m3dTransformVector3, m3dDotProduct
+import numpy
+
+from math3d import M3DVector3f, M3DMatrix44f, m3dInvertRigidMatrix44, m3dNormalizeVector, m3dTransformVector3, m3dAsArray
+from gltools import gltMakeTorus
 
 yRot = 0.0
 
@@ -27,61 +29,35 @@ def toonDrawTorus(majorRadius, minorRadius, numMajor, numMinor, lightDir):
     mModelViewMatrix = M3DMatrix44f()
     mInvertedLight = M3DMatrix44f()
     vNewLight = M3DVector3f()
-    vNormal = M3DVector3f()
-    majorStep = 2.0*M3D_PI / numMajor
-    minorStep = 2.0*M3D_PI / numMinor
     
     # Get the modelview matrix
     glGetFloatv(GL_MODELVIEW_MATRIX, mModelViewMatrix)
     
     # Instead of transforming every normal and then dotting it with
     # the light vector, we will transform the light into object 
-    # space by multiplying it by the inverse of the modelview matrix
-    m3dInvertMatrix44(mInvertedLight, mModelViewMatrix)
+    # space by multiplying it by the inverse of the modelview matrix.
+    # The modelview is only a rotation and a translation, so the cheap
+    # rigid body inverse will do.
+    m3dInvertRigidMatrix44(mInvertedLight, mModelViewMatrix)
     m3dTransformVector3(vNewLight, vLightDir, mInvertedLight)
     vNewLight[0] -= mInvertedLight[12]
     vNewLight[1] -= mInvertedLight[13]
     vNewLight[2] -= mInvertedLight[14]
     m3dNormalizeVector(vNewLight)
     
-    # Draw torus as a series of triangle strips
-    for i in range(0, numMajor):
-        a0 = i * majorStep
-        a1 = a0 + majorStep
-        x0 = cos(a0)
-        y0 = sin(a0)
-        x1 = cos(a1)
-        y1 = sin(a1)
-
-        glBegin(GL_TRIANGLE_STRIP)
-        for j in range(0, numMinor + 1):
-
-            b = j * minorStep
-            c =  cos(b)
-            r = minorRadius * c + majorRadius
-            z = minorRadius * sin(b)
-
-            # First point
-            vNormal[0] = x0*c
-            vNormal[1] = y0*c
-            vNormal[2] = z/minorRadius
-            m3dNormalizeVector(vNormal)
-            
-            # Texture coordinate is set by intensity of light
-            glTexCoord1f(m3dDotProduct(vNewLight, vNormal))
-            glVertex3f(x0*r, y0*r, z)
-
-            # Second point
-            vNormal[0] = x1*c
-            vNormal[1] = y1*c
-            vNormal[2] = z/minorRadius
-            m3dNormalizeVector(vNormal)
-            
-            # Texture coordinate is set by intensity of light
-            glTexCoord1f(m3dDotProduct(vNewLight, vNormal))
-            glVertex3f(x1*r, y1*r, z)
-            
-        glEnd()
+    # The torus mesh is only built once. All that changes is the texture
+    # coordinate, set by the intensity of light on each vertex's normal.
+    (vertices, indices) = gltMakeTorus(majorRadius, minorRadius, numMajor, numMinor)
+    texCoords = numpy.dot(vertices[:, 2:5], m3dAsArray(vNewLight))
+
+    # Draw torus as one triangle strip
+    glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+    glVertexPointer(3, GL_FLOAT, vertices.strides[0], vertices[:, 5:].ctypes.data)
+    glTexCoordPointer(1, GL_FLOAT, 0, texCoords.ctypes.data)
+    glDrawElements(GL_TRIANGLE_STRIP, len(indices), GL_UNSIGNED_INT, indices.ctypes.data)
+    glPopClientAttrib()
 
 class MainWindow(window.Window):
     def __init__(self, *args, **kwargs):
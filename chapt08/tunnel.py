@@ -13,6 +13,14 @@ from pyglet.gl import *
 from pyglet import window
 from pyglet.window import key
 
+import sys
+sys.path.append("../shared")
+
+import numpy
+
+from staticscene import StaticScene, gltViewFrustum
+from renderqueue import RenderQueue
+
 zPos = -60.0
 
 # Texture Objects
@@ -25,6 +33,57 @@ textures = (GLuint * TEXTURE_COUNT)()
 
 szTextureFiles = ['brick.jpg', 'floor.jpg', 'ceiling.jpg']
 
+# The floor, ceiling and walls of each segment of the tunnel, drawn only
+# when in view
+tunnel = StaticScene()
+
+# The segments in view are drawn a texture at a time, rather than binding
+# each texture again for every segment
+queue = RenderQueue()
+
+# A quad as a mesh, from its four (s, t, x, y, z) corners in order
+def MakeQuad(corners, vNormal):
+    vertices = numpy.empty((4, 8), numpy.float32)
+    vertices[:, 0:2] = [corner[0:2] for corner in corners]
+    vertices[:, 2:5] = vNormal
+    vertices[:, 5:8] = [corner[2:5] for corner in corners]
+    return (vertices, numpy.arange(4, dtype=numpy.uint32))
+
+# Put the segments of the tunnel in the scene, ten units long each from z
+# down to z - 10, as the original drew them a quad at a time
+def MakeTunnel():
+    z = 60.0
+    while z >= -1.0:
+        # Floor
+        tunnel.Add(MakeQuad(((0.0, 0.0, -10.0, -10.0, z),
+                             (1.0, 0.0, 10.0, -10.0, z),
+                             (1.0, 1.0, 10.0, -10.0, z - 10.0),
+                             (0.0, 1.0, -10.0, -10.0, z - 10.0)), (0.0, 1.0, 0.0)),
+                   GL_QUADS, textures[TEXTURE_FLOOR])
+
+        # Ceiling
+        tunnel.Add(MakeQuad(((0.0, 1.0, -10.0, 10.0, z - 10.0),
+                             (1.0, 1.0, 10.0, 10.0, z - 10.0),
+                             (1.0, 0.0, 10.0, 10.0, z),
+                             (0.0, 0.0, -10.0, 10.0, z)), (0.0, -1.0, 0.0)),
+                   GL_QUADS, textures[TEXTURE_CEILING])
+
+        # Left Wall
+        tunnel.Add(MakeQuad(((0.0, 0.0, -10.0, -10.0, z),
+                             (1.0, 0.0, -10.0, -10.0, z - 10.0),
+                             (1.0, 1.0, -10.0, 10.0, z - 10.0),
+                             (0.0, 1.0, -10.0, 10.0, z)), (1.0, 0.0, 0.0)),
+                   GL_QUADS, textures[TEXTURE_BRICK])
+
+        # Right Wall
+        tunnel.Add(MakeQuad(((0.0, 1.0, 10.0, 10.0, z),
+                             (1.0, 1.0, 10.0, 10.0, z - 10.0),
+                             (1.0, 0.0, 10.0, -10.0, z - 10.0),
+                             (0.0, 0.0, 10.0, -10.0, z)), (-1.0, 0.0, 0.0)),
+                   GL_QUADS, textures[TEXTURE_BRICK])
+        z -= 10.0
+    tunnel.Build()
+
 class MainWindow(window.Window):
     def __init__(self, *args, **kwargs):
         window.Window.__init__(self, *args, **kwargs)
@@ -51,7 +110,9 @@ class MainWindow(window.Window):
             glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
             glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
             glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
-            
+
+        MakeTunnel()
+        print("Press S for the texture binds saved by sorting")
         
     # Shutdown the rendering context. Just deletes the
     # texture objects
@@ -69,81 +130,10 @@ class MainWindow(window.Window):
         # Move object back and do in place rotation
         glTranslatef(0.0, 0.0, zPos)
 
-        # Floor
-        z = 60.0 
-        while z >= -1.0:
-            glBindTexture(GL_TEXTURE_2D, textures[TEXTURE_FLOOR])
-            glBegin(GL_QUADS)
-            
-            glTexCoord2f(0.0, 0.0)
-            glVertex3f(-10.0, -10.0, z)
-
-            glTexCoord2f(1.0, 0.0)
-            glVertex3f(10.0, -10.0, z)
-
-            glTexCoord2f(1.0, 1.0)
-            glVertex3f(10.0, -10.0, z - 10.0)
-
-            glTexCoord2f(0.0, 1.0)
-            glVertex3f(-10.0, -10.0, z - 10.0)
-                
-            glEnd()
-
-            # Ceiling
-            glBindTexture(GL_TEXTURE_2D, textures[TEXTURE_CEILING])
-            glBegin(GL_QUADS)
-            
-            glTexCoord2f(0.0, 1.0)
-            glVertex3f(-10.0, 10.0, z - 10.0)
-
-            glTexCoord2f(1.0, 1.0)
-            glVertex3f(10.0, 10.0, z - 10.0)
-
-            glTexCoord2f(1.0, 0.0)
-            glVertex3f(10.0, 10.0, z)
-
-            glTexCoord2f(0.0, 0.0)
-            glVertex3f(-10.0, 10.0, z)
-                
-            glEnd()
-
-            
-            # Left Wall
-            glBindTexture(GL_TEXTURE_2D, textures[TEXTURE_BRICK])
-            glBegin(GL_QUADS)
-            
-            glTexCoord2f(0.0, 0.0)
-            glVertex3f(-10.0, -10.0, z)
-
-            glTexCoord2f(1.0, 0.0)
-            glVertex3f(-10.0, -10.0, z - 10.0)
-
-            glTexCoord2f(1.0, 1.0)
-            glVertex3f(-10.0, 10.0, z - 10.0)
-
-            glTexCoord2f(0.0, 1.0)
-            glVertex3f(-10.0, 10.0, z)
-                
-            glEnd()
-
-
-            # Right Wall
-            glBegin(GL_QUADS)
-            
-            glTexCoord2f(0.0, 1.0)
-            glVertex3f(10.0, 10.0, z)
-
-            glTexCoord2f(1.0, 1.0)
-            glVertex3f(10.0, 10.0, z - 10.0)
-
-            glTexCoord2f(1.0, 0.0)
-            glVertex3f(10.0, -10.0, z - 10.0)
-
-            glTexCoord2f(0.0, 0.0)
-            glVertex3f(10.0, -10.0, z)
-                
-            glEnd()
-            z -= 10.0
+        # Draw the segments in view, nearest first for each texture
+        (planes, vEye) = gltViewFrustum()
+        tunnel.Draw(planes, vEye, bNormals = False, queue = queue)
+        queue.Flush()
         glPopMatrix()
         
     def on_key_press(self, symbol, modifier):
@@ -152,6 +142,8 @@ class MainWindow(window.Window):
             zPos += 1.0
         elif symbol == key.DOWN:
             zPos -= 1.0
+        elif symbol == key.S:
+            print(queue.Report())
 
         elif symbol in (key._1, key._2, key._3, key._4, key._5, key._6):
             for i in range(TEXTURE_COUNT):
@@ -19,13 +19,17 @@ from math import cos, sin
 import sys
 sys.path.append("../shared")
 
-from math3d import M3DMatrix44f, m3dInvertMatrix44
+from math3d import M3DMatrix44f, m3dInvertRigidMatrix44
 from glframe import GLFrame
 from fakeglut import glutSolidSphere
 from gltools import gltDrawSphere
+from immediate import Recording, glBegin, glEnd, glVertex3f, glTexCoord3f
 
 frameCamera = GLFrame()
 
+# The skybox, recorded into vertex arrays the first time it is drawn
+skyBox = Recording()
+
 # Six sides of a cube map
 szCubeFaces = ["pos_x.jpg", "neg_x.jpg", "pos_y.jpg", "neg_y.jpg", "pos_z.jpg", "neg_z.jpg"]
 cube = (GLenum * 6)(GL_TEXTURE_CUBE_MAP_POSITIVE_X,
@@ -178,7 +182,7 @@ class MainWindow(window.Window):
         glDisable(GL_TEXTURE_GEN_S)
         glDisable(GL_TEXTURE_GEN_T)
         glDisable(GL_TEXTURE_GEN_R)        
-        DrawSkyBox()
+        skyBox.Draw(DrawSkyBox)
 
         # Use texgen to apply cube map
         glEnable(GL_TEXTURE_GEN_S)
@@ -197,7 +201,7 @@ class MainWindow(window.Window):
         invert = M3DMatrix44f()
         
         m = frameCamera.GetCameraOrientation()
-        m3dInvertMatrix44(invert, m)
+        m3dInvertRigidMatrix44(invert, m)
         glMultMatrixf(invert)
         
         gltDrawSphere(0.75, 41, 41)
@@ -19,7 +19,7 @@ from math import cos, sin
 import sys
 sys.path.append("../shared")
 
-from math3d import M3DMatrix44f, m3dInvertMatrix44
+from math3d import M3DMatrix44f, m3dInvertRigidMatrix44
 from glframe import GLFrame
 from fakeglut import glutSolidSphere
 from gltools import gltDrawSphere
@@ -242,7 +242,7 @@ class MainWindow(window.Window):
         invert = M3DMatrix44f()
         
         m = frameCamera.GetCameraOrientation()
-        m3dInvertMatrix44(invert, m)
+        m3dInvertRigidMatrix44(invert, m)
         glMultMatrixf(invert)
 
         glColor3f(1.0, 1.0, 1.0)
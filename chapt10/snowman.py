@@ -15,6 +15,7 @@ from random import randint
 
 import sys
 sys.path.append("../shared")
+from fakeglu import gluNewQuadric, gluQuadricNormals, gluSphere, gluCylinder, gluDisk
 
 # Rotation amounts
 xRot = 0.0
@@ -12,21 +12,37 @@ import pyglet
 from pyglet.gl import *
 from pyglet import window
 from pyglet.window import key
-from random import randint
 from math import cos, sin
+from timeit import default_timer as clock
 
 import sys
 sys.path.append("../shared")
 
-from math3d import M3D_PI, M3DVector3f, M3DMatrix44f, m3dTransformVector3, m3dDegToRad, m3dRotationMatrix44, m3dGetPlaneEquation, m3dMakePlanarShadowMatrix
-from glframe import GLFrame
-from gltools import gltDrawTorus
-from fakeglut import glutSolidSphere
+import numpy
+
+from math3d import M3D_PI, M3DVector3f, M3DMatrix44f, m3dTransformVector3, m3dDegToRad, m3dRotationMatrix44, m3dGetPlaneEquation, m3dMakePlanarShadowMatrix, m3dExtractFrustumPlanes
+from glframe import GLFrame, FrameArray
+from gltools import gltMakeTorus, gltMakeSphere
+from meshcache import gltGridStrips, gltDrawMesh, MeshBuffer
+from instancing import InstanceBatch
+from lod import LevelOfDetail
+from spatialgrid import SpatialGrid
+from renderqueue import RenderQueue
 
 NUM_SPHERES = 50
-spheres = [GLFrame() for i in range(NUM_SPHERES)]
+spheres = FrameArray(NUM_SPHERES)
+sphereGrid = None         # Where the spheres are, for finding the ones in view
 frameCamera = GLFrame()
 
+# Draws the shapes more coarsely the further they are from the camera
+lod = LevelOfDetail(frameCamera)
+
+# For culling the spheres that are out of view
+SPHERE_RADIUS = 0.1
+frustumPlanes = numpy.zeros((6, 4), numpy.float32)
+mProjection = M3DMatrix44f()
+mModelView = M3DMatrix44f()
+
 # Light and material data
 
 
@@ -41,6 +57,11 @@ yRot = 0.0 # Rotation angle for animation
 
 mShadowMatrix = M3DMatrix44f()
 
+# The inhabitants are queued and drawn sorted by texture and material. Only
+# the torus is specular.
+queue = RenderQueue()
+torusMaterial = ((GL_SPECULAR, tuple(fBrightLight)),)
+
 GROUND_TEXTURE = 0
 TORUS_TEXTURE  = 1
 SPHERE_TEXTURE = 2
@@ -52,8 +73,32 @@ szTextureFiles = ["grass.jpg", "wood.jpg", "orb.jpg"]
 
 (sphereList, groundList, torusList) = (GLuint(), GLuint(), GLuint())
 
+# The same shapes in vertex buffer objects, if there are any, and all the
+# inhabitants merged into one
+(sphereBuffer, groundBuffer, torusBuffer) = (None, None, None)
+sphereBatch = None
+groundMesh = None
+
+# The sphere and torus every method draws. In immediate mode their vertices
+# are sent one at a time, in the order of the strip.
+sphereMesh = gltMakeSphere(SPHERE_RADIUS, 40, 20)
+torusMesh = gltMakeTorus(0.35, 0.15, 61, 37)
+sphereStrip = sphereMesh[0][sphereMesh[1]].tolist()
+torusStrip = torusMesh[0][torusMesh[1]].tolist()
+
+# How the scene is drawn, switched with the M key. All but the last draw the
+# same sphere and torus; the last draws them more coarsely when they are
+# small on screen, with the finest level the same as the others.
+szMethods = ["immediate mode", "display lists", "vertex buffer objects", "instanced vertex buffer", "vertex arrays + LOD"]
 iMethod = 1
 
+# Total time spent drawing frames, and number of frames, with each method.
+# Only kept while measuring, switched with the T key, as timing a frame means
+# waiting for GL to finish it.
+bMeasure = False
+frameTimes = [0.0] * len(szMethods)
+frameCounts = [0] * len(szMethods)
+
 # Draw a gridded ground
 def DrawGround():
     fExtent = 20.0
@@ -90,6 +135,45 @@ def DrawGround():
         s += texStep
         iStrip += fStep
 
+# The ground DrawGround draws, as a mesh: a row of vertices for each x, and
+# the strips of DrawGround between them
+def MakeGround():
+    fExtent = 20.0
+    fStep = 1.0
+    texStep = 1.0 / (fExtent * 0.075)
+    nSteps = int(2.0 * fExtent / fStep) + 1
+    
+    ground = numpy.empty((nSteps + 1, nSteps, 8), numpy.float32)
+    ground[:, :, 0] = (texStep * numpy.arange(nSteps + 1))[:, numpy.newaxis]
+    ground[:, :, 1] = texStep * numpy.arange(nSteps)
+    ground[:, :, 2:5] = (0.0, 1.0, 0.0) # All Point up
+    ground[:, :, 5] = (fStep * numpy.arange(nSteps + 1) - fExtent)[:, numpy.newaxis]
+    ground[:, :, 6] = -0.4
+    ground[:, :, 7] = fExtent - fStep * numpy.arange(nSteps)
+    return (ground.reshape(-1, 8), gltGridStrips(nSteps + 1, nSteps))
+
+# Draw a triangle strip a vertex at a time, as (s, t, nx, ny, nz, x, y, z)
+def DrawStrip(strip):
+    glBegin(GL_TRIANGLE_STRIP)
+    for (s, t, nx, ny, nz, x, y, z) in strip:
+        glTexCoord2f(s, t)
+        glNormal3f(nx, ny, nz)
+        glVertex3f(x, y, z)
+    glEnd()
+
+# Print the average time to draw a frame with each method used so far
+def PrintFrameTimes():
+    for i in range(len(szMethods)):
+        if frameCounts[i] > 0:
+            print("%-24s %8.3f ms/frame over %d frames" % (szMethods[i], 1000.0 * frameTimes[i] / frameCounts[i], frameCounts[i]))
+
+# Indices of the spheres that are inside the view frustum, using the
+# projection saved in on_resize and the modelview as it is now
+def VisibleSpheres():
+    glGetFloatv(GL_MODELVIEW_MATRIX, mModelView)
+    m3dExtractFrustumPlanes(frustumPlanes, mProjection, mModelView)
+    return sphereGrid.QueryFrustum(frustumPlanes, SPHERE_RADIUS)
+
 # Draw random inhabitants and the rotating torus/sphere duo
 def DrawInhabitants(nShadow):
     global yRot
@@ -99,16 +183,37 @@ def DrawInhabitants(nShadow):
     else:
         glColor4f(0.0, 0.0, 0.0, 0.6) # Shadow color
 
+    # Shadows are untextured and all the same
+    if nShadow == 0:
+        sphereTexture = textureObjects[SPHERE_TEXTURE]
+        torusTexture = textureObjects[TORUS_TEXTURE]
+        material = torusMaterial
+    else:
+        sphereTexture = torusTexture = material = None
+
     # Draw the randomly located spheres
-    glBindTexture(GL_TEXTURE_2D, textureObjects[SPHERE_TEXTURE])
-    for sphere in spheres:
+    # Skip the spheres the camera can't see. Shadows are squashed onto the
+    # ground from wherever their sphere is, so in the shadow pass they are
+    # all drawn. Instanced, they are all drawn at once anyway.
+    if iMethod == 3:
+        visible = []
+        queue.Submit(sphereBatch.Draw, sphereTexture)
+    elif nShadow == 0:
+        visible = VisibleSpheres()
+    else:
+        visible = range(NUM_SPHERES)
+    for i in visible:
         glPushMatrix()
         
-        sphere.ApplyActorTransform()
+        spheres.ApplyActorTransform(i)
         if iMethod == 0:
-            glutSolidSphere(0.3, 21, 11)
+            queue.Submit(lambda: DrawStrip(sphereStrip), sphereTexture)
+        elif iMethod == 4:
+            queue.Submit(lambda i = i: lod.DrawSphere(SPHERE_RADIUS, 40, 20, spheres.origins[i]), sphereTexture)
+        elif iMethod == 1:
+            queue.Submit(lambda: glCallList(sphereList), sphereTexture)
         else:
-            glCallList(sphereList)
+            queue.Submit(sphereBuffer.Draw, sphereTexture)
         
         glPopMatrix()
         
@@ -120,27 +225,31 @@ def DrawInhabitants(nShadow):
     glRotatef(-yRot * 2.0, 0.0, 1.0, 0.0)
     glTranslatef(1.0, 0.0, 0.0)
     if iMethod == 0:
-        glutSolidSphere(0.1, 21, 11)
+        queue.Submit(lambda: DrawStrip(sphereStrip), sphereTexture)
+    elif iMethod == 4:
+        queue.Submit(lambda: lod.DrawSphere(SPHERE_RADIUS, 40, 20), sphereTexture)
+    elif iMethod == 1:
+        queue.Submit(lambda: glCallList(sphereList), sphereTexture)
     else:
-        glCallList(sphereList)
+        queue.Submit(sphereBuffer.Draw, sphereTexture)
     glPopMatrix()
     
-    if nShadow == 0:
-        # Torus alone will be specular
-        glMaterialfv(GL_FRONT, GL_SPECULAR, fBrightLight)
-        
     glRotatef(yRot, 0.0, 1.0, 0.0)
-    glBindTexture(GL_TEXTURE_2D, textureObjects[TORUS_TEXTURE])
     if iMethod == 0:
-        gltDrawTorus(0.35, 0.15, 61, 37)
+        queue.Submit(lambda: DrawStrip(torusStrip), torusTexture, material)
+    elif iMethod == 4:
+        queue.Submit(lambda: lod.DrawTorus(0.35, 0.15, 61, 37), torusTexture, material)
+    elif iMethod == 1:
+        queue.Submit(lambda: glCallList(torusList), torusTexture, material)
     else:
-        glCallList(torusList)
-    glMaterialfv(GL_FRONT, GL_SPECULAR, fNoLight)
+        queue.Submit(torusBuffer.Draw, torusTexture, material)
     glPopMatrix()
 
+    queue.Flush()
+
 class MainWindow(window.Window):
     def __init__(self, *args, **kwargs):
-        global groundList, sphereList, torusList
+        global groundList, sphereList, torusList, sphereBuffer, groundBuffer, torusBuffer, sphereBatch, sphereGrid, groundMesh
         window.Window.__init__(self, *args, **kwargs)
         
         # pyglet reverses y axis
@@ -181,17 +290,18 @@ class MainWindow(window.Window):
 
         # Calculate shadow matrix
         pPlane = m3dGetPlaneEquation(vPoints[0], vPoints[1] , vPoints[2])
-        mShadowMatrix = m3dMakePlanarShadowMatrix(pPlane, fLightPos)
+        m3dMakePlanarShadowMatrix(pPlane, fLightPos, mShadowMatrix)
         # Mostly use material tracking
         glEnable(GL_COLOR_MATERIAL)
         glColorMaterial(GL_FRONT, GL_AMBIENT_AND_DIFFUSE)
-        glMaterialfv(GL_FRONT, GL_SPECULAR, fBrightLight)
+        glMaterialfv(GL_FRONT, GL_SPECULAR, fNoLight)
         glMateriali(GL_FRONT, GL_SHININESS, 128)
       
         # Randomly place sphere inhabitants
-        for sphere in spheres:
-            # Pick a random location between -20 and 20 at .1 increments
-            sphere.setOrigin(float(randint(-200, 200)) * 0.1, 0.0, float(randint(-200, 200)) * 0.1)
+        # Pick a random location between -20 and 20 at .1 increments
+        spheres.setOrigin(numpy.random.randint(-200, 201, NUM_SPHERES) * 0.1, 0.0,
+                            numpy.random.randint(-200, 201, NUM_SPHERES) * 0.1)
+        sphereGrid = SpatialGrid(2.0, spheres)
 
         # Set up texture maps
         glEnable(GL_TEXTURE_2D)
@@ -216,26 +326,45 @@ class MainWindow(window.Window):
         groundList = GLuint(firstlist)
         sphereList = GLuint(firstlist + 1)
         torusList = GLuint(firstlist + 2)
-        print firstlist
+        print(firstlist)
         # Create sphere display list
         glNewList(sphereList, GL_COMPILE)
-        glutSolidSphere(0.1, 40, 20)
+        gltDrawMesh(sphereMesh)
         glEndList()
 
         # Create torus display list
         glNewList(torusList, GL_COMPILE)
-        gltDrawTorus(0.35, 0.15, 61, 37)
+        gltDrawMesh(torusMesh)
         glEndList()
         
         # Create the ground display list
         glNewList(groundList, GL_COMPILE)
         DrawGround()
         glEndList()
+        
+        # And the vertex buffers, from the same meshes as the immediate mode
+        # shapes are drawn with
+        groundMesh = MakeGround()
+        if gl_info.have_version(1, 5):
+            sphereBuffer = MeshBuffer(sphereMesh)
+            torusBuffer = MeshBuffer(torusMesh)
+            groundBuffer = MeshBuffer(groundMesh)
+            # The spheres never move
+            sphereBatch = InstanceBatch(sphereMesh, spheres, bStatic = True, bBuffer = True)
+        
+        print("Press M to switch between " + ", ".join(szMethods))
+        print("Press T to start or stop timing frames")
     
     
     def __del__(self):
         # Delete the display list
         glDeleteLists(groundList, 3)
+        # And the vertex buffers
+        if sphereBuffer is not None:
+            sphereBuffer.Delete()
+            torusBuffer.Delete()
+            groundBuffer.Delete()
+            sphereBatch.Delete()
         # Delete the textures
         glDeleteTextures(NUM_TEXTURES, textureObjects)
     
@@ -245,6 +374,9 @@ class MainWindow(window.Window):
 
     # Called to draw scene
     def on_draw(self):
+        if bMeasure:
+            start = clock()
+        
         # Clear the window with the current clearing color
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT | GL_STENCIL_BUFFER_BIT)
 
@@ -259,8 +391,16 @@ class MainWindow(window.Window):
         glColor3f(1.0, 1.0, 1.0)
         if iMethod == 0:
             DrawGround()
-        else:
+        elif iMethod == 1:
             glCallList(groundList)
+        else:
+            glBindTexture(GL_TEXTURE_2D, textureObjects[GROUND_TEXTURE])
+            glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
+            glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
+            if iMethod == 4:
+                gltDrawMesh(groundMesh)
+            else:
+                groundBuffer.Draw()
         
         # Draw shadows first
         glDisable(GL_DEPTH_TEST)
@@ -288,9 +428,29 @@ class MainWindow(window.Window):
         
         glPopMatrix()
         
+        # Wait for the frame to be drawn, so the time is the whole of it
+        if bMeasure:
+            glFinish()
+            frameTimes[iMethod] += clock() - start
+            frameCounts[iMethod] += 1
+        
     # Respond to arrow keys by moving the camera frame of reference
     def on_key_press(self, symbol, modifier):
-        if symbol == key.UP:
+        global iMethod, bMeasure
+        if symbol == key.M:
+            iMethod = (iMethod + 1) % len(szMethods)
+            if iMethod in (2, 3) and sphereBuffer is None:
+                iMethod = 4
+            print("Drawing with " + szMethods[iMethod])
+            PrintFrameTimes()
+            print(queue.Report())
+        elif symbol == key.T:
+            bMeasure = not bMeasure
+            if bMeasure:
+                print("Timing frames")
+            else:
+                PrintFrameTimes()
+        elif symbol == key.UP:
             frameCamera.MoveForward(1.0)
         elif symbol == key.DOWN:
             frameCamera.MoveForward(-1.0)
@@ -316,6 +476,8 @@ class MainWindow(window.Window):
 
         # Set the clipping volume
         gluPerspective(35.0, fAspect, 1.0, 50.0)
+        glGetFloatv(GL_PROJECTION_MATRIX, mProjection)
+        lod.SetProjection(mProjection, h)
 
         # Reset Model view matrix stack
         glMatrixMode(GL_MODELVIEW)
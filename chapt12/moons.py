@@ -13,14 +13,18 @@ from pyglet.gl import *
 from pyglet import window
 from pyglet.window import mouse
 
+import sys
+sys.path.append("../shared")
+from fakeglu import gluNewQuadric, gluDeleteQuadric, gluQuadricNormals, gluSphere
+from scenegraph import SceneNode, DrawScene
+from picking import Picker
+
 # Define object names
 EARTH = 1
 MARS = 2
 MOON1 = 3
 MOON2 = 4
 
-global fAspect
-
 lightArrayType = GLfloat * 4
 
 # Just draw a sphere of some given radius
@@ -30,14 +34,41 @@ def DrawSphere(radius):
     gluSphere(pObj, radius, 26, 13)
     gluDeleteQuadric(pObj)
 
-# Parse the selection buffer to see which 
+# A body of the given color and radius, named for picking, placed at (x, y)
+# from its parent
+def Body(name, color, radius, x, y):
+    def DrawBody():
+        glColor3f(*color)
+        DrawSphere(radius)
+    body = SceneNode(DrawBody, name)
+    body.Translate(x, y, 0.0)
+    body.radius = radius
+    return body
+
+# The Earth and Mars with their moons. Each moon's name is pushed on top of
+# its planet's, so picking one reports both. The whole scene is translated
+# out and into view.
+planets = SceneNode()
+planets.Translate(0.0, 0.0, -300.0)
+earth = planets.AddChild(Body(EARTH, (0.0, 0.0, 1.0), 30.0, -100.0, 0.0))
+earth.AddChild(Body(MOON1, (0.85, 0.85, 0.85), 5.0, 45.0, 0.0))
+mars = planets.AddChild(Body(MARS, (1.0, 0.0, 0.0), 20.0, 100.0, 0.0))
+mars.AddChild(Body(MOON1, (0.85, 0.85, 0.85), 5.0, -40.0, 40.0))
+mars.AddChild(Body(MOON2, (0.85, 0.85, 0.85), 5.0, -40.0, -40.0))
+
+# Each body is picked by its sphere, where the scene graph has put it
+picker = Picker()
+for (body, mWorld) in planets.Traverse():
+    picker.AddSphere(body.GetNames(), body.GetWorldPosition(), body.radius)
+
+# Look at the names picked to see which 
 # planet/moon was selected
-def ProcessPlanet(pSelectBuff):
+def ProcessPlanet(names):
     # How many names on the name stack
-    count = pSelectBuff[0]
+    count = len(names)
     cMessage = "Error, no selection detected"
     # Bottom of the name stack
-    id = pSelectBuff[3]
+    id = names[0]
     
     # Select on earth or mars, whichever was picked
     if id == EARTH:
@@ -53,67 +84,25 @@ def ProcessPlanet(pSelectBuff):
         cMessage = "You clicked Mars."
         
         if count == 2:
-            if pSelectBuff[4] == MOON1:
+            if names[1] == MOON1:
                 cMessage += " - Specifically Moon #1."
             else:
                 cMessage += " - Specifically Moon #2."
-    print cMessage
+    print (cMessage)
     
         
 
 #############################
 # Process the selection, which is triggered by a right mouse
-# click at (xPos, yPos).
-
-BUFFER_LENGTH = 64
-# Space for selection buffer
-selectBuff = (GLuint * BUFFER_LENGTH)()
+# click at (xPos, yPos). The ray under the mouse is cast through
+# the picker's spheres, so nothing is drawn to find what was hit.
 
 def ProcessSelection(window, xPos, yPos):
-
-    # Hit counter and viewport storage
-    viewport = (GLint * 4)()
-
-    # Setup selection buffer
-    glSelectBuffer(BUFFER_LENGTH, selectBuff)
-
-    # Get the viewport
-    glGetIntegerv(GL_VIEWPORT, viewport)
-
-    # Switch to projection and save the matrix
-    glMatrixMode(GL_PROJECTION)
-    glPushMatrix()
-
-    # Change render mode
-    glRenderMode(GL_SELECT)
-
-    # Establish new clipping volume to be unit cube around
-    # mouse cursor point (xPos, yPos) and extending two pixels
-    # in the vertical and horizontal direction
-    glLoadIdentity()
-    gluPickMatrix(xPos, viewport[3] - yPos + viewport[1], 2,2, viewport)
-
-    # Apply perspective matrix 
-    gluPerspective(45.0, fAspect, 1.0, 425.0)
-
-    # Draw the scene
-    window.on_draw()
-
-    # Collect the hits
-    hits = glRenderMode(GL_RENDER)
-
-    # If a single hit occurred, display the info.
-    if(hits == 1):
-        ProcessPlanet(selectBuff)
+    names = picker.Pick(xPos, yPos)
+    if names is not None:
+        ProcessPlanet(names)
     else:
         print ("You clicked empty space!")
-        
-    # Restore the projection matrix
-    glMatrixMode(GL_PROJECTION)
-    glPopMatrix()
-
-    # Go back to modelview for normal rendering
-    glMatrixMode(GL_MODELVIEW)
 
 
 
@@ -154,55 +143,9 @@ class MainWindow(window.Window):
         # Clear the window with current clearing color
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         
-        # Save the matrix state and do the rotations
+        # Name and draw the planets and moons
         glMatrixMode(GL_MODELVIEW)
-        glPushMatrix()
-
-        # Translate the whole scene out and into view	
-        glTranslatef(0.0, 0.0, -300.0)	
-
-        # Initialize the names stack
-        glInitNames()
-        glPushName(0)
-        
-        # Draw the Earth
-        glPushMatrix()
-        glColor3f(0.0, 0.0, 1.0)
-        glTranslatef(-100.0,0.0,0.0)
-        glLoadName(EARTH)
-        DrawSphere(30.0)
-        
-        # Draw the Moon
-        glTranslatef(45.0, 0.0, 0.0)
-        glColor3f(0.85, 0.85, 0.85)
-        glPushName(MOON1)
-        DrawSphere(5.0)
-        glPopName()
-        glPopMatrix()
-
-        # Draw Mars
-        glColor3f(1.0, 0.0, 0.0)
-        glPushMatrix()
-        glTranslatef(100.0, 0.0, 0.0)
-        glLoadName(MARS)
-        DrawSphere(20.0)
-
-        # Draw Moon1
-        glTranslatef(-40.0, 40.0, 0.0)
-        glColor3f(0.85, 0.85, 0.85)
-        glPushName(MOON1)
-        DrawSphere(5.0)
-        glPopName()
-
-        # Draw Moon2
-        glTranslatef(0.0, -80.0, 0.0)
-        glPushName(MOON2)
-        DrawSphere(5.0)
-        glPopName()
-        glPopMatrix()
-
-        # Restore the matrix state
-        glPopMatrix()	# Modelview matrix
+        DrawScene(planets)
 
 
     #############################
@@ -215,7 +158,6 @@ class MainWindow(window.Window):
         # Set Viewport to window dimensions
         glViewport(0, 0, w, h)
         
-        global fAspect
         fAspect = float(w) / float(h)
         
         # Reset the coordinate system before modifying
@@ -228,6 +170,7 @@ class MainWindow(window.Window):
         # Reset Model view matrix stack
         glMatrixMode(GL_MODELVIEW)
         glLoadIdentity()
+        picker.SetMatrices()
 
     def on_mouse_press(self, x, y, button, mod):
         if button == mouse.LEFT:
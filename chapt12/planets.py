@@ -13,6 +13,12 @@ from pyglet.gl import *
 from pyglet import window
 from pyglet.window import mouse
 
+import sys
+sys.path.append("../shared")
+from fakeglu import gluNewQuadric, gluDeleteQuadric, gluQuadricNormals, gluSphere
+from scenegraph import SceneNode, DrawScene
+from picking import Picker
+
 # Define object names
 SUN = 1
 MERCURY = 2
@@ -20,8 +26,6 @@ VENUS = 3
 EARTH = 4
 MARS = 5
 
-global fAspect
-
 lightArrayType = GLfloat * 4
 
 # Just draw a sphere of some given radius
@@ -31,6 +35,31 @@ def DrawSphere(radius):
     gluSphere(pObj, radius, 26, 13)
     gluDeleteQuadric(pObj)
 
+# A planet of the given color and radius, named for picking, placed x along
+# from the sun
+def Planet(name, color, radius, x):
+    def DrawPlanet():
+        glColor3f(*color)
+        DrawSphere(radius)
+    planet = SceneNode(DrawPlanet, name)
+    planet.Translate(x, 0.0, 0.0)
+    planet.radius = radius
+    return planet
+
+# The sun and the planets, with the whole scene translated out and into view
+solarSystem = SceneNode()
+solarSystem.Translate(0.0, 0.0, -300.0)
+solarSystem.AddChild(Planet(SUN, (1.0, 1.0, 0.0), 15.0, 0.0))
+solarSystem.AddChild(Planet(MERCURY, (0.5, 0.0, 0.0), 2.0, 24.0))
+solarSystem.AddChild(Planet(VENUS, (0.5, 0.5, 1.0), 4.0, 60.0))
+solarSystem.AddChild(Planet(EARTH, (0.0, 0.0, 1.0), 8.0, 100.0))
+solarSystem.AddChild(Planet(MARS, (1.0, 0.0, 0.0), 4.0, 150.0))
+
+# Each planet is picked by its sphere, where the scene graph has put it
+picker = Picker()
+for (planet, mWorld) in solarSystem.Traverse():
+    picker.AddSphere(planet.GetNames(), planet.GetWorldPosition(), planet.radius)
+
 
 def ProcessPlanet(id):
     if id == SUN:
@@ -49,57 +78,15 @@ def ProcessPlanet(id):
 
 #############################
 # Process the selection, which is triggered by a right mouse
-# click at (xPos, yPos).
-
-BUFFER_LENGTH = 64
-# Space for selection buffer
-selectBuff = (GLuint * BUFFER_LENGTH)()
+# click at (xPos, yPos). The ray under the mouse is cast through
+# the picker's spheres, so nothing is drawn to find what was hit.
 
 def ProcessSelection(window, xPos, yPos):
-
-    # Hit counter and viewport storage
-    viewport = (GLint * 4)()
-
-    # Setup selection buffer
-    glSelectBuffer(BUFFER_LENGTH, selectBuff)
-
-    # Get the viewport
-    glGetIntegerv(GL_VIEWPORT, viewport)
-
-    # Switch to projection and save the matrix
-    glMatrixMode(GL_PROJECTION)
-    glPushMatrix()
-
-    # Change render mode
-    glRenderMode(GL_SELECT)
-
-    # Establish new clipping volume to be unit cube around
-    # mouse cursor point (xPos, yPos) and extending two pixels
-    # in the vertical and horizontal direction
-    glLoadIdentity()
-    gluPickMatrix(xPos, viewport[3] - yPos + viewport[1], 2,2, viewport)
-
-    # Apply perspective matrix 
-    gluPerspective(45.0, fAspect, 1.0, 425.0)
-
-    # Draw the scene
-    window.on_draw()
-
-    # Collect the hits
-    hits = glRenderMode(GL_RENDER)
-
-    # If a single hit occurred, display the info.
-    if(hits == 1):
-        ProcessPlanet(selectBuff[3])
+    names = picker.Pick(xPos, yPos)
+    if names is not None:
+        ProcessPlanet(names[0])
     else:
         print ("Nothing was clicked on!")
-        
-    # Restore the projection matrix
-    glMatrixMode(GL_PROJECTION)
-    glPopMatrix()
-
-    # Go back to modelview for normal rendering
-    glMatrixMode(GL_MODELVIEW)
 
 
 
@@ -141,58 +128,9 @@ class MainWindow(window.Window):
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         
         
-        # Save the matrix state and do the rotations
+        # Name and draw the Sun and planets
         glMatrixMode(GL_MODELVIEW)
-        glPushMatrix()
-
-        # Translate the whole scene out and into view	
-        glTranslatef(0.0, 0.0, -300.0)	
-
-        # Initialize the names stack
-        glInitNames()
-        glPushName(0)
-
-        
-        # Name and draw the Sun
-        glColor3f(1.0, 1.0, 0.0)
-        glLoadName(SUN)
-        DrawSphere(15.0)
-
-        # Draw Mercury
-        glColor3f(0.5, 0.0, 0.0)
-        glPushMatrix()
-        glTranslatef(24.0, 0.0, 0.0)
-        glLoadName(MERCURY)
-        DrawSphere(2.0)
-        glPopMatrix()
-
-        # Draw Venus
-        glColor3f(0.5, 0.5, 1.0)
-        glPushMatrix()
-        glTranslatef(60.0, 0.0, 0.0)
-        glLoadName(VENUS)
-        DrawSphere(4.0)
-        glPopMatrix()
-
-        # Draw the Earth
-        glColor3f(0.0, 0.0, 1.0)
-        glPushMatrix()
-        glTranslatef(100.0,0.0,0.0)
-        glLoadName(EARTH)
-        DrawSphere(8.0)
-        glPopMatrix()
-
-        # Draw Mars
-        glColor3f(1.0, 0.0, 0.0)
-        glPushMatrix()
-        glTranslatef(150.0, 0.0, 0.0)
-        glLoadName(MARS)
-        DrawSphere(4.0)
-        glPopMatrix()
-
-
-        # Restore the matrix state
-        glPopMatrix()	# Modelview matrix
+        DrawScene(solarSystem)
 
 
     #############################
@@ -205,7 +143,6 @@ class MainWindow(window.Window):
         # Set Viewport to window dimensions
         glViewport(0, 0, w, h)
         
-        global fAspect
         fAspect = float(w) / float(h)
         
         # Reset the coordinate system before modifying
@@ -218,6 +155,7 @@ class MainWindow(window.Window):
         # Reset Model view matrix stack
         glMatrixMode(GL_MODELVIEW)
         glLoadIdentity()
+        picker.SetMatrices()
 
     def on_mouse_press(self, x, y, button, mod):
         if button == mouse.LEFT:
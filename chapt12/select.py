@@ -8,22 +8,23 @@
 # rwright@starstonesoftware.com
 
 import pyglet
-from math import cos, sin
 from pyglet.gl import *
 from pyglet import window
 from pyglet.window import mouse
 
 import sys
 sys.path.append("../shared")
-from math3d import M3D_PI as M_PI
+from gltools import gltDrawTorus, gltMakeTorus
+from fakeglu import gluNewQuadric, gluDeleteQuadric, gluQuadricNormals, gluSphere, gluSphereMesh
+from math3d import M3DMatrix44f, m3dLoadIdentity44, m3dTranslateMatrix44, m3dMatrixMultiply44
+from picking import Picker
+from feedback import gltParseFeedback, gltProjectBounds
 
 #############
 # Object Names
 TORUS  = 1
 SPHERE = 2
 
-global fAspect
-
 boundingRect = {'top' : 0, 'bottom' : 0, 'left' : 0, 'right': 0} # Bounding rectangle
 selectedObject = 0 # Who is selected
 
@@ -33,39 +34,7 @@ lightArrayType = GLfloat * 4
 # Draw a torus (doughnut)  
 # at z = 0... torus aligns with xy plane
 def DrawTorus(numMajor, numMinor):
-
-    majorRadius = 0.35
-    minorRadius = 0.15
-    majorStep = 2.0*M_PI / numMajor
-    minorStep = 2.0*M_PI / numMinor
-
-    glEnable(GL_NORMALIZE)
-    for i in range(0, numMajor):
-
-        a0 = i * majorStep
-        a1 = a0 + majorStep
-        x0 = cos(a0)
-        y0 = sin(a0)
-        x1 = cos(a1)
-        y1 = sin(a1)
-
-        glBegin(GL_TRIANGLE_STRIP)
-        for j in range(0, numMinor):
-
-            b = j * minorStep
-            c = cos(b)
-            r = minorRadius * c + majorRadius
-            z = minorRadius * sin(b)
-
-            glTexCoord2f(i/numMajor, j/numMinor)
-            glNormal3f(x0*c, y0*c, z/minorRadius)
-            glVertex3f(x0*r, y0*r, z)
-
-            glTexCoord2f((i+1)/numMajor, j/numMinor)
-            glNormal3f(x1*c, y1*c, z/minorRadius)
-            glVertex3f(x1*r, y1*r, z)
-        glEnd()
-    glDisable(GL_NORMALIZE)
+    gltDrawTorus(0.35, 0.15, numMajor, numMinor)
 
 
 #############################
@@ -109,125 +78,80 @@ def DrawObjects():
     glPopMatrix()	# Modelview matrix
 
 
+# The torus and sphere where DrawObjects puts them, to pick from
+picker = Picker()
+mTorus = M3DMatrix44f()
+m3dLoadIdentity44(mTorus)
+m3dTranslateMatrix44(mTorus, -0.75, 0.0, -2.5)
+picker.AddTorus((TORUS,), 0.35, 0.15, mTorus)
+picker.AddSphere((SPHERE,), (0.75, 0.0, -2.5), 0.5)
+
+# The vertices of the torus and sphere as DrawObjects draws them, and where
+# it puts them, to find their rectangles on screen without drawing them
+mSphere = M3DMatrix44f()
+m3dLoadIdentity44(mSphere)
+m3dTranslateMatrix44(mSphere, 0.75, 0.0, -2.5)
+pObj = gluNewQuadric()
+gluQuadricNormals(pObj, GLU_SMOOTH)
+selectionMeshes = {TORUS: (gltMakeTorus(0.35, 0.15, 40, 20)[0][:, 5:8], mTorus),
+                   SPHERE: (gluSphereMesh(pObj, 0.5, 26, 13)[0][0][:, 5:8], mSphere)}
+gluDeleteQuadric(pObj)
+
 
 #############################
-# Go into feedback mode and draw a rectangle around the object
+# Draw a rectangle around the object: find where it is on
+# screen by projecting its vertices, or with bFeedback by
+# drawing the scene again in feedback mode
+bFeedback = False
 FEED_BUFF_SIZE = 32768
 # Space for the feedback buffer
 feedBackBuff = (GLfloat * FEED_BUFF_SIZE)()
 def MakeSelection(nChoice):
-    # Initial minimum and maximum values
-    boundingRect['right'] = boundingRect['bottom'] = -999999.0
-    boundingRect['left'] = boundingRect['top'] =  999999.0
-
-    # Set the feedback buffer
-    glFeedbackBuffer(FEED_BUFF_SIZE,GL_2D, feedBackBuff)
-
-    # Enter feedback mode
-    glRenderMode(GL_FEEDBACK)
-
-    # Redraw the scene
-    DrawObjects()
-
-    # Leave feedback mode
-    size = glRenderMode(GL_RENDER)
-
-    # Parse the feedback buffer and get the
-    # min and max X and Y window coordinates
-    i = 0
-    while(i < size):
-        # Search for appropriate token
-        if feedBackBuff[i] == GL_PASS_THROUGH_TOKEN:
-            if feedBackBuff[i+1] == nChoice:
-                i+= 2
-                # Loop until next token is reached
-                while i < size and feedBackBuff[i] != GL_PASS_THROUGH_TOKEN:
-                    # Just get the polygons
-                    if(feedBackBuff[i] == GL_POLYGON_TOKEN):
-                        # Get all the values for this polygon
-                        i += 1 # for the pre-increment op in the c++ code
-                        count = int(feedBackBuff[i]) # How many vertices
-                        i += 1
-
-                        for j in range(0, count):   # Loop for each vertex
-
-                            # Min and Max X
-                            if(feedBackBuff[i] > boundingRect['right']):
-                                boundingRect['right'] = feedBackBuff[i]
-
-                            if(feedBackBuff[i] < boundingRect['left']):
-                                boundingRect['left'] = feedBackBuff[i]
-                            i += 1
-
-                            # Min and Max Y
-                            if(feedBackBuff[i] > boundingRect['bottom']):
-                                boundingRect['bottom'] = feedBackBuff[i]
-
-                            if(feedBackBuff[i] < boundingRect['top']):
-                                boundingRect['top'] = feedBackBuff[i]
-                            i += 1
-                    else:
-                        i += 1	# Get next index and keep looking
-                break
-        i += 1
-
-
-#############################/
-# Process the selection, which is triggered by a right mouse
-# click at (xPos, yPos).
-
-BUFFER_LENGTH = 64
-# Space for selection buffer
-selectBuff = (GLuint * BUFFER_LENGTH)()
-
-def ProcessSelection(xPos, yPos):
+    if bFeedback:
+        # Set the feedback buffer
+        glFeedbackBuffer(FEED_BUFF_SIZE,GL_2D, feedBackBuff)
 
-    # Hit counter and viewport storage
-    viewport = (GLint * 4)()
+        # Enter feedback mode
+        glRenderMode(GL_FEEDBACK)
 
-    # Setup selection buffer
-    glSelectBuffer(BUFFER_LENGTH, selectBuff)
-
-    # Get the viewport
-    glGetIntegerv(GL_VIEWPORT, viewport)
-
-    # Switch to projection and save the matrix
-    glMatrixMode(GL_PROJECTION)
-    glPushMatrix()
-
-    # Change render mode
-    glRenderMode(GL_SELECT)
+        # Redraw the scene
+        DrawObjects()
 
-    # Establish new clipping volume to be unit cube around
-    # mouse cursor point (xPos, yPos) and extending two pixels
-    # in the vertical and horizontal direction
-    glLoadIdentity()
-    gluPickMatrix(xPos, viewport[3] - yPos + viewport[1], 2,2, viewport)
+        # Leave feedback mode
+        size = glRenderMode(GL_RENDER)
 
-    # Apply perspective matrix 
-    gluPerspective(60.0, fAspect, 1.0, 425.0)
+        # Get the min and max X and Y window coordinates
+        # of the polygons after the object's pass-through
+        bounds = gltParseFeedback(feedBackBuff, size, GL_2D).Bounds(nChoice)
+    else:
+        (points, mModel) = selectionMeshes[nChoice]
+        mModelView = M3DMatrix44f()
+        m3dMatrixMultiply44(mModelView, picker.mModelView, mModel)
+        bounds = gltProjectBounds(points, mModelView, picker.mProjection, picker.viewport)
 
-    # Draw the scene
-    DrawObjects()
+    if bounds is None:
+        boundingRect['right'] = boundingRect['bottom'] = -999999.0
+        boundingRect['left'] = boundingRect['top'] =  999999.0
+    else:
+        (boundingRect['left'], boundingRect['top'], boundingRect['right'], boundingRect['bottom']) = bounds
 
-    # Collect the hits
-    hits = glRenderMode(GL_RENDER)
 
-    # Restore the projection matrix
-    glMatrixMode(GL_PROJECTION)
-    glPopMatrix()
+#############################/
+# Process the selection, which is triggered by a right mouse
+# click at (xPos, yPos). The ray under the mouse is cast through
+# the torus and sphere, so nothing is drawn to find what was hit.
 
-    # Go back to modelview for normal rendering
-    glMatrixMode(GL_MODELVIEW)
+def ProcessSelection(xPos, yPos):
+    names = picker.Pick(xPos, yPos)
 
-    # If a single hit occurred, display the info.
-    if(hits == 1):
+    # If something was hit, outline it
+    if names is not None:
         global selectedObject
-        MakeSelection(selectBuff[3])
-        if selectedObject == selectBuff[3]:
+        MakeSelection(names[0])
+        if selectedObject == names[0]:
             selectedObject = 0
         else:
-            selectedObject = selectBuff[3]
+            selectedObject = names[0]
 
 
 
@@ -317,7 +241,6 @@ class MainWindow(window.Window):
         # Set Viewport to window dimensions
         glViewport(0, 0, w, h)
         
-        global fAspect
         fAspect = float(w) / float(h)
         
         # Reset the coordinate system before modifying
@@ -330,6 +253,7 @@ class MainWindow(window.Window):
         # Reset Model view matrix stack
         glMatrixMode(GL_MODELVIEW)
         glLoadIdentity()
+        picker.SetMatrices()
 
     def on_mouse_press(self, x, y, button, mod):
         if button == mouse.LEFT:
@@ -20,6 +20,7 @@ sys.path.append("../shared")
 from sys import exit
 from math3d import M3DMatrix44f, m3dLoadIdentity44, m3dTranslateMatrix44, m3dScaleMatrix44, m3dMatrixMultiply44, m3dTransposeMatrix44, m3dRadToDeg
 from fakeglut import glutSolidCube, glutSolidSphere, glutSolidCone, glutSolidOctahedron, glutSolidTorus
+from lod import LevelOfDetail
 
 ambientShadowAvailable = False
 npotTexturesAvailable = False
@@ -47,6 +48,16 @@ cameraPos = (GLfloat * 4)(100.0, 150.0, 200.0, 1.0)
 cameraZoom = 0.3
 
 textureMatrix = M3DMatrix44f()
+
+# How finely the curved shapes are drawn. These are picked from how big the
+# shapes are in the shadow map when it is made, and kept for drawing them from
+# the camera, so the depths in the map match the surfaces they are tested
+# against.
+lod = LevelOfDetail()
+sphereLevel = (50, 50)
+coneLevel = (50, 50)
+torusLevel = (50, 50)
+
 global strips
 # Called to draw scene objects
 def DrawModels(drawBasePlane):
@@ -69,7 +80,7 @@ def DrawModels(drawBasePlane):
     glColor3f(0.0, 1.0, 0.0)
     glPushMatrix()
     glTranslatef(-60.0, 0.0, 0.0)
-    glutSolidSphere(25.0, 50, 50)
+    glutSolidSphere(25.0, sphereLevel[0], sphereLevel[1])
     glPopMatrix()
 
     # Draw yellow cone
@@ -77,14 +88,14 @@ def DrawModels(drawBasePlane):
     glPushMatrix()
     glRotatef(-90.0, 1.0, 0.0, 0.0)
     glTranslatef(60.0, 0.0, -24.0)
-    glutSolidCone(25.0, 50.0, 50, 50)
+    glutSolidCone(25.0, 50.0, coneLevel[0], coneLevel[1])
     glPopMatrix()
 
     # Draw magenta torus
     glColor3f(1.0, 0.0, 1.0)
     glPushMatrix()
     glTranslatef(0.0, 0.0, 60.0)
-    glutSolidTorus(8.0, 16.0, 50, 50)
+    glutSolidTorus(8.0, 16.0, torusLevel[1], torusLevel[0])
     glPopMatrix()
 
     # Draw cyan octahedron
@@ -95,6 +106,15 @@ def DrawModels(drawBasePlane):
     glutSolidOctahedron()
     glPopMatrix()
 
+# Pick the levels of detail of the shapes in DrawModels, as seen through
+# mProjection and the current modelview
+def PickLevels(mProjection, viewportHeight):
+    global sphereLevel, coneLevel, torusLevel
+    lod.SetProjection(mProjection, viewportHeight)
+    sphereLevel = lod.SphereLevel(25.0, 50, 50, (-60.0, 0.0, 0.0))
+    coneLevel = lod.ConeLevel(25.0, 50.0, 50, 50, (60.0, -24.0, 0.0))
+    torusLevel = lod.TorusLevel(16.0, 8.0, 50, 50, (0.0, 0.0, 60.0))
+
 # Called to regenerate the shadow map
 def RegenerateShadowMap():
     global textureMatrix, strips
@@ -120,6 +140,7 @@ def RegenerateShadowMap():
     gluLookAt(lightPos[0], lightPos[1], lightPos[2], 0.0, 0.0, 0.0, 0.0, 1.0, 0.0)
     glGetFloatv(GL_MODELVIEW_MATRIX, lightModelview)
     glViewport(0, 0, shadowWidth, shadowHeight)
+    PickLevels(lightProjection, shadowHeight)
 
     # Clear the depth buffer only
     glClear(GL_DEPTH_BUFFER_BIT)
@@ -0,0 +1,907 @@
+#!/usr/bin/env python
+# Micro-benchmarks for the shared math and geometry code.
+# Ben Smith
+# benjamin.coder.smith@gmail.com
+#
+# Run from this directory with the names of the benchmarks to run, or with no
+# arguments to run all of them:
+#   python benchmarks.py invert
+
+import os
+import sys
+import types
+from timeit import default_timer as clock
+
+import pyglet
+# No window is opened, so don't let pyglet try to make a GL context
+pyglet.options['shadow_window'] = False
+import pyglet.gl
+from pyglet.window import key
+
+import numpy
+
+import math3d
+import glframe
+import fakeglut
+import fakeglu
+import immediate
+import instancing
+import picking
+import feedback
+import spatialgrid
+import bvh
+import staticscene
+from gltools import gltMakeSphere, gltMakeTorus
+from meshcache import meshCache
+from math3d import M3DVector3f
+from glframe import GLFrame
+from math3d import M3DMatrix44f, m3dLoadIdentity44, m3dRotationMatrix44, m3dInvertMatrix44, m3dInvertRigidMatrix44, m3dInvertMatrix44Array
+from math3d import m3dMatrixMultiply44, m3dMatrixMultiply44Array, m3dRotationMatrix44Array
+from math3d import m3dQuatFromAxisAngleArray, m3dQuatSlerpArray, m3dQuatNlerpArray, m3dQuatToMatrix44Array
+from math3d import m3dExtractFrustumPlanes, m3dSpheresInFrustum, m3dBoxesInFrustum
+
+
+# Time fn over count calls and print the cost per call
+def timeit(name, fn, count):
+    start = clock()
+    fn(count)
+    elapsed = clock() - start
+    print("  %-44s %10.3f us/call" % (name, elapsed * 1e6 / count))
+    return elapsed
+
+
+###########################################################
+# Matrix inverse
+
+# The old numpy.matrix based m3dInvertMatrix44, kept here for comparison
+def oldInvertMatrix44(dst, src):
+    from numpy import matrix
+    mat = matrix(   [[src[0], src[1], src[2], src[3]],
+                    [src[4], src[5], src[6], src[7]],
+                    [src[8], src[9], src[10], src[11]],
+                    [src[12], src[13], src[14], src[15]]])
+    mat = mat.I.tolist()
+    for i in range(4):
+        for j in range(4):
+            dst[i * 4 + j] = mat[i][j]
+
+def benchInvert():
+    print("m3dInvertMatrix44")
+    src = M3DMatrix44f()
+    dst = M3DMatrix44f()
+    m3dRotationMatrix44(src, 0.5, 0.0, 1.0, 0.0)
+    src[12] = 1.0
+    src[13] = 2.0
+    src[14] = -2.5
+
+    def old(count):
+        for i in range(count):
+            oldInvertMatrix44(dst, src)
+    def general(count):
+        for i in range(count):
+            m3dInvertMatrix44(dst, src)
+    def rigid(count):
+        for i in range(count):
+            m3dInvertRigidMatrix44(dst, src)
+
+    timeit("numpy.matrix (old)", old, 10000)
+    timeit("cofactor", general, 10000)
+    timeit("rigid", rigid, 10000)
+
+    stack = numpy.tile(numpy.frombuffer(src, numpy.float32), (10000, 1))
+    out = numpy.empty_like(stack)
+    def batch(count):
+        for i in range(count):
+            m3dInvertMatrix44Array(out, stack)
+    elapsed = timeit("batched, 10000 matrices", batch, 10)
+    print("  %-44s %10.3f us/matrix" % ("", elapsed * 1e6 / (10 * 10000)))
+
+
+###########################################################
+# Building and concatenating actor matrices
+
+def benchMatrixStack():
+    numActors = 5000
+    print("Rotate and concatenate %d matrices" % numActors)
+    angles = numpy.linspace(0.0, 6.0, numActors)
+    parent = M3DMatrix44f()
+    m3dRotationMatrix44(parent, 0.3, 1.0, 0.0, 0.0)
+    rot = [M3DMatrix44f() for i in range(numActors)]
+    product = [M3DMatrix44f() for i in range(numActors)]
+
+    def scalar(count):
+        for n in range(count):
+            for i in range(numActors):
+                m3dRotationMatrix44(rot[i], angles[i], 0.0, 1.0, 0.0)
+                m3dMatrixMultiply44(product[i], parent, rot[i])
+
+    rotStack = numpy.empty((numActors, 4, 4), numpy.float32)
+    productStack = numpy.empty((numActors, 4, 4), numpy.float32)
+    def batch(count):
+        for n in range(count):
+            m3dRotationMatrix44Array(rotStack, angles, (0.0, 1.0, 0.0))
+            m3dMatrixMultiply44Array(productStack, parent, rotStack)
+
+    timeit("scalar, per frame", scalar, 2)
+    timeit("batched, per frame", batch, 100)
+
+
+###########################################################
+# Applying static actors
+
+def benchStaticFrames():
+    numFrames = 10000
+    print("ApplyActorTransform on %d static frames" % numFrames)
+    frames = [GLFrame() for i in range(numFrames)]
+    for (i, frame) in enumerate(frames):
+        frame.setOrigin(float(i % 100), 0.0, float(i // 100))
+        frame.RotateLocalY(0.001 * i)
+
+    # There is no GL context here, so time everything up to handing the
+    # matrix to GL
+    multMatrix = glframe.glMultMatrixf
+    glframe.glMultMatrixf = lambda m: None
+    try:
+        def rebuilt(count):
+            for n in range(count):
+                for frame in frames:
+                    frame.Invalidate()
+                    frame.ApplyActorTransform()
+        def cached(count):
+            for n in range(count):
+                for frame in frames:
+                    frame.ApplyActorTransform()
+
+        timeit("rebuilt every frame, per frame", rebuilt, 5)
+        timeit("cached, per frame", cached, 5)
+    finally:
+        glframe.glMultMatrixf = multMatrix
+
+
+###########################################################
+# Interpolating actor orientations
+
+def benchSlerp():
+    numActors = 10000
+    print("Interpolate %d orientations and build their matrices" % numActors)
+    axes = numpy.random.rand(numActors, 3).astype(numpy.float32) - 0.5
+    start = m3dQuatFromAxisAngleArray(None, numpy.random.rand(numActors) * 6.0, axes)
+    end = m3dQuatFromAxisAngleArray(None, numpy.random.rand(numActors) * 6.0, axes)
+    current = numpy.empty_like(start)
+    matrices = numpy.empty((numActors, 4, 4), numpy.float32)
+
+    def slerp(count):
+        for i in range(count):
+            m3dQuatSlerpArray(current, start, end, 0.3)
+            m3dQuatToMatrix44Array(matrices, current)
+    def nlerp(count):
+        for i in range(count):
+            m3dQuatNlerpArray(current, start, end, 0.3)
+            m3dQuatToMatrix44Array(matrices, current)
+
+    timeit("slerp, per frame", slerp, 20)
+    timeit("nlerp, per frame", nlerp, 20)
+
+
+###########################################################
+# Allocations in the per frame draw paths
+
+# Run fn with the M3D types in math3d, glframe and modules swapped for
+# subclasses that count how many times they are made, and return the count. fn
+# is run once beforehand to warm up anything (like m3dScratch) that allocates
+# on first use.
+def countAllocations(fn, modules = ()):
+    counter = [0]
+    originals = {}
+    for name in ('M3DVector3f', 'M3DVector4f', 'M3DMatrix44f'):
+        base = getattr(math3d, name)
+        def __init__(self, *args, **kwargs):
+            counter[0] += 1
+            self.__class__.__bases__[0].__init__(self, *args, **kwargs)
+        counting = type(name, (base,), {'__init__': __init__,
+                                        '_length_': base._length_, '_type_': base._type_})
+        for module in (math3d, glframe) + tuple(modules):
+            if hasattr(module, name):
+                originals[(module, name)] = getattr(module, name)
+                setattr(module, name, counting)
+    try:
+        fn()
+        counter[0] = 0
+        fn()
+    finally:
+        for ((module, name), value) in originals.items():
+            setattr(module, name, value)
+    return counter[0]
+
+# Load a demo's source as a module, without running its main program. The
+# chapters have demos of the same name, so they aren't imported as usual.
+def loadDemo(path):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+    (directory, file) = os.path.split(path)
+    name = os.path.basename(directory) + '_' + os.path.splitext(file)[0]
+    module = types.ModuleType(name)
+    module.__file__ = path
+    source = open(path).read().replace('\r\n', '\n')
+    exec(compile(source, path, 'exec'), module.__dict__)
+    return module
+
+# Swap the GL functions in modules, and in every module loaded, for ones that
+# do nothing, so draw code can be run without a GL context. Returns what to
+# put back with unstubGL.
+def stubGL(modules):
+    def noGL(*args):
+        return None
+    originals = []
+    for module in list(modules) + list(sys.modules.values()):
+        if module is None or module.__name__.startswith('pyglet'):
+            continue
+        for (name, value) in list(vars(module).items()):
+            if name.lstrip('_').startswith('gl') and getattr(pyglet.gl, name.lstrip('_'), None) is value:
+                originals.append((module, name, value))
+                setattr(module, name, noGL)
+    return originals
+
+def unstubGL(originals):
+    for (module, name, value) in originals:
+        setattr(module, name, value)
+
+# Returns False if any of the draw paths allocated
+def benchAllocations():
+    print("ctypes allocations per frame")
+
+    # The draw functions of the demos themselves, with GL stubbed out.
+    # Windows aren't opened, so only what they do each frame is run.
+    shadow = loadDemo(os.path.join('..', 'chapt05', 'shadow.py'))
+    sphereworlds = [loadDemo(os.path.join('..', chapter, 'sphereworld.py')) for chapter in ('chapt05', 'chapt06')]
+    originals = stubGL([shadow] + sphereworlds)
+    # Culling reads the matrices back from GL, so start them somewhere sane
+    for demo in sphereworlds:
+        m3dLoadIdentity44(demo.mProjection)
+        m3dLoadIdentity44(demo.mModelView)
+
+    # on_draw doesn't use the window, so it's called without one
+    def jet():
+        shadow.MainWindow.__dict__['on_draw'](None)
+
+    # The camera moved as the arrow keys move it, then the frame drawn
+    def sphereworld(demo):
+        def frame():
+            window = demo.MainWindow
+            window.__dict__['on_key_press'](None, key.UP, 0)
+            window.__dict__['on_key_press'](None, key.LEFT, 0)
+            window.__dict__['update'](None, 1 / 60.0)
+            window.__dict__['on_draw'](None)
+        return frame
+
+    # A camera rig turned and moved a little at a time, dozens of times a
+    # frame, in both kinds of frame
+    rigs = (GLFrame(), GLFrame(True))
+    vPoint = M3DVector3f(1.0, 2.0, 3.0)
+    def rig():
+        for frame in rigs:
+            for i in range(8):
+                frame.RotateLocalX(0.001)
+                frame.RotateLocalY(0.002)
+                frame.RotateLocalZ(-0.001)
+                frame.RotateWorld(0.001, 0.0, 1.0, 0.0)
+                frame.RotateLocal(0.001, 1.0, 1.0, 0.0)
+                frame.TranslateLocal(0.01, 0.0, 0.1)
+                frame.TranslateWorld(0.0, 0.01, 0.0)
+                frame.LocalToWorld(vPoint, vPoint)
+                frame.WorldToLocal(vPoint, vPoint)
+            frame.GetMatrix(False, glframe._mScratch)
+
+    paths = (("chapt05/shadow.py", jet),
+             ("chapt05/sphereworld.py", sphereworld(sphereworlds[0])),
+             ("chapt06/sphereworld.py", sphereworld(sphereworlds[1])),
+             ("camera rig", rig))
+    bPassed = True
+    try:
+        for (name, fn) in paths:
+            count = countAllocations(fn, [shadow] + sphereworlds)
+            print("  %-44s %10d" % (name, count))
+            if count != 0:
+                print("  ...expected no allocations")
+                bPassed = False
+    finally:
+        unstubGL(originals)
+    return bPassed
+
+
+###########################################################
+# Mesh cache
+
+# The shapes chapt14/shadowmap.py draws in DrawModels, two or three times a
+# frame. There is no GL context to draw them with, so only the building and
+# the cache lookups are timed.
+def benchMeshCache():
+    print("shadowmap models, per draw")
+
+    def drawModels():
+        fakeglut.glutSolidCube(48.0)
+        fakeglut.glutSolidSphere(25.0, 50, 50)
+        fakeglut.glutSolidCone(25.0, 50.0, 50, 50)
+        fakeglut.glutSolidTorus(8.0, 16.0, 50, 50)
+        fakeglut.glutSolidOctahedron()
+
+    def uncached(count):
+        for i in range(count):
+            meshCache.Clear()
+            drawModels()
+
+    def cached(count):
+        for i in range(count):
+            drawModels()
+
+    gltDrawMesh = fakeglut.gltDrawMesh
+    noDraw = lambda mesh, mode = None, bTexture = True, bNormals = True: None
+    fakeglut.gltDrawMesh = fakeglu.gltDrawMesh = noDraw
+    try:
+        timeit("built every time", uncached, 50)
+        meshCache.Clear()
+        timeit("from the cache", cached, 10000)
+    finally:
+        fakeglut.gltDrawMesh = fakeglu.gltDrawMesh = gltDrawMesh
+    print("  %d meshes, %d bytes, %d hits, %d misses" % (len(meshCache), meshCache.size, meshCache.hits, meshCache.misses))
+
+
+###########################################################
+# Immediate mode capture
+
+# DrawGround from the sphereworlds, through the capture layer: 41 strips of
+# 82 vertices a frame. There is no GL context, so the GL functions are
+# replaced by ones that do nothing, and only the Python side is timed.
+def benchImmediate():
+    print("sphereworld ground, per frame")
+
+    def DrawGround():
+        fExtent = 20.0
+        fStep = 1.0
+        y = -0.4
+        iStrip = -fExtent
+        while (iStrip <= fExtent):
+            immediate.glBegin(immediate.GL_TRIANGLE_STRIP)
+            immediate.glNormal3f(0.0, 1.0, 0.0)
+            iRun = fExtent
+            while (iRun >= -fExtent):
+                immediate.glVertex3f(iStrip, y, iRun)
+                immediate.glVertex3f(iStrip + fStep, y, iRun)
+                iRun -= fStep
+            immediate.glEnd()
+            iStrip += fStep
+
+    def noGL(*args):
+        pass
+
+    names = ['_glBegin', '_glEnd', '_glVertex3f', '_glNormal3f', 'glGetFloatv', 'glPushClientAttrib',
+             'glPopClientAttrib', 'glEnableClientState', 'glVertexPointer', 'glNormalPointer', 'glDrawElements']
+    saved = [getattr(immediate, name) for name in names]
+    for name in names:
+        setattr(immediate, name, noGL)
+
+    ground = immediate.Recording()
+
+    def drawn(count):
+        for i in range(count):
+            DrawGround()
+
+    def recorded(count):
+        for i in range(count):
+            ground.Clear()
+            ground.Draw(DrawGround)
+
+    def replayed(count):
+        for i in range(count):
+            ground.Draw(DrawGround)
+
+    try:
+        timeit("a call at a time", drawn, 50)
+        timeit("recorded", recorded, 50)
+        timeit("replayed", replayed, 10000)
+    finally:
+        for (name, value) in zip(names, saved):
+            setattr(immediate, name, value)
+    print("  %d vertices, %d batches" % (len(ground.vertices), len(ground.batches)))
+
+
+###########################################################
+# Instancing
+
+# Ten thousand spheres, drawn one at a time as DrawInhabitants does and merged
+# into one batch. The GL calls are left out, as above.
+def benchInstancing():
+    nSpheres = 10000
+    print("%d spheres, per frame" % nSpheres)
+
+    spheres = glframe.FrameArray(nSpheres)
+    spheres.setOrigin(numpy.random.randint(-200, 201, nSpheres) * 0.1, 0.0,
+                      numpy.random.randint(-200, 201, nSpheres) * 0.1)
+    batch = instancing.InstanceBatch(gltMakeSphere(0.1, 13, 7), spheres)
+    movers = numpy.arange(0, nSpheres, 100)
+
+    def noGL(*args):
+        pass
+
+    def oneAtATime(count):
+        for i in range(count):
+            for j in range(nSpheres):
+                noGL()
+                spheres.ApplyActorTransform(j)
+                noGL(j)
+                noGL()
+
+    def allMoved(count):
+        for i in range(count):
+            batch._matrices[:] = numpy.nan
+            batch.Draw()
+
+    def someMoved(count):
+        for i in range(count):
+            spheres.MoveForward(0.01, movers)
+            batch.Draw()
+
+    def noneMoved(count):
+        for i in range(count):
+            batch.Draw()
+
+    glMultMatrixf = glframe.glMultMatrixf
+    gltDrawMesh = instancing.gltDrawMesh
+    glframe.glMultMatrixf = noGL
+    instancing.gltDrawMesh = noGL
+    try:
+        timeit("one at a time", oneAtATime, 3)
+        timeit("merged, all moved", allMoved, 10)
+        timeit("merged, %d moved" % len(movers), someMoved, 100)
+        timeit("merged, none moved", noneMoved, 100)
+    finally:
+        glframe.glMultMatrixf = glMultMatrixf
+        instancing.gltDrawMesh = gltDrawMesh
+    print("  %d vertices, %d indices, 1 draw call" % (batch.vertices.shape[0] * batch.vertices.shape[1], len(batch.indices)))
+
+
+###########################################################
+# Picking
+
+def benchPicking():
+    nSpheres = 100000
+    print("%d spheres, seen from 300 units away" % nSpheres)
+
+    centers = numpy.random.uniform(-100.0, 100.0, (nSpheres, 3))
+    radii = numpy.random.uniform(0.2, 1.0, nSpheres)
+    picker = picking.Picker()
+    picker.AddSpheres([(i,) for i in range(nSpheres)], centers, radii)
+
+    # Rays from the camera to random points in the cloud
+    targets = numpy.random.uniform(-100.0, 100.0, (1000, 3)) - (0.0, 0.0, 300.0)
+    targets /= numpy.sqrt((targets * targets).sum(1))[:, numpy.newaxis]
+    rays = [((0.0, 0.0, 300.0), tuple(direction)) for direction in targets.tolist()]
+
+    def build(count):
+        for i in range(count):
+            picker.bvh = None
+            picker.PickRay(rays[0][0], rays[0][1])
+
+    def pick(count):
+        for i in range(count):
+            (vOrigin, vDirection) = rays[i % len(rays)]
+            picker.PickRay(vOrigin, vDirection)
+
+    def bruteForce(count):
+        for i in range(count):
+            (vOrigin, vDirection) = rays[i % len(rays)]
+            l = centers - vOrigin
+            b = numpy.dot(l, vDirection)
+            discriminant = b * b - (l * l).sum(1) + radii * radii
+            hits = numpy.flatnonzero(discriminant >= 0.0)
+            if len(hits):
+                hits[numpy.argmin(b[hits] - numpy.sqrt(discriminant[hits]))]
+
+    timeit("build hierarchy", build, 3)
+    timeit("pick", pick, 1000)
+    timeit("brute force, numpy", bruteForce, 100)
+
+
+###########################################################
+# Feedback buffer
+
+# The old select.py loop, kept here for comparison: the min and max window
+# coordinates of the polygons after glPassThrough(nChoice)
+def oldFeedbackBounds(feedBackBuff, size, nChoice):
+    (left, bottom, right, top) = (999999.0, 999999.0, -999999.0, -999999.0)
+    i = 0
+    while i < size:
+        if feedBackBuff[i] == feedback.GL_PASS_THROUGH_TOKEN:
+            if feedBackBuff[i + 1] == nChoice:
+                i += 2
+                while i < size and feedBackBuff[i] != feedback.GL_PASS_THROUGH_TOKEN:
+                    if feedBackBuff[i] == feedback.GL_POLYGON_TOKEN:
+                        count = int(feedBackBuff[i + 1])
+                        i += 2
+                        for j in range(count):
+                            left = min(left, feedBackBuff[i])
+                            right = max(right, feedBackBuff[i])
+                            bottom = min(bottom, feedBackBuff[i + 1])
+                            top = max(top, feedBackBuff[i + 1])
+                            i += 2
+                    else:
+                        i += 1
+                break
+        i += 1
+    return (left, bottom, right, top)
+
+def benchFeedback():
+    # A full buffer of GL_2D triangles, half of them after glPassThrough(1)
+    # and half after glPassThrough(2)
+    nTriangles = 4000
+    triangles = numpy.empty((nTriangles, 8), numpy.float32)
+    triangles[:, 0] = feedback.GL_POLYGON_TOKEN
+    triangles[:, 1] = 3
+    triangles[:, 2:8] = numpy.random.uniform(0.0, 800.0, (nTriangles, 6))
+    half = nTriangles // 2 * 8
+    data = numpy.concatenate(([feedback.GL_PASS_THROUGH_TOKEN, 1], triangles.ravel()[:half],
+                              [feedback.GL_PASS_THROUGH_TOKEN, 2], triangles.ravel()[half:])).astype(numpy.float32)
+    size = len(data)
+    feedBackBuff = (feedback.GLfloat * size)(*data.tolist())
+    print("%d triangles, %d floats" % (nTriangles, size))
+
+    def old(count):
+        for i in range(count):
+            oldFeedbackBounds(feedBackBuff, size, 2)
+
+    def parse(count):
+        for i in range(count):
+            feedback.gltParseFeedback(feedBackBuff, size, feedback.GL_2D).Bounds(2)
+
+    def project(count):
+        for i in range(count):
+            feedback.gltProjectBounds(points, mModelView, mProjection, (0, 0, 800, 600))
+
+    # The torus select.py outlines
+    points = gltMakeTorus(0.35, 0.15, 40, 20)[0][:, 5:8]
+    mModelView = M3DMatrix44f()
+    mProjection = M3DMatrix44f()
+    m3dLoadIdentity44(mModelView)
+    m3dLoadIdentity44(mProjection)
+    mModelView[14] = -2.5
+    mProjection[11] = -1.0
+    mProjection[15] = 0.0
+
+    timeit("python loop", old, 3)
+    timeit("gltParseFeedback", parse, 30)
+    timeit("gltProjectBounds, %d vertices" % len(points), project, 300)
+
+
+###########################################################
+# Spatial grid
+
+def benchSpatialGrid():
+    # Sphereworld with many more inhabitants, over the same 40 x 40 ground
+    nFrames = 100000
+    frames = glframe.FrameArray(nFrames)
+    frames.setOrigin(numpy.random.uniform(-20.0, 20.0, nFrames), 0.0, numpy.random.uniform(-20.0, 20.0, nFrames))
+    frames.RotateLocalY(numpy.random.uniform(0.0, 2.0 * math3d.M3D_PI, nFrames))
+    print("%d frames on a 40 x 40 ground" % nFrames)
+
+    # Sphereworld's view, 35 degrees wide and 50 deep, from the middle
+    mProjection = M3DMatrix44f()
+    m3dLoadIdentity44(mProjection)
+    f = 1.0 / numpy.tan(numpy.radians(17.5))
+    (zNear, zFar) = (1.0, 50.0)
+    mProjection[0] = f / 1.333
+    mProjection[5] = f
+    mProjection[10] = (zFar + zNear) / (zNear - zFar)
+    mProjection[11] = -1.0
+    mProjection[14] = 2.0 * zFar * zNear / (zNear - zFar)
+    mProjection[15] = 0.0
+    planes = numpy.zeros((6, 4), numpy.float32)
+    m3dExtractFrustumPlanes(planes, mProjection)
+
+    points = numpy.random.uniform(-20.0, 20.0, (1000, 3)) * (1.0, 0.0, 1.0)
+    grid = spatialgrid.SpatialGrid(1.0, frames)
+    movers = numpy.random.choice(nFrames, nFrames // 100, replace=False)
+
+    def build(count):
+        for i in range(count):
+            spatialgrid.SpatialGrid(1.0, frames)
+
+    def frustum(count):
+        for i in range(count):
+            grid.QueryFrustum(planes, 0.3)
+
+    def frustumLinear(count):
+        for i in range(count):
+            numpy.flatnonzero(m3dSpheresInFrustum(planes, frames.origins, 0.3))
+
+    def radius(count):
+        for i in range(count):
+            grid.QueryRadius(points[i % len(points)], 1.0)
+
+    def radiusLinear(count):
+        for i in range(count):
+            offsets = frames.origins - points[i % len(points)]
+            numpy.flatnonzero((offsets * offsets).sum(1) <= 1.0)
+
+    def nearest(count):
+        for i in range(count):
+            grid.Nearest(points[i % len(points)])
+
+    def nearestLinear(count):
+        for i in range(count):
+            offsets = frames.origins - points[i % len(points)]
+            numpy.argmin((offsets * offsets).sum(1))
+
+    def update(count):
+        for i in range(count):
+            frames.MoveForward(0.1, movers)
+            grid.Update(movers)
+
+    print("  %d in view" % len(grid.QueryFrustum(planes, 0.3)))
+    timeit("build", build, 3)
+    timeit("frustum, grid", frustum, 30)
+    timeit("frustum, testing all", frustumLinear, 30)
+    timeit("radius 1, grid", radius, 1000)
+    timeit("radius 1, testing all", radiusLinear, 100)
+    timeit("nearest, grid", nearest, 1000)
+    timeit("nearest, testing all", nearestLinear, 100)
+    timeit("update, %d moving" % len(movers), update, 30)
+
+
+###########################################################
+# Static scene hierarchy
+
+def benchStaticBVH():
+    # The tunnel's four quads a segment, for 10000 segments, seen from the
+    # middle with the tunnel demo's projection
+    nSegments = 10000
+    z = -10.0 * numpy.arange(nSegments)
+    mins = numpy.zeros((nSegments, 4, 3))
+    maxs = numpy.zeros((nSegments, 4, 3))
+    mins[:, :, 0:2] = ((-10.0, -10.0), (-10.0, 10.0), (-10.0, -10.0), (10.0, -10.0))
+    maxs[:, :, 0:2] = ((10.0, -10.0), (10.0, 10.0), (-10.0, 10.0), (10.0, 10.0))
+    mins[:, :, 2] = (z - 10.0)[:, numpy.newaxis]
+    maxs[:, :, 2] = z[:, numpy.newaxis]
+    (mins, maxs) = (mins.reshape(-1, 3), maxs.reshape(-1, 3))
+    print("%d segments, %d quads" % (nSegments, len(mins)))
+
+    mProjection = M3DMatrix44f()
+    m3dLoadIdentity44(mProjection)
+    (zNear, zFar) = (1.0, 120.0)
+    mProjection[0] = 1.0 / 1.333
+    mProjection[10] = (zFar + zNear) / (zNear - zFar)
+    mProjection[11] = -1.0
+    mProjection[14] = 2.0 * zFar * zNear / (zNear - zFar)
+    mProjection[15] = 0.0
+    mModelView = M3DMatrix44f()
+    m3dLoadIdentity44(mModelView)
+    mModelView[14] = 10.0 * nSegments / 2
+    vEye = (0.0, 0.0, -mModelView[14])
+    planes = numpy.zeros((6, 4), numpy.float32)
+    m3dExtractFrustumPlanes(planes, mProjection, mModelView)
+
+    tree = bvh.BoundingVolumeHierarchy(mins, maxs, 1)
+    path = 'staticbvh.npz'
+
+    def build(count):
+        for i in range(count):
+            bvh.BoundingVolumeHierarchy(mins, maxs, 1)
+
+    def save(count):
+        for i in range(count):
+            tree.Save(path)
+
+    def load(count):
+        for i in range(count):
+            bvh.LoadBoundingVolumeHierarchy(path)
+
+    def query(count):
+        for i in range(count):
+            tree.QueryFrustum(planes, vEye)
+
+    def linear(count):
+        for i in range(count):
+            numpy.flatnonzero(m3dBoxesInFrustum(planes, mins, maxs))
+
+    print("  %d quads in view" % len(tree.QueryFrustum(planes, vEye)))
+    timeit("build", build, 3)
+    timeit("save", save, 3)
+    timeit("load", load, 10)
+    timeit("frustum, nearest first", query, 100)
+    timeit("frustum, testing all", linear, 100)
+    os.remove(path)
+
+    # A StaticScene of the segments, one piece each, built with a file to
+    # save the tree in. The tree should be read back from it while the
+    # pieces stay the same, and built again once one of them moves, even
+    # when the box around them all doesn't change.
+    segmentMins = mins.reshape(nSegments, 4, 3).min(axis=1)
+    segmentMaxs = maxs.reshape(nSegments, 4, 3).max(axis=1)
+    indices = numpy.array([0, 1], numpy.uint32)
+    meshes = []
+    for i in range(nSegments):
+        vertices = numpy.zeros((2, 8), numpy.float32)
+        vertices[0, 5:8] = segmentMins[i]
+        vertices[1, 5:8] = segmentMaxs[i]
+        meshes.append((vertices, indices))
+    path = 'staticscene.npz'
+    if os.path.exists(path):
+        os.remove(path)
+
+    nBuilt = [0]
+    BoundingVolumeHierarchy = staticscene.BoundingVolumeHierarchy
+    def counting(*args):
+        nBuilt[0] += 1
+        return BoundingVolumeHierarchy(*args)
+
+    def build(meshes):
+        scene = staticscene.StaticScene()
+        for mesh in meshes:
+            scene.Add(mesh, pyglet.gl.GL_LINES)
+        nBefore = nBuilt[0]
+        start = clock()
+        scene.Build(path)
+        return (nBuilt[0] > nBefore, clock() - start)
+
+    staticscene.BoundingVolumeHierarchy = counting
+    try:
+        (bBuilt, elapsed) = build(meshes)
+        print("  %-44s %10.3f us/call" % ("scene, built and saved", elapsed * 1e6))
+        (bRebuilt, elapsed) = build(meshes)
+        print("  %-44s %10.3f us/call" % ("scene, loaded", elapsed * 1e6))
+        moved = list(meshes)
+        (vertices, indices) = moved[nSegments // 2]
+        moved[nSegments // 2] = (vertices + numpy.array([0.0] * 7 + [-1.0], numpy.float32), indices)
+        (bMovedRebuilt, elapsed) = build(moved)
+    finally:
+        staticscene.BoundingVolumeHierarchy = BoundingVolumeHierarchy
+        os.remove(path)
+
+    bPassed = bBuilt and not bRebuilt and bMovedRebuilt
+    print("  saved tree %s, rebuilt after a piece moved: %s" %
+          ("reused" if not bRebuilt else "NOT reused", "yes" if bMovedRebuilt else "NO"))
+    return bPassed
+
+
+###########################################################
+# Render queue
+
+# Just enough of GL's modelview matrix stack, in numpy, to follow what draw
+# code does to it without a GL context. Set as GL's functions in modules with
+# Install, after stubGL.
+class FakeMatrixStack(object):
+    def __init__(self):
+        self.stack = [numpy.identity(4)]
+
+    def Install(self, modules):
+        functions = {'glPushMatrix': self.PushMatrix, 'glPopMatrix': self.PopMatrix,
+                     'glLoadMatrixf': self.LoadMatrixf, 'glMultMatrixf': self.MultMatrixf,
+                     'glTranslatef': self.Translatef, 'glRotatef': self.Rotatef, 'glGetFloatv': self.GetFloatv}
+        for module in modules:
+            for (name, function) in functions.items():
+                if hasattr(module, name):
+                    setattr(module, name, function)
+
+    # The current matrix, in GL's column major order
+    def Current(self):
+        return self.stack[-1].T.reshape(-1)
+
+    def PushMatrix(self):
+        self.stack.append(self.stack[-1].copy())
+
+    def PopMatrix(self):
+        self.stack.pop()
+
+    def LoadMatrixf(self, m):
+        self.stack[-1] = numpy.array(m[0:16], numpy.float64).reshape(4, 4).T
+
+    def MultMatrixf(self, m):
+        self.stack[-1] = numpy.dot(self.stack[-1], numpy.array(m[0:16], numpy.float64).reshape(4, 4).T)
+
+    def Translatef(self, x, y, z):
+        m = numpy.identity(4)
+        m[0:3, 3] = (x, y, z)
+        self.stack[-1] = numpy.dot(self.stack[-1], m)
+
+    def Rotatef(self, angle, x, y, z):
+        m = M3DMatrix44f()
+        m3dRotationMatrix44(m, math3d.m3dDegToRad(angle), x, y, z)
+        self.MultMatrixf(m)
+
+    def GetFloatv(self, pname, values):
+        if pname == pyglet.gl.GL_MODELVIEW_MATRIX:
+            values[0:16] = self.Current().tolist()
+
+# The inhabitants of chapt11/sphereworld.py queued and drawn with GL stubbed
+# out, with the level of detail method, whose draws need the sphere each is
+# for, checking each sphere is drawn once, with its own matrix, in both
+# passes. Returns False if not.
+def benchRenderQueue():
+    print("chapt11 sphereworld inhabitants, per pass")
+    demo = loadDemo(os.path.join('..', 'chapt11', 'sphereworld.py'))
+    import renderqueue
+    originals = stubGL([demo])
+    stack = FakeMatrixStack()
+    stack.Install([demo, glframe, renderqueue])
+
+    # The camera at the origin, with the demo's projection for an 800 x 600
+    # window
+    (zNear, zFar) = (1.0, 50.0)
+    m3dLoadIdentity44(demo.mProjection)
+    demo.mProjection[0] = 1.0 / (1.333 * numpy.tan(numpy.radians(17.5)))
+    demo.mProjection[5] = 1.0 / numpy.tan(numpy.radians(17.5))
+    demo.mProjection[10] = (zFar + zNear) / (zNear - zFar)
+    demo.mProjection[11] = -1.0
+    demo.mProjection[14] = 2.0 * zFar * zNear / (zNear - zFar)
+    demo.mProjection[15] = 0.0
+    numpy.random.seed(1)
+    demo.spheres.setOrigin(numpy.random.randint(-200, 201, demo.NUM_SPHERES) * 0.1, 0.0,
+                           numpy.random.randint(-200, 201, demo.NUM_SPHERES) * 0.1)
+    demo.sphereGrid = spatialgrid.SpatialGrid(2.0, demo.spheres)
+    demo.iMethod = 4
+    demo.textureObjects[0:demo.NUM_TEXTURES] = list(range(1, demo.NUM_TEXTURES + 1))
+
+    # What each of the spheres, rather than the one going round the torus,
+    # is drawn with
+    drawn = []
+    def drawSphere(radius, slices, stacks, vCenter = None):
+        if vCenter is not None:
+            drawn.append((vCenter[0:3].tolist(), stack.Current()))
+    demo.lod.DrawSphere = drawSphere
+
+    def inhabitants(count):
+        for i in range(count):
+            demo.DrawInhabitants(1)
+            demo.DrawInhabitants(0)
+
+    bPassed = True
+    try:
+        for nShadow in (1, 0):
+            del drawn[:]
+            demo.DrawInhabitants(nShadow)
+            if nShadow == 0:
+                expected = sorted(demo.VisibleSpheres().tolist())
+            else:
+                expected = list(range(demo.NUM_SPHERES))
+            # Each sphere's matrix should put it at its own origin
+            found = []
+            for (vCenter, m) in drawn:
+                bAt = numpy.allclose(m[12:15], vCenter)
+                i = numpy.flatnonzero((numpy.abs(demo.spheres.origins - m[12:15]) < 1e-4).all(axis=1))
+                if bAt and len(i) == 1:
+                    found.append(int(i[0]))
+            bRight = sorted(found) == expected and len(drawn) == len(expected)
+            print("  %s pass: %d spheres queued, %d drawn in place; %s" %
+                  (("shadow", "lit")[nShadow == 0], len(expected), len(found), demo.queue.Report()))
+            if not bRight:
+                print("  ...expected each sphere drawn once, with its own matrix")
+                bPassed = False
+        timeit("submit and flush, both passes", inhabitants, 100)
+    finally:
+        del demo.lod.DrawSphere
+        unstubGL(originals)
+    return bPassed
+
+
+BENCHMARKS = [  ('invert', benchInvert),
+                ('matrixstack', benchMatrixStack),
+                ('static', benchStaticFrames),
+                ('slerp', benchSlerp),
+                ('alloc', benchAllocations),
+                ('meshcache', benchMeshCache),
+                ('immediate', benchImmediate),
+                ('instancing', benchInstancing),
+                ('picking', benchPicking),
+                ('feedback', benchFeedback),
+                ('spatialgrid', benchSpatialGrid),
+                ('staticbvh', benchStaticBVH),
+                ('renderqueue', benchRenderQueue),
+                ]
+
+if __name__ == '__main__':
+    names = sys.argv[1:]
+    bFailed = False
+    for (name, bench) in BENCHMARKS:
+        if not names or name in names:
+            if bench() is False:
+                bFailed = True
+    if bFailed:
+        sys.exit(1)
@@ -0,0 +1,307 @@
+# A bounding volume hierarchy over axis aligned boxes, for finding the few of
+# many objects a ray can touch without testing every one of them:
+#
+#   bvh = BoundingVolumeHierarchy(mins, maxs)   # (N,3) corners of the boxes
+#   (item, t) = bvh.Raycast(vOrigin, vDirection, hit)
+#
+# Items are the indices of the boxes. Raycast calls hit(item) for the items
+# whose boxes the ray passes through, nearest boxes first, and hit returns
+# how far along the ray the item really is hit, or None if it isn't.
+#
+# QueryFrustum finds the items whose boxes are in view instead, nearest
+# first, for drawing static scenes front to back:
+#
+#   for item in bvh.QueryFrustum(frustumPlanes, vEye):
+#       ...
+#
+# The tree is built top down, a level at a time, splitting each node's boxes
+# in half at the median of their centers along the axis they are most spread
+# out on. Each level is sorted in one go with numpy, so building over 100000
+# boxes takes under a second. Save writes the built tree to a file, and
+# LoadBoundingVolumeHierarchy reads it back without building it again. The
+# tree keeps boxHash, a digest of the boxes it was built over, so a saved
+# tree can be checked against the boxes before it is used.
+
+from hashlib import sha1
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_INFINITY = float('inf')
+
+# Every one of the six frustum planes, as bits
+_ALL_PLANES = (1 << 6) - 1
+
+# Stands in for 1 / 0 in the slab test, and is finite so it never makes a NaN
+_HUGE = 1e30
+
+class BoundingVolumeHierarchy(object):
+    def __init__(self, mins, maxs, leafSize = 4):
+        mins = numpy.asarray(mins, numpy.float64).reshape(-1, 3)
+        maxs = numpy.asarray(maxs, numpy.float64).reshape(-1, 3)
+        self.leafSize = leafSize
+        self.boxHash = BoxesHash(mins, maxs)
+        self._Build(mins, maxs)
+
+    def __len__(self):
+        return len(self.order)
+
+    # Nodes are numbered a level at a time from the root, 0, with the two
+    # children of a node next to each other. For each there is the box
+    # around all its items (nodeMins and nodeMaxs), its first child (-1 for
+    # leaves), and the items under it: order[nodeFirst:nodeFirst + nodeCount].
+    def _Build(self, mins, maxs):
+        nItems = len(mins)
+        order = numpy.arange(nItems)
+        levels = []
+
+        # The boxes and their centers are kept in the order of order, each
+        # with a spare row on the end for _SegmentReduce
+        boxes = numpy.empty((nItems + 1, 9))
+        boxes[:nItems, 0:3] = mins
+        boxes[:nItems, 3:6] = maxs
+        boxes[:nItems, 6:9] = (mins + maxs) * 0.5
+        boxes[nItems] = 0.0
+
+        starts = numpy.zeros(min(nItems, 1), numpy.intp)
+        ends = numpy.array([nItems] * len(starts), numpy.intp)
+        nNodes = 0
+        while len(starts):
+            nLevel = len(starts)
+            nNodes += nLevel
+            lo = _SegmentReduce(numpy.minimum, boxes[:, 0:3], starts, ends)
+            hi = _SegmentReduce(numpy.maximum, boxes[:, 3:6], starts, ends)
+
+            bSplit = (ends - starts) > self.leafSize
+            nSplit = int(bSplit.sum())
+            child = numpy.full(nLevel, -1, numpy.intp)
+            child[bSplit] = nNodes + 2 * numpy.arange(nSplit)
+            levels.append((lo, hi, child, starts, ends - starts))
+            if nSplit == 0:
+                break
+
+            # Sort the items of each node being split along its axis, then
+            # cut it in two in the middle
+            s = starts[bSplit]
+            e = ends[bSplit]
+            centers = boxes[:, 6:9]
+            cLo = _SegmentReduce(numpy.minimum, centers, s, e)
+            extent = _SegmentReduce(numpy.maximum, centers, s, e) - cLo
+            axis = numpy.argmax(extent, axis=1)
+            scale = 0.5 / numpy.maximum(extent[numpy.arange(nSplit), axis], 1e-300)
+            counts = e - s
+            segment = numpy.repeat(numpy.arange(nSplit), counts)
+            positions = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts - s, counts)
+
+            # One sort does every node: each item's key is its node's number
+            # plus where it is along the axis, scaled to within 0 to 1/2
+            axis = axis[segment]
+            keys = segment + (centers[positions, axis] - cLo[segment, axis]) * scale[segment]
+            moved = positions[numpy.argsort(keys)]
+            order[positions] = order.take(moved)
+            boxes[positions] = boxes.take(moved, axis=0)
+
+            middle = (s + e) // 2
+            starts = numpy.column_stack((s, middle)).ravel()
+            ends = numpy.column_stack((middle, e)).ravel()
+
+        if levels:
+            (lo, hi, child, first, count) = [numpy.concatenate(arrays) for arrays in zip(*levels)]
+        else:
+            lo = hi = numpy.zeros((0, 3))
+            child = first = count = numpy.zeros(0, numpy.intp)
+        self._SetNodes(lo, hi, child, first, count, order)
+
+    def _SetNodes(self, lo, hi, child, first, count, order):
+        self.nodeMins = lo
+        self.nodeMaxs = hi
+        self.nodeChild = child
+        self.nodeFirst = first
+        self.nodeCount = count
+        self.order = order
+
+        # Plain lists are much quicker than numpy arrays to walk one node at
+        # a time
+        self._nodes = list(zip(lo[:, 0].tolist(), lo[:, 1].tolist(), lo[:, 2].tolist(),
+                               hi[:, 0].tolist(), hi[:, 1].tolist(), hi[:, 2].tolist(),
+                               child.tolist(), first.tolist(), count.tolist()))
+        self._order = order.tolist()
+
+    # Write the tree to file (a file name or an open file) as a numpy .npz
+    # archive; numpy adds .npz to names without it
+    def Save(self, file):
+        numpy.savez(file, leafSize=self.leafSize, nodeMins=self.nodeMins, nodeMaxs=self.nodeMaxs,
+                    nodeChild=self.nodeChild, nodeFirst=self.nodeFirst, nodeCount=self.nodeCount,
+                    order=self.order, boxHash=self.boxHash)
+
+    # The nearest item hit by the ray from vOrigin along vDirection, as
+    # (item, t) with t the distance along the ray in lengths of vDirection,
+    # or None if nothing is hit before tMax. Nodes are visited near side
+    # first, and ones starting beyond the nearest hit so far are skipped.
+    def Raycast(self, vOrigin, vDirection, hit, tMax = _INFINITY):
+        nodes = self._nodes
+        if not nodes:
+            return None
+        order = self._order
+        (ox, oy, oz) = (vOrigin[0], vOrigin[1], vOrigin[2])
+        ray = (ox, oy, oz,
+               1.0 / vDirection[0] if vDirection[0] != 0.0 else _HUGE,
+               1.0 / vDirection[1] if vDirection[1] != 0.0 else _HUGE,
+               1.0 / vDirection[2] if vDirection[2] != 0.0 else _HUGE)
+
+        best = None
+        tNear = _RayBox(ray, nodes[0], tMax)
+        stack = [(tNear, 0)] if tNear is not None else []
+        while stack:
+            (tNear, i) = stack.pop()
+            if tNear > tMax:
+                continue
+            node = nodes[i]
+            child = node[6]
+            if child < 0:
+                for item in order[node[7]:node[7] + node[8]]:
+                    t = hit(item)
+                    if t is not None and t <= tMax:
+                        (best, tMax) = (item, t)
+                continue
+
+            # Push the far child first, so the near one is taken next
+            t0 = _RayBox(ray, nodes[child], tMax)
+            t1 = _RayBox(ray, nodes[child + 1], tMax)
+            if t0 is None:
+                if t1 is not None:
+                    stack.append((t1, child + 1))
+            elif t1 is None:
+                stack.append((t0, child))
+            elif t0 <= t1:
+                stack.append((t1, child + 1))
+                stack.append((t0, child))
+            else:
+                stack.append((t0, child))
+                stack.append((t1, child + 1))
+
+        if best is None:
+            return None
+        return (best, tMax)
+
+    # The items whose boxes are at least partly inside the frustum planes
+    # (as from m3dExtractFrustumPlanes), as a list. With vEye, the nodes
+    # with centers nearer it are gone into first, so the items come out
+    # roughly front to back. Like m3dBoxesInFrustum this is conservative.
+    #
+    # A node wholly in front of a plane has all its children in front of it
+    # too, so the planes left to test are passed down as bits and the nodes
+    # inside all six are taken without testing any more.
+    def QueryFrustum(self, planes, vEye = None):
+        nodes = self._nodes
+        if not nodes:
+            return []
+        order = self._order
+        planes = numpy.asarray(planes, numpy.float64).reshape(6, 4).tolist()
+        planes = [(bit, a, b, c, d, abs(a), abs(b), abs(c)) for (bit, (a, b, c, d)) in zip((1, 2, 4, 8, 16, 32), planes)]
+
+        items = []
+        stack = [(0, _ALL_PLANES)]
+        while stack:
+            (i, mask) = stack.pop()
+            node = nodes[i]
+            if mask:
+                mask = _BoxPlanes(node, planes, mask)
+                if mask < 0:
+                    continue
+            child = node[6]
+            if child < 0:
+                items.extend(order[node[7]:node[7] + node[8]])
+            elif vEye is not None and _CenterDistance(nodes[child + 1], vEye) < _CenterDistance(nodes[child], vEye):
+                stack.append((child, mask))
+                stack.append((child + 1, mask))
+            else:
+                stack.append((child + 1, mask))
+                stack.append((child, mask))
+        return items
+
+
+# A hierarchy saved with Save, read back from file (a file name or an open
+# file)
+def LoadBoundingVolumeHierarchy(file):
+    archive = numpy.load(file)
+    bvh = BoundingVolumeHierarchy(numpy.zeros((0, 3)), numpy.zeros((0, 3)), int(archive['leafSize']))
+    bvh._SetNodes(archive['nodeMins'], archive['nodeMaxs'], archive['nodeChild'],
+                  archive['nodeFirst'], archive['nodeCount'], archive['order'])
+    bvh.boxHash = str(archive['boxHash']) if 'boxHash' in archive.files else None
+    archive.close()
+    return bvh
+
+# A digest of the boxes mins and maxs, (N,3), as a string, which changes if
+# any corner of any box does
+def BoxesHash(mins, maxs):
+    digest = sha1(numpy.ascontiguousarray(mins, numpy.float64).tobytes())
+    digest.update(numpy.ascontiguousarray(maxs, numpy.float64).tobytes())
+    return digest.hexdigest()
+
+
+# The distance along ray, (origin, 1 / direction), to where it enters the box
+# of node, or None if it misses it or only meets it behind the origin or
+# beyond tMax
+def _RayBox(ray, node, tMax):
+    (ox, oy, oz, ix, iy, iz) = ray
+    t0 = (node[0] - ox) * ix
+    t1 = (node[3] - ox) * ix
+    if t0 > t1:
+        (t0, t1) = (t1, t0)
+    s0 = (node[1] - oy) * iy
+    s1 = (node[4] - oy) * iy
+    if s0 > s1:
+        (s0, s1) = (s1, s0)
+    if s0 > t0:
+        t0 = s0
+    if s1 < t1:
+        t1 = s1
+    s0 = (node[2] - oz) * iz
+    s1 = (node[5] - oz) * iz
+    if s0 > s1:
+        (s0, s1) = (s1, s0)
+    if s0 > t0:
+        t0 = s0
+    if s1 < t1:
+        t1 = s1
+    if t0 > t1 or t1 < 0.0 or t0 > tMax:
+        return None
+    return max(t0, 0.0)
+
+# Test node's box against the planes whose bits are in mask. Returns -1 if it
+# is wholly behind one of them, or else mask without the planes it is wholly
+# in front of.
+def _BoxPlanes(node, planes, mask):
+    cx = (node[0] + node[3]) * 0.5
+    cy = (node[1] + node[4]) * 0.5
+    cz = (node[2] + node[5]) * 0.5
+    ex = (node[3] - node[0]) * 0.5
+    ey = (node[4] - node[1]) * 0.5
+    ez = (node[5] - node[2]) * 0.5
+    for (bit, a, b, c, d, aa, ab, ac) in planes:
+        if mask & bit:
+            distance = a * cx + b * cy + c * cz + d
+            reach = aa * ex + ab * ey + ac * ez
+            if distance < -reach:
+                return -1
+            if distance >= reach:
+                mask &= ~bit
+    return mask
+
+# The square of the distance from vPoint to the center of node's box
+def _CenterDistance(node, vPoint):
+    x = (node[0] + node[3]) * 0.5 - vPoint[0]
+    y = (node[1] + node[4]) * 0.5 - vPoint[1]
+    z = (node[2] + node[5]) * 0.5 - vPoint[2]
+    return x * x + y * y + z * z
+
+# ufunc reduced over rows [starts[i], ends[i]) of values for each i. The
+# ranges must not be empty, and values needs a row past the last end.
+def _SegmentReduce(ufunc, values, starts, ends):
+    # reduceat reduces from each index to the next, so give it the start and
+    # end of each range in turn
+    indices = numpy.column_stack((starts, ends)).ravel()
+    return ufunc.reduceat(values, indices)[0::2]
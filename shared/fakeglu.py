@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+# Python implementations of the GLU quadrics. The shapes are built with numpy,
+# with the same normals and texture coordinates as GLU's, and kept in
+# meshCache, so drawing one is a single glDrawElements call rather than a
+# fresh tessellation and a glBegin/glEnd per strip every time.
+#
+# Import these after pyglet.gl to use them in place of GLU's:
+#   from pyglet.gl import *
+#   from fakeglu import gluNewQuadric, gluDeleteQuadric, gluSphere
+
+from math import sqrt
+from pyglet.gl import *
+from meshcache import meshCache, gltGridStrips, gltDrawMesh
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The state of a quadric, as set by the gluQuadric* functions below
+class GLUQuadric(object):
+    def __init__(self):
+        self.drawStyle = GLU_FILL
+        self.normals = GLU_SMOOTH
+        self.orientation = GLU_OUTSIDE
+        self.texture = False
+
+def gluNewQuadric():
+    return GLUQuadric()
+
+# Nothing to free, but kept so code written for GLU runs unchanged
+def gluDeleteQuadric(quad):
+    pass
+
+def gluQuadricDrawStyle(quad, drawStyle):
+    quad.drawStyle = drawStyle
+
+def gluQuadricNormals(quad, normals):
+    quad.normals = normals
+
+def gluQuadricOrientation(quad, orientation):
+    quad.orientation = orientation
+
+def gluQuadricTexture(quad, texture):
+    quad.texture = bool(texture)
+
+
+# The shapes are built as a (rows, cols, 8) grid of vertices, laid out as in
+# meshcache, with the normals pointing outside and the strips of
+# gltGridStrips facing outside.
+
+# Slices around the z axis, from +y towards +x, and stacks from -z to +z. As
+# in GLU, s runs the other way round, from 1 at +y down to 0, so s = 0.75 is
+# at +x and textures aren't mirrored.
+def _SphereGrid(radius, slices, stacks):
+    theta = numpy.arange(slices + 1) * (2.0 * numpy.pi / slices)
+    t = numpy.arange(stacks + 1) / float(stacks)
+    phi = (numpy.pi * (1.0 - t))[:, numpy.newaxis]
+
+    grid = numpy.empty((stacks + 1, slices + 1, 8), numpy.float32)
+    grid[:, :, 0] = 1.0 - numpy.arange(slices + 1) / float(slices)
+    grid[:, :, 1] = t[:, numpy.newaxis]
+    grid[:, :, 2] = numpy.sin(phi) * numpy.sin(theta)
+    grid[:, :, 3] = numpy.sin(phi) * numpy.cos(theta)
+    grid[:, :, 4] = numpy.cos(phi)
+    grid[:, :, 5:8] = grid[:, :, 2:5] * radius
+    return grid
+
+# Slices around the z axis, from +y towards +x, and stacks from z = 0 to height,
+# with s running from 1 down to 0 as for the sphere
+def _CylinderGrid(base, top, height, slices, stacks):
+    theta = numpy.arange(slices + 1) * (2.0 * numpy.pi / slices)
+    j = numpy.arange(stacks + 1) / float(stacks)
+    r = (base + (top - base) * j)[:, numpy.newaxis]
+
+    # The normals lean back by the slope of the side
+    length = sqrt((base - top) * (base - top) + height * height)
+    xyNormal = height / length
+
+    grid = numpy.empty((stacks + 1, slices + 1, 8), numpy.float32)
+    grid[:, :, 0] = 1.0 - numpy.arange(slices + 1) / float(slices)
+    grid[:, :, 1] = j[:, numpy.newaxis]
+    grid[:, :, 2] = numpy.sin(theta) * xyNormal
+    grid[:, :, 3] = numpy.cos(theta) * xyNormal
+    grid[:, :, 4] = (base - top) / length
+    grid[:, :, 5] = numpy.sin(theta) * r
+    grid[:, :, 6] = numpy.cos(theta) * r
+    grid[:, :, 7] = (height * j)[:, numpy.newaxis]
+    return grid
+
+# Slices from startAngle through sweepAngle (degrees clockwise from +y), and
+# loops from the outer radius in to the inner one, in the z = 0 plane
+def _DiskGrid(innerRadius, outerRadius, slices, loops, startAngle, sweepAngle):
+    theta = numpy.radians(startAngle + sweepAngle * numpy.arange(slices + 1) / float(slices))
+    r = (outerRadius - (outerRadius - innerRadius) * numpy.arange(loops + 1) / float(loops))[:, numpy.newaxis]
+    x = r * numpy.sin(theta)
+    y = r * numpy.cos(theta)
+
+    grid = numpy.zeros((loops + 1, slices + 1, 8), numpy.float32)
+    # The texture is laid flat over the whole disk
+    grid[:, :, 0] = 0.5 + x / (2.0 * outerRadius)
+    grid[:, :, 1] = 0.5 + y / (2.0 * outerRadius)
+    grid[:, :, 4] = 1.0
+    grid[:, :, 5] = x
+    grid[:, :, 6] = y
+    return grid
+
+# Indices for GL_LINES along the given rows and columns of a grid
+def _GridLines(rows, cols, lineRows, lineCols):
+    grid = numpy.arange(rows * cols, dtype=numpy.uint32).reshape(rows, cols)
+    along = numpy.dstack((grid[lineRows, :-1], grid[lineRows, 1:]))
+    across = numpy.dstack((grid[:-1, lineCols].T, grid[1:, lineCols].T))
+    return numpy.concatenate((along.ravel(), across.ravel()))
+
+# Each cell of the grid as a quad with its own normal, for GLU_FLAT
+def _FlatQuads(grid):
+    quads = numpy.empty(grid[1:, 1:].shape[:2] + (4, 8), numpy.float32)
+    quads[:, :, 0] = grid[:-1, :-1]
+    quads[:, :, 1] = grid[1:, :-1]
+    quads[:, :, 2] = grid[1:, 1:]
+    quads[:, :, 3] = grid[:-1, 1:]
+
+    # The cross product of the diagonals, which works for the cells at the
+    # poles that have two corners in the same place too
+    p = quads[:, :, :, 5:8]
+    normals = numpy.cross(p[:, :, 2] - p[:, :, 0], p[:, :, 3] - p[:, :, 1])
+    length = numpy.sqrt((normals * normals).sum(2))[:, :, numpy.newaxis]
+    quads[:, :, :, 2:5] = (normals / numpy.where(length > 0.0, length, 1.0))[:, :, numpy.newaxis]
+    return quads.reshape(-1, 8)
+
+# Turn a grid into a mesh for the quadric's draw style, normals and
+# orientation. Only the lines along silhouetteRows and silhouetteCols are
+# drawn for GLU_SILHOUETTE.
+def _MakeMesh(grid, drawStyle, normals, orientation, silhouetteRows, silhouetteCols):
+    if orientation == GLU_INSIDE:
+        # Going round the other way turns the strips inside out
+        grid = grid[:, ::-1].copy()
+        grid[:, :, 2:5] *= -1.0
+    (rows, cols) = grid.shape[:2]
+
+    if drawStyle == GLU_FILL:
+        if normals == GLU_FLAT:
+            vertices = _FlatQuads(grid)
+            return (vertices, numpy.arange(len(vertices), dtype=numpy.uint32))
+        indices = gltGridStrips(rows, cols)
+    elif drawStyle == GLU_POINT:
+        indices = numpy.arange(rows * cols, dtype=numpy.uint32)
+    elif drawStyle == GLU_SILHOUETTE:
+        indices = _GridLines(rows, cols, silhouetteRows, silhouetteCols)
+    else:
+        indices = _GridLines(rows, cols, slice(None), slice(None))
+    return (grid.reshape(-1, 8), indices)
+
+_drawModes = {GLU_LINE: GL_LINES, GLU_SILHOUETTE: GL_LINES, GLU_POINT: GL_POINTS}
+
+# The mesh for the quadric, and the mode to draw it with
+def _QuadricMesh(quad, key, build, silhouetteRows = slice(None), silhouetteCols = slice(None)):
+    # Only GLU_FLAT changes the mesh; with GLU_NONE the normals are just
+    # left out
+    bFlat = (quad.normals == GLU_FLAT and quad.drawStyle == GLU_FILL)
+    key = key + (quad.drawStyle, bFlat, quad.orientation)
+    mesh = meshCache.Get(key, lambda: _MakeMesh(build(), quad.drawStyle, quad.normals, quad.orientation,
+                                                silhouetteRows, silhouetteCols))
+    if bFlat:
+        return (mesh, GL_QUADS)
+    return (mesh, _drawModes.get(quad.drawStyle, GL_TRIANGLE_STRIP))
+
+def _DrawQuadric(quad, key, build, silhouetteRows = slice(None), silhouetteCols = slice(None)):
+    (mesh, mode) = _QuadricMesh(quad, key, build, silhouetteRows, silhouetteCols)
+    gltDrawMesh(mesh, mode, quad.texture, quad.normals != GLU_NONE)
+
+def gluSphere(quad, radius, slices, stacks):
+    _DrawQuadric(quad, ('gluSphere', radius, slices, stacks),
+                 lambda: _SphereGrid(radius, slices, stacks))
+
+# Not in GLU: the (mesh, mode) gluSphere draws, for drawing it some other way,
+# such as from a MeshBuffer. The mesh is from meshCache, so don't modify it.
+def gluSphereMesh(quad, radius, slices, stacks):
+    return _QuadricMesh(quad, ('gluSphere', radius, slices, stacks),
+                        lambda: _SphereGrid(radius, slices, stacks))
+
+# The silhouette is the lines up the sides and the circles at each end
+def gluCylinder(quad, base, top, height, slices, stacks):
+    _DrawQuadric(quad, ('gluCylinder', base, top, height, slices, stacks),
+                 lambda: _CylinderGrid(base, top, height, slices, stacks),
+                 [0, -1], slice(None))
+
+def gluDisk(quad, innerRadius, outerRadius, slices, loops):
+    gluPartialDisk(quad, innerRadius, outerRadius, slices, loops, 0.0, 360.0)
+
+# The silhouette is the inner and outer edges, and the straight edges of a
+# partial disk
+def gluPartialDisk(quad, innerRadius, outerRadius, slices, loops, startAngle, sweepAngle):
+    if sweepAngle < -360.0 or sweepAngle > 360.0:
+        sweepAngle = 360.0
+    if sweepAngle < 0.0:
+        startAngle += sweepAngle
+        sweepAngle = -sweepAngle
+    silhouetteCols = []
+    if sweepAngle != 360.0:
+        silhouetteCols = [0, -1]
+    _DrawQuadric(quad, ('gluPartialDisk', innerRadius, outerRadius, slices, loops, startAngle, sweepAngle),
+                 lambda: _DiskGrid(innerRadius, outerRadius, slices, loops, startAngle, sweepAngle),
+                 [0, -1], silhouetteCols)
+
+
+# Without numpy, use GLU's own
+if numpy is None:
+    from pyglet.gl import gluNewQuadric, gluDeleteQuadric, gluQuadricDrawStyle, gluQuadricNormals
+    from pyglet.gl import gluQuadricOrientation, gluQuadricTexture
+    from pyglet.gl import gluSphere, gluCylinder, gluDisk, gluPartialDisk
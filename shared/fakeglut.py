@@ -7,24 +7,78 @@
 
 from pyglet.gl import *
 from math import cos, sin, sqrt, pi as M_PI
+from meshcache import meshCache, gltGridStrips, gltDrawMesh
+from fakeglu import gluNewQuadric, gluDeleteQuadric, gluQuadricDrawStyle, gluQuadricNormals, gluQuadricTexture
+from fakeglu import gluSphere, gluCylinder
+
+# The shapes here are built as meshes with numpy and kept in meshCache, so
+# they are only tessellated once. Without numpy they are drawn a vertex at a
+# time.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Lay out flat shaded faces as a mesh: positions is (faces, sides, 3) and
+# normals (faces, 3). With bWire the indices are the outline of each face,
+# for GL_LINES, otherwise the vertices in order.
+def _MakeFaces(positions, normals, bWire):
+    (numFaces, numSides) = positions.shape[:2]
+    vertices = numpy.zeros((numFaces, numSides, 8), numpy.float32)
+    vertices[:, :, 2:5] = normals[:, numpy.newaxis]
+    vertices[:, :, 5:8] = positions
+    indices = numpy.arange(numFaces * numSides, dtype=numpy.uint32)
+    if bWire:
+        faces = indices.reshape(numFaces, numSides)
+        indices = numpy.dstack((faces, numpy.roll(faces, -1, axis=1))).ravel()
+    return (vertices.reshape(-1, 8), indices)
+
+# Draw flat shaded faces from the cache as the immediate mode code would with
+# glBegin(type), where type is GL_LINE_LOOP for an outline
+def _DrawFaces(key, build, type):
+    bWire = (type == GL_LINE_LOOP)
+    mesh = meshCache.Get(key + (bWire,), lambda: build(bWire))
+    if bWire:
+        type = GL_LINES
+    gltDrawMesh(mesh, type, False)
+
+boxNormals = ((GLfloat * 3) * 6)((-1.0, 0.0, 0.0),
+                                  (0.0, 1.0, 0.0),
+                                  (1.0, 0.0, 0.0),
+                                  (0.0, -1.0, 0.0),
+                                  (0.0, 0.0, 1.0),
+                                  (0.0, 0.0, -1.0))
+
+boxFaces = ((GLint * 4) * 6)((0, 1, 2, 3),
+                             (3, 2, 6, 7),
+                             (7, 6, 5, 4),
+                             (4, 5, 1, 0),
+                             (5, 6, 2, 1),
+                             (7, 4, 0, 3))
+
+def _MakeBox(size, bWire):
+    v = numpy.array(((-1.0, -1.0, -1.0),
+                     (-1.0, -1.0, 1.0),
+                     (-1.0, 1.0, 1.0),
+                     (-1.0, 1.0, -1.0),
+                     (1.0, -1.0, -1.0),
+                     (1.0, -1.0, 1.0),
+                     (1.0, 1.0, 1.0),
+                     (1.0, 1.0, -1.0))) * (size / 2.0)
+    faces = numpy.array([list(face) for face in boxFaces])
+    normals = numpy.array([list(normal) for normal in boxNormals])
+    return _MakeFaces(v[faces], normals, bWire)
 
 # translated from mesagl's glut library.
 def drawBox(size, type):
-    n = ((GLfloat * 3) * 6)((-1.0, 0.0, 0.0),
-                            (0.0, 1.0, 0.0),
-                            (1.0, 0.0, 0.0),
-                            (0.0, -1.0, 0.0),
-                            (0.0, 0.0, 1.0),
-                            (0.0, 0.0, -1.0))
-    
-    faces = ((GLint * 4) * 6)((0, 1, 2, 3),
-                                (3, 2, 6, 7),
-                                (7, 6, 5, 4),
-                                (4, 5, 1, 0),
-                                (5, 6, 2, 1),
-                                (7, 4, 0, 3))
-    v = ((GLfloat * 3) * 8)()
     size = float(size)
+    if numpy is not None:
+        _DrawFaces(('box', size), lambda bWire: _MakeBox(size, bWire), type)
+        return
+
+    n = boxNormals
+    faces = boxFaces
+    v = ((GLfloat * 3) * 8)()
     v[0][0] = v[1][0] = v[2][0] = v[3][0] = -size / 2.0
     v[4][0] = v[5][0] = v[6][0] = v[7][0] = size / 2.0
     v[0][1] = v[1][1] = v[4][1] = v[5][1] = -size / 2.0
@@ -32,7 +86,7 @@ def drawBox(size, type):
     v[0][2] = v[3][2] = v[4][2] = v[7][2] = -size / 2.0
     v[1][2] = v[2][2] = v[5][2] = v[6][2] = size / 2.0
 
-    for i in range(5):
+    for i in range(6):
         glBegin(type)
         glNormal3fv(n[i])
         glVertex3fv(v[faces[i][0]])
@@ -53,6 +107,7 @@ def glutSolidCone(base, height, slices, stacks):
     gluQuadricDrawStyle(quad, GLU_FILL)
     gluQuadricNormals(quad, GLU_SMOOTH)
     gluCylinder(quad, base, 0.0, height, slices, stacks)
+    gluDeleteQuadric(quad)
 
 def glutSolidSphere(radius, slices, stacks):
     sphere = gluNewQuadric()
@@ -60,7 +115,32 @@ def glutSolidSphere(radius, slices, stacks):
     gluSphere(sphere, radius, slices, stacks)
     gluDeleteQuadric(sphere)
 
+# The rows of the grid go backwards round the rings, so that each strip runs
+# from one ring to the one before, as below; each row starts a side in, and
+# ends where it started.
+def _MakeDoughnut(r, R, nsides, rings):
+    theta = numpy.arange(rings, -1, -1)[:, numpy.newaxis] * (2.0 * M_PI / rings)
+    phi = numpy.arange(1, nsides + 2) * (2.0 * M_PI / nsides)
+    cosPhi = numpy.cos(phi)
+    sinPhi = numpy.sin(phi)
+    dist = R + r * cosPhi
+
+    vertices = numpy.zeros((rings + 1, nsides + 1, 8), numpy.float32)
+    vertices[:, :, 2] = numpy.cos(theta) * cosPhi
+    vertices[:, :, 3] = -numpy.sin(theta) * cosPhi
+    vertices[:, :, 4] = sinPhi
+    vertices[:, :, 5] = numpy.cos(theta) * dist
+    vertices[:, :, 6] = -numpy.sin(theta) * dist
+    vertices[:, :, 7] = r * sinPhi
+    return (vertices.reshape(-1, 8), gltGridStrips(rings + 1, nsides + 1))
+
 def doughnut(r, R, nsides, rings):
+    if numpy is not None:
+        mesh = meshCache.Get(('doughnut', r, R, nsides, rings),
+                             lambda: _MakeDoughnut(r, R, nsides, rings))
+        gltDrawMesh(mesh, GL_TRIANGLE_STRIP, False)
+        return
+
     ringDelta = 2.0 * M_PI / float(rings)
     sideDelta = 2.0 * M_PI / float(nsides)
 
@@ -101,87 +181,6 @@ def glutWireTorus(innerRadius, outerRadius, nsides, rings):
 def glutSolidTorus(innerRadius, outerRadius, nsides, rings):
     doughnut(innerRadius, outerRadius, nsides, rings)
 
-def DIFF3(v1, v2, result):
-    result[0] = v1[0] - v2[0]
-    result[1] = v1[1] - v2[1]
-    result[2] = v1[2] - v2[2]
-    
-def crossprod(v1, v2, prod):
-    p = (GLfloat * 3)()
-    p[0] = v1[1] * v2[2] - v2[1] * v1[2]
-    p[1] = v1[2] * v2[0] - v2[2] * v1[0]
-    p[2] = v1[0] * v2[1] - v2[0] * v1[1]
-    prod[0] = p[0]
-    prod[1] = p[1]
-    prod[2] = p[2]
-    
-def normalize(v):
-    d = sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2]);
-    
-    if d == 0.0:
-        raise(Exception("normalize: zero length vector"))
-    d = 1.0 / d
-    v[0] *= d
-    v[1] *= d
-    v[2] *= d
-
-
-def recorditem(n1, n2, n3, shadeType):
-    q0 = (GLfloat * 3)()
-    q1 = (GLfloat * 3)()
-    
-    DIFF3(n1, n2, q0)
-    DIFF3(n2, n3, q1)
-    crossprod(q0, q1, q1)
-    normalize(q1)
-    
-    glBegin(shadeType)
-    glNormal3fv(q1)
-    glVertex3fv(n1)
-    glVertex3fv(n2)
-    glVertex3fv(n3)
-    glEnd()
-    
-def subdivide(v0, v1, v2, shadeType):
-    w0 = (GLfloat * 3)()
-    w1 = (GLfloat * 3)()
-    w2 = (GLfloat * 3)()
-    
-    depth = 1
-    for i in range(depth):
-        ii = float(i)
-        j = 0
-        while i + j < depth:
-            jj = float(j)
-            k = depth - i - j
-            kk = float(k)
-            fdepth = float(depth)
-            for n in range(3):
-                w0[n] = (ii * v0[n] + jj * v1[n] + k * v2[n]) / fdepth
-                w1[n] = ((ii + 1.0) * v0[n] + jj * v1[n] + (kk - 1.0) * v2[n]) / fdepth
-                w2[n] = (ii * v0[n] + (jj + 1) * v1[n] + (kk - 1.0) * v2[n]) / fdepth
-
-            l = sqrt(w0[0] * w0[0] + w0[1] * w0[1] + w0[2] * w0[2])
-            w0[0] /= l
-            w0[1] /= l
-            w0[2] /= l
-            l = sqrt(w1[0] * w1[0] + w1[1] * w1[1] + w1[2] * w1[2])
-            w1[0] /= l
-            w1[1] /= l
-            w1[2] /= l
-            l = sqrt(w2[0] * w2[0] + w2[1] * w2[1] + w2[2] * w2[2])
-            w2[0] /= l
-            w2[1] /= l
-            w2[2] /= l
-            recorditem(w1, w0, w2, shadeType)
-            j += 1
-
-def drawtriangle(i, data, ndx, shadeType):
-    x0 = data[ndx[i][0]]
-    x1 = data[ndx[i][1]]
-    x2 = data[ndx[i][2]]
-    subdivide(x0, x1, x2, shadeType)
-
 # octahedron data: The octahedron produced is centered at the
 #   origin and has radius 1.0
 odata = ((GLfloat * 3) * 6)(
@@ -205,13 +204,165 @@ ondex = ((GLint * 3) * 8)(
   (1, 3, 5)
 )
 
-def octahedron(shadeType):
-    for i in range(7, -1, -1):
-        drawtriangle(i, odata, ondex, shadeType)
+# The octahedron's faces split by _SubdivideSphere, last face first as mesa's
+# glut draws them, each flat shaded with its own normal
+def _MakeOctahedron(depth, bWire):
+    (points, faces) = _SubdivideSphere(_Polyhedron(odata), _PolyhedronFaces(ondex)[::-1], depth)
+    corners = points[faces]
+    normals = numpy.cross(corners[:, 0] - corners[:, 1], corners[:, 1] - corners[:, 2])
+    normals /= numpy.sqrt((normals * normals).sum(1))[:, numpy.newaxis]
+    return _MakeFaces(corners, normals, bWire)
+
+# The octahedron, flat shaded, with each face split into four depth times
+# over, bulging out to the sphere around it. At depth 0 it is mesa's
+# octahedron.
+def octahedron(shadeType, depth = 0):
+    if numpy is not None:
+        _DrawFaces(('octahedron', depth), lambda bWire: _MakeOctahedron(depth, bWire), shadeType)
+        return
+
+    for face in reversed(list(ondex)):
+        _DrawSubdivided(odata[face[0]], odata[face[2]], odata[face[1]], depth, shadeType)
+
+# Without numpy: split a triangle as _SubdivideSphere does and draw the
+# pieces a vertex at a time
+def _DrawSubdivided(v0, v1, v2, depth, shadeType):
+    if depth > 0:
+        m01 = _Middle(v0, v1)
+        m12 = _Middle(v1, v2)
+        m20 = _Middle(v2, v0)
+        _DrawSubdivided(v0, m01, m20, depth - 1, shadeType)
+        _DrawSubdivided(m01, v1, m12, depth - 1, shadeType)
+        _DrawSubdivided(m20, m12, v2, depth - 1, shadeType)
+        _DrawSubdivided(m01, m12, m20, depth - 1, shadeType)
+        return
+
+    (ax, ay, az) = (v0[0] - v1[0], v0[1] - v1[1], v0[2] - v1[2])
+    (bx, by, bz) = (v1[0] - v2[0], v1[1] - v2[1], v1[2] - v2[2])
+    (nx, ny, nz) = (ay * bz - az * by, az * bx - ax * bz, ax * by - ay * bx)
+    l = sqrt(nx * nx + ny * ny + nz * nz)
+    glBegin(shadeType)
+    glNormal3f(nx / l, ny / l, nz / l)
+    glVertex3f(v0[0], v0[1], v0[2])
+    glVertex3f(v1[0], v1[1], v1[2])
+    glVertex3f(v2[0], v2[1], v2[2])
+    glEnd()
+
+# The point halfway between two on the unit sphere, pushed out onto it
+def _Middle(a, b):
+    (x, y, z) = (a[0] + b[0], a[1] + b[1], a[2] + b[2])
+    l = sqrt(x * x + y * y + z * z)
+    return (x / l, y / l, z / l)
+
+def glutWireOctahedron(depth = 0):
+    octahedron(GL_LINE_LOOP, depth)
+
+def glutSolidOctahedron(depth = 0):
+    octahedron(GL_TRIANGLES, depth)
+
+# icosahedron data: These numbers are rigged to make an
+#   icosahedron of radius 1.0
+icoX = .525731112119133606
+icoZ = .850650808352039932
+
+idata = ((GLfloat * 3) * 12)(
+  (-icoX, 0, icoZ),
+  (icoX, 0, icoZ),
+  (-icoX, 0, -icoZ),
+  (icoX, 0, -icoZ),
+  (0, icoZ, icoX),
+  (0, icoZ, -icoX),
+  (0, -icoZ, icoX),
+  (0, -icoZ, -icoX),
+  (icoZ, icoX, 0),
+  (-icoZ, icoX, 0),
+  (icoZ, -icoX, 0),
+  (-icoZ, -icoX, 0)
+)
+
+index = ((GLint * 3) * 20)(
+  (0, 4, 1),
+  (0, 9, 4),
+  (9, 5, 4),
+  (4, 5, 8),
+  (4, 8, 1),
+  (8, 10, 1),
+  (8, 3, 10),
+  (5, 3, 8),
+  (5, 2, 3),
+  (2, 7, 3),
+  (7, 10, 3),
+  (7, 6, 10),
+  (7, 11, 6),
+  (11, 0, 6),
+  (0, 1, 6),
+  (6, 1, 10),
+  (9, 0, 11),
+  (9, 11, 2),
+  (9, 2, 5),
+  (7, 2, 11)
+)
+
+# The points of one of the polyhedra above as an array
+def _Polyhedron(data):
+    return numpy.array([list(point) for point in data])
+
+# Its faces, wound as mesa's glut draws them, (v0, v2, v1)
+def _PolyhedronFaces(ndx):
+    return numpy.array([list(face) for face in ndx])[:, (0, 2, 1)]
+
+# Split each triangle of a polyhedron inscribed in the unit sphere into four,
+# depth times over, pushing the new points out onto the sphere. Points are
+# shared by all the triangles that meet at them; each edge is split once,
+# found by sorting the edges of all the triangles together. Returns the
+# points and the faces as (N,3) arrays.
+def _SubdivideSphere(points, faces, depth):
+    for level in range(depth):
+        numFaces = len(faces)
+        edges = numpy.concatenate((faces[:, (0, 1)], faces[:, (1, 2)], faces[:, (2, 0)]))
+        edges.sort(axis=1)
+        (first, inverse) = numpy.unique(edges[:, 0] * len(points) + edges[:, 1],
+                                        return_index=True, return_inverse=True)[1:]
+        middles = points[edges[first, 0]] + points[edges[first, 1]]
+        middles /= numpy.sqrt((middles * middles).sum(1))[:, numpy.newaxis]
+
+        # The middles of each triangle's edges, numbered after the old points
+        (m01, m12, m20) = inverse.reshape(3, numFaces) + len(points)
+        (v0, v1, v2) = faces.T
+        points = numpy.concatenate((points, middles))
+        faces = numpy.concatenate((numpy.column_stack((v0, m01, m20)),
+                                   numpy.column_stack((m01, v1, m12)),
+                                   numpy.column_stack((m20, m12, v2)),
+                                   numpy.column_stack((m01, m12, m20))))
+    return (points, faces)
+
+# A sphere made by subdividing an icosahedron, with shared vertices, for
+# GL_TRIANGLES, or with bWire each edge once, for GL_LINES. There are no
+# texture coordinates.
+def _MakeIcosphere(radius, depth, bWire):
+    (points, faces) = _SubdivideSphere(_Polyhedron(idata), _PolyhedronFaces(index), depth)
+    vertices = numpy.zeros((len(points), 8), numpy.float32)
+    vertices[:, 2:5] = points
+    vertices[:, 5:8] = points * radius
+
+    if bWire:
+        edges = numpy.concatenate((faces[:, (0, 1)], faces[:, (1, 2)], faces[:, (2, 0)]))
+        # Every edge is in two triangles, once each way round
+        indices = edges[edges[:, 0] < edges[:, 1]]
+    else:
+        indices = faces
+    return (vertices, indices.ravel().astype(numpy.uint32))
 
-def glutWireOctahedron():
-    octahedron(GL_LINE_LOOP)
+# A sphere with fewer vertices than glutSolidSphere for the same smoothness:
+# 12 vertices and 20 triangles at depth 0, then four times the triangles for
+# each level of depth (depth 2 is 162 vertices and 320 triangles, in a
+# similar shape to glutSolidSphere(radius, 17, 9)). It needs numpy.
+def glutSolidIcosphere(radius, depth):
+    mesh = meshCache.Get(('icosphere', radius, depth, False),
+                         lambda: _MakeIcosphere(radius, depth, False))
+    gltDrawMesh(mesh, GL_TRIANGLES, False)
 
-def glutSolidOctahedron():
-    octahedron(GL_TRIANGLES)
-    
\ No newline at end of file
+def glutWireIcosphere(radius, depth):
+    mesh = meshCache.Get(('icosphere', radius, depth, True),
+                         lambda: _MakeIcosphere(radius, depth, True))
+    gltDrawMesh(mesh, GL_LINES, False)
@@ -0,0 +1,157 @@
+# Reading the results of GL_FEEDBACK mode with numpy, and a way of getting the
+# screen rectangle of an object without feedback mode at all.
+#
+# gltParseFeedback splits a feedback buffer into its records and their
+# vertices in a few array operations, however many thousands of polygons it
+# holds:
+#
+#   size = glRenderMode(GL_RENDER)
+#   records = gltParseFeedback(feedBackBuff, size, GL_2D)
+#   (left, bottom, right, top) = records.Bounds(TORUS)  # after glPassThrough(TORUS)
+#
+# gltProjectBounds finds the same rectangle by projecting a mesh's vertices
+# on the CPU, so nothing has to be drawn again to find it.
+
+import ctypes
+from pyglet.gl import *
+from math3d import m3dMatrixMultiply44
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Floats per vertex for each feedback type (in RGBA mode)
+_vertexSizes = {GL_2D: 2, GL_3D: 3, GL_3D_COLOR: 7, GL_3D_COLOR_TEXTURE: 11, GL_4D_COLOR_TEXTURE: 12}
+
+# Vertices in each kind of record, other than polygons, which give their count
+_vertexCounts = {GL_POINT_TOKEN: 1, GL_LINE_TOKEN: 2, GL_LINE_RESET_TOKEN: 2, GL_BITMAP_TOKEN: 1,
+                 GL_DRAW_PIXEL_TOKEN: 1, GL_COPY_PIXEL_TOKEN: 1, GL_PASS_THROUGH_TOKEN: 0}
+
+# The records of a feedback buffer, as arrays:
+#   tokens          (R,) the token starting each record
+#   offsets         (R,) where each record starts in the buffer
+#   values          (R,) the value of each pass-through record (NaN for others)
+#   vertices        (V, k) the vertices of all the records, in order, with k
+#                   floats each for the feedback type (x, y first)
+#   vertexRecords   (V,) the record each vertex is from
+class FeedbackRecords(object):
+    def __init__(self, tokens, offsets, values, vertices, vertexRecords):
+        self.tokens = tokens
+        self.offsets = offsets
+        self.values = values
+        self.vertices = vertices
+        self.vertexRecords = vertexRecords
+
+    def __len__(self):
+        return len(self.tokens)
+
+    # The records after the first glPassThrough(value) up to the next
+    # pass-through, as a boolean mask over the records
+    def Section(self, value):
+        marks = numpy.flatnonzero(self.values == value)
+        mask = numpy.zeros(len(self.tokens), bool)
+        if len(marks) == 0:
+            return mask
+        first = marks[0] + 1
+        later = numpy.flatnonzero(self.tokens[first:] == GL_PASS_THROUGH_TOKEN)
+        last = first + later[0] if len(later) else len(self.tokens)
+        mask[first:last] = True
+        return mask
+
+    # The (left, bottom, right, top) window rectangle around the vertices of
+    # the records of the kinds in tokens, in the section after
+    # glPassThrough(value), or all of them if value is None. None if there
+    # are no such vertices.
+    def Bounds(self, value = None, tokens = (GL_POLYGON_TOKEN,)):
+        bRecords = numpy.isin(self.tokens, tokens)
+        if value is not None:
+            bRecords &= self.Section(value)
+        xy = self.vertices[bRecords[self.vertexRecords], 0:2]
+        if len(xy) == 0:
+            return None
+        (left, bottom) = xy.min(axis=0)
+        (right, top) = xy.max(axis=0)
+        return (float(left), float(bottom), float(right), float(top))
+
+
+# Parse the first size floats of a feedback buffer, filled in feedback mode
+# with vertexType (GL_2D, GL_3D, ...).
+#
+# Records are of different lengths, so where each one starts depends on all
+# those before it. Rather than walking them one at a time, every float that
+# could be a token is taken as the start of a record, and the real records
+# are the chain of them from the first. The chain is followed by pointer
+# doubling: each pass adds the records reached by jumping twice as far as the
+# pass before, so n records take log2(n) passes.
+def gltParseFeedback(buffer, size, vertexType = GL_2D):
+    if isinstance(buffer, ctypes.Array):
+        data = numpy.ctypeslib.as_array(buffer)[:size]
+    else:
+        data = numpy.asarray(buffer, numpy.float32)[:size]
+    k = _vertexSizes[vertexType]
+
+    # The vertices and floats of the record at each candidate
+    candidates = numpy.flatnonzero((data >= GL_PASS_THROUGH_TOKEN) & (data <= GL_LINE_RESET_TOKEN))
+    tokens = data[candidates].astype(numpy.intp)
+    counts = numpy.zeros(len(candidates), numpy.intp)
+    for (token, count) in _vertexCounts.items():
+        counts[tokens == token] = count
+    bPolygon = (tokens == GL_POLYGON_TOKEN) & (candidates + 1 < size)
+    counts[bPolygon] = data[candidates[bPolygon] + 1]
+    lengths = numpy.where(bPolygon, 2, 1) + k * counts
+    lengths[tokens == GL_PASS_THROUGH_TOKEN] = 2
+
+    # The candidate after each record, if it starts where the record ends,
+    # or one past the last candidate, which leads nowhere
+    ends = candidates + lengths
+    jump = numpy.searchsorted(candidates, ends)
+    jump[(jump == len(candidates)) | (candidates[numpy.minimum(jump, len(candidates) - 1)] != ends)] = len(candidates)
+    jump = numpy.append(jump, len(candidates))
+    bReached = numpy.zeros(len(candidates) + 1, bool)
+    bReached[0] = (len(candidates) > 0 and candidates[0] == 0)
+    steps = 1
+    while steps <= len(candidates):
+        bReached[jump[bReached]] = True
+        jump = jump[jump]
+        steps *= 2
+    bReached = bReached[:-1]
+
+    offsets = candidates[bReached]
+    tokens = tokens[bReached]
+    counts = counts[bReached]
+    values = numpy.full(len(offsets), numpy.nan, numpy.float32)
+    bPassThrough = (tokens == GL_PASS_THROUGH_TOKEN)
+    values[bPassThrough] = data[offsets[bPassThrough] + 1]
+
+    # Every record's vertices, one after another
+    starts = offsets + numpy.where(tokens == GL_POLYGON_TOKEN, 2, 1)
+    vertexRecords = numpy.repeat(numpy.arange(len(offsets)), counts)
+    first = numpy.repeat(starts - k * (numpy.cumsum(counts) - counts), counts)
+    indices = first + k * numpy.arange(len(vertexRecords))
+    vertices = data[indices[:, numpy.newaxis] + numpy.arange(k)]
+    return FeedbackRecords(tokens, offsets, values, vertices, vertexRecords)
+
+
+# The (left, bottom, right, top) window rectangle that points (N,3) would
+# cover drawn with mModelView and mProjection into viewport, as feedback
+# mode would give it for the mesh they are from. Points behind the eye are
+# left out and the rectangle is kept within the viewport, much as clipping
+# would. None if no points are in front of the eye.
+def gltProjectBounds(points, mModelView, mProjection, viewport):
+    m = [0.0] * 16
+    m3dMatrixMultiply44(m, mProjection, mModelView)
+    m = numpy.array(m).reshape(4, 4)
+
+    points = numpy.asarray(points, numpy.float64).reshape(-1, 3)
+    clip = numpy.dot(points, m[0:3]) + m[3]
+    clip = clip[clip[:, 3] > 0.0]
+    if len(clip) == 0:
+        return None
+    ndc = clip[:, 0:2] / clip[:, 3:4]
+    (xMin, yMin) = numpy.maximum(ndc.min(axis=0), -1.0)
+    (xMax, yMax) = numpy.minimum(ndc.max(axis=0), 1.0)
+
+    (x, y, width, height) = viewport[0:4]
+    return (float(x + (xMin + 1.0) * 0.5 * width), float(y + (yMin + 1.0) * 0.5 * height),
+            float(x + (xMax + 1.0) * 0.5 * width), float(y + (yMax + 1.0) * 0.5 * height))
@@ -10,11 +10,27 @@
 # The GLFrame (OrthonormalFrame) class. Possibly the most useful little piece of 3D graphics
 # code for OpenGL immersive environments.
 # Richard S. Wright Jr.
+from ctypes import memmove, sizeof
 from pyglet.gl import glMultMatrixf, glTranslatef, gluLookAt
 from math3d import M3DVector3f, M3DMatrix44f, m3dCrossProduct, m3dSetMatrixColumn44, m3dRotationMatrix44
+from math3d import m3dNormalizeVector
+from math3d import M3DQuaternionf, m3dQuatFromAxisAngle, m3dQuatMultiply, m3dQuatNormalize
+from math3d import m3dAllocArray, m3dCrossProductArray
+
+# Numpy is only needed for FrameArray
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Scratch space for the methods below, so applying a frame does not allocate.
+# GL is only ever driven from one thread, so sharing these is safe.
+_mScratch = M3DMatrix44f()
+_vScratch = M3DVector3f()
+_qScratch = M3DQuaternionf()
 
 class GLFrame(object):
-    def __init__(self):
+    def __init__(self, bQuaternion = False):
         # Default position and orientation.  At the origin, looking
         # down the positive Z axis (right handed coordinate system).
 
@@ -23,26 +39,73 @@ class GLFrame(object):
         # Forward is -Z (default OpenGL)
         self.vForward = M3DVector3f(0.0, 0.0, -1.0) # Where am I going?
         self.vUp = M3DVector3f(0.0, 1.0, 0.0)       # Which way is up?
+
+        # Optionally keep the orientation as a quaternion (the rotation from
+        # the default orientation above). Rotations are then applied to the
+        # quaternion and vForward and vUp are worked out from it, so they
+        # stay orthonormal however many small rotations pile up. On such a
+        # frame, rotate it with the methods below rather than writing to
+        # vForward and vUp.
+        self.qOrientation = None
+        if bQuaternion:
+            self.qOrientation = M3DQuaternionf(0.0, 0.0, 0.0, 1.0)
+
+        # The actor and camera matrices are only rebuilt when the frame has
+        # moved since they were last asked for. The methods below keep these
+        # flags up to date; anyone writing to vOrigin, vForward or vUp
+        # directly must call Invalidate() afterwards.
+        self.mActor = M3DMatrix44f()
+        self.mActorRotation = M3DMatrix44f()
+        self.mCamera = M3DMatrix44f()
+        self.bActorDirty = True
+        self.bActorRotationDirty = True
+        self.bCameraDirty = True
+
+        # Rotations since the frame was last normalized
+        self.nRotations = 0
+
+    # Mark the cached matrices as out of date. Moving only affects the
+    # full actor matrix; rotating affects all of them.
+    def Invalidate(self, bMovedOnly = False):
+        self.bActorDirty = True
+        if not bMovedOnly:
+            self.bActorRotationDirty = True
+            self.bCameraDirty = True
         
     def setOrigin(self, x, y, z):
         self.vOrigin[0] = x
         self.vOrigin[1] = y
         self.vOrigin[2] = z
+        self.bActorDirty = True
 
     # Get a 4x4 transformation matrix that describes the camera
-    # orientation.
-    def GetCameraOrientation(self):
-        m = M3DMatrix44f()
-        x = M3DVector3f()
-        z = M3DVector3f()
+    # orientation. It is written into m if given, otherwise a new matrix.
+    def GetCameraOrientation(self, m = None):
+        if m is None:
+            m = M3DMatrix44f()
+        memmove(m, self.GetCachedCameraOrientation(), sizeof(M3DMatrix44f))
+        return m
+
+    # The camera orientation matrix itself, rebuilt only if the frame has
+    # rotated. Don't modify it.
+    def GetCachedCameraOrientation(self):
+        if self.bCameraDirty:
+            self._BuildCameraOrientation(self.mCamera)
+            self.bCameraDirty = False
+        return self.mCamera
+
+    def _BuildCameraOrientation(self, m):
+        x = _vScratch
         # Make rotation matrix
         # Z vector is reversed
-        z[0] = -self.vForward[0]
-        z[1] = -self.vForward[1]
-        z[2] = -self.vForward[2]
+        z0 = -self.vForward[0]
+        z1 = -self.vForward[1]
+        z2 = -self.vForward[2]
 
         # X vector = Y cross Z 
-        x = m3dCrossProduct(self.vUp, z)
+        x[0] = self.vUp[1]*z2 - z1*self.vUp[2]
+        x[1] = -self.vUp[0]*z2 + z0*self.vUp[2]
+        x[2] = self.vUp[0]*z1 - z0*self.vUp[1]
 
         # Matrix has no translation information and is
         # transposed.... (rows instead of columns)
@@ -56,17 +119,15 @@ class GLFrame(object):
         m[6] = self.vUp[2]
         m[7] = 0.0
 
-        m[8] = z[0]
-        m[9] = z[1]
-        m[10] = z[2]
+        m[8] = z0
+        m[9] = z1
+        m[10] = z2
         m[11] = 0.0
 
         m[12] = 0.0
         m[13] = 0.0
         m[14] = 0.0
         m[15] = 1.0
-
-        return m
     
     # Perform viewing or modeling transformations
     # Position as the camera (for viewing). Apply this transformation
@@ -78,7 +139,7 @@ class GLFrame(object):
     # This will get called once per frame.... go ahead and inline
     def ApplyCameraTransform(self, bRotOnly = False):
 
-        m = self.GetCameraOrientation()
+        m = self.GetCachedCameraOrientation()
         
         # Camera Transform
         glMultMatrixf(m)
@@ -87,12 +148,30 @@ class GLFrame(object):
         if not bRotOnly:
             glTranslatef(-self.vOrigin[0], -self.vOrigin[1], -self.vOrigin[2])
 
-    # Just assemble the matrix
-    def GetMatrix(self, bRotationOnly = False):
-        matrix = M3DMatrix44f()
-        
+    # Just assemble the matrix, into matrix if given, otherwise a new one
+    def GetMatrix(self, bRotationOnly = False, matrix = None):
+        if matrix is None:
+            matrix = M3DMatrix44f()
+        memmove(matrix, self.GetCachedMatrix(bRotationOnly), sizeof(M3DMatrix44f))
+        return matrix
+
+    # The actor matrix itself, rebuilt only if the frame has moved. Don't
+    # modify it.
+    def GetCachedMatrix(self, bRotationOnly = False):
+        if bRotationOnly:
+            if self.bActorRotationDirty:
+                self._BuildMatrix(self.mActorRotation, True)
+                self.bActorRotationDirty = False
+            return self.mActorRotation
+
+        if self.bActorDirty:
+            self._BuildMatrix(self.mActor, False)
+            self.bActorDirty = False
+        return self.mActor
+
+    def _BuildMatrix(self, matrix, bRotationOnly):
         # Calculate the right side (x) vector, drop it right into the matrix
-        vXAxis = m3dCrossProduct(self.vUp, self.vForward)
+        vXAxis = m3dCrossProduct(self.vUp, self.vForward, _vScratch)
         
         # m3dSetMatrixColum44 does not fill in the fourth value...
         # X Column
@@ -116,7 +195,6 @@ class GLFrame(object):
             m3dSetMatrixColumn44(matrix, self.vOrigin, 3)
 
         matrix[15] = 1.0
-        return matrix
 
     # Position as an object in the scene. This places and orients a
     # coordinate frame for other objects (besides the camera)
@@ -124,10 +202,8 @@ class GLFrame(object):
     # This is going to be called alot... don't inline
     # Add flag to perform actor rotation only and not the translation
     def ApplyActorTransform(self, bRotationOnly = False):
-        rotMat = self.GetMatrix(bRotationOnly)
-        
         # Apply rotation to the current matrix
-        glMultMatrixf(rotMat)
+        glMultMatrixf(self.GetCachedMatrix(bRotationOnly))
         
     # Move Forward (along Z axis)
     def MoveForward(self, fDelta):
@@ -135,20 +211,304 @@ class GLFrame(object):
         self.vOrigin[0] += self.vForward[0] * fDelta
         self.vOrigin[1] += self.vForward[1] * fDelta
         self.vOrigin[2] += self.vForward[2] * fDelta
-        
+        self.bActorDirty = True
+
+    # Move along Y axis
+    def MoveUp(self, fDelta):
+        # Move along direction of up direction
+        self.vOrigin[0] += self.vUp[0] * fDelta
+        self.vOrigin[1] += self.vUp[1] * fDelta
+        self.vOrigin[2] += self.vUp[2] * fDelta
+        self.bActorDirty = True
+
+    # Move along X axis
+    def MoveRight(self, fDelta):
+        # Move along direction of right vector (up cross forward)
+        vCross = m3dCrossProduct(self.vUp, self.vForward, _vScratch)
+        self.vOrigin[0] += vCross[0] * fDelta
+        self.vOrigin[1] += vCross[1] * fDelta
+        self.vOrigin[2] += vCross[2] * fDelta
+        self.bActorDirty = True
+
+    # Translate along world axes
+    def TranslateWorld(self, x, y, z):
+        self.vOrigin[0] += x
+        self.vOrigin[1] += y
+        self.vOrigin[2] += z
+        self.bActorDirty = True
+
+    # Translate along local axes
+    def TranslateLocal(self, x, y, z):
+        self.MoveRight(x)
+        self.MoveUp(y)
+        self.MoveForward(z)
+
+    # Set vForward and vUp from qOrientation, by rotating the default
+    # forward (0, 0, -1) and up (0, 1, 0) vectors (inlined)
+    def _UpdateAxesFromQuat(self):
+        q = self.qOrientation
+        x = q[0]; y = q[1]; z = q[2]; w = q[3]
+        self.vForward[0] = -2.0 * (z * x + w * y)
+        self.vForward[1] = -2.0 * (y * z - w * x)
+        self.vForward[2] = 2.0 * (x * x + y * y) - 1.0
+        self.vUp[0] = 2.0 * (x * y - w * z)
+        self.vUp[1] = 1.0 - 2.0 * (x * x + z * z)
+        self.vUp[2] = 2.0 * (y * z + w * x)
+
+    # Rounding errors make forward and up drift apart, and away from unit
+    # length, as rotations pile up. Rather than fix them up after every
+    # rotation, the rotations below count themselves and call Normalize()
+    # every NORMALIZE_INTERVAL of them.
+    NORMALIZE_INTERVAL = 64
+
+    # Make forward and up unit length and perpendicular again (the
+    # quaternion, if the frame has one)
+    def Normalize(self):
+        self.nRotations = 0
+        self.Invalidate()
+        if self.qOrientation is not None:
+            m3dQuatNormalize(self.qOrientation)
+            self._UpdateAxesFromQuat()
+            return
+
+        # Forward is kept as it is, up is made perpendicular to it:
+        # up = forward cross (up cross forward)
+        vCross = m3dCrossProduct(self.vUp, self.vForward, _vScratch)
+        m3dCrossProduct(self.vForward, vCross, self.vUp)
+
+        m3dNormalizeVector(self.vUp)
+        m3dNormalizeVector(self.vForward)
+
+    # Called after every rotation
+    def _Rotated(self):
+        self.nRotations += 1
+        if self.nRotations >= self.NORMALIZE_INTERVAL:
+            self.Normalize()
+        elif self.qOrientation is not None:
+            self._UpdateAxesFromQuat()
+
+    # Turn the quaternion frame by the rotation q, in local axes if bLocal
+    # (right multiply) or world axes (left multiply)
+    def _RotateQuat(self, q, bLocal):
+        if bLocal:
+            m3dQuatMultiply(self.qOrientation, self.qOrientation, q)
+        else:
+            m3dQuatMultiply(self.qOrientation, q, self.qOrientation)
+        self._Rotated()
+
+    # Rotate forward and/or up around the world axis (x, y, z)
+    def _RotateAxes(self, fAngle, x, y, z, bForward, bUp):
+        rotMat = _mScratch
+        m3dRotationMatrix44(rotMat, fAngle, x, y, z)
+        if bForward:
+            _RotateVector(rotMat, self.vForward)
+        if bUp:
+            _RotateVector(rotMat, self.vUp)
+        self._Rotated()
+
     # Rotate around local Y
     def RotateLocalY(self, fAngle):
+        self.Invalidate()
+        if self.qOrientation is not None:
+            # Local axes go on the right. m3dRotationMatrix44 turns the
+            # opposite way to the quaternions, hence -fAngle. In the
+            # default orientation local Y is (0, 1, 0).
+            self._RotateQuat(m3dQuatFromAxisAngle(_qScratch, -fAngle, 0.0, 1.0, 0.0), True)
+            return
+
         # Just Rotate around the up vector
         # Create a rotation matrix around my Up (Y) vector
-        rotMat = M3DMatrix44f()
-        m3dRotationMatrix44(rotMat, fAngle, self.vUp[0], self.vUp[1], self.vUp[2])
+        self._RotateAxes(fAngle, self.vUp[0], self.vUp[1], self.vUp[2], True, False)
 
-        newVect = M3DVector3f()
-        
-        # Rotate forward pointing vector (inlined 3x3 transform)
-        newVect[0] = rotMat[0] * self.vForward[0] + rotMat[4] * self.vForward[1] + rotMat[8] *  self.vForward[2]
-        newVect[1] = rotMat[1] * self.vForward[0] + rotMat[5] * self.vForward[1] + rotMat[9] *  self.vForward[2]
-        newVect[2] = rotMat[2] * self.vForward[0] + rotMat[6] * self.vForward[1] + rotMat[10] * self.vForward[2]
-        self.vForward[0] = newVect[0]
-        self.vForward[1] = newVect[1]
-        self.vForward[2] = newVect[2]
+    # Rotate around local X
+    def RotateLocalX(self, fAngle):
+        self.Invalidate()
+        if self.qOrientation is not None:
+            # Local X is (-1, 0, 0) in the default orientation
+            self._RotateQuat(m3dQuatFromAxisAngle(_qScratch, fAngle, 1.0, 0.0, 0.0), True)
+            return
+
+        # Rotate up and forward around the right (X) vector
+        vCross = m3dCrossProduct(self.vUp, self.vForward, _vScratch)
+        self._RotateAxes(fAngle, vCross[0], vCross[1], vCross[2], True, True)
+
+    # Rotate around local Z
+    def RotateLocalZ(self, fAngle):
+        self.Invalidate()
+        if self.qOrientation is not None:
+            # Local Z is (0, 0, -1) in the default orientation
+            self._RotateQuat(m3dQuatFromAxisAngle(_qScratch, fAngle, 0.0, 0.0, 1.0), True)
+            return
+
+        # Only the up vector needs to be rotated
+        self._RotateAxes(fAngle, self.vForward[0], self.vForward[1], self.vForward[2], False, True)
+
+    # Rotate around an arbitrary axis in local coordinates
+    def RotateLocal(self, fAngle, x, y, z):
+        self.Invalidate()
+        if self.qOrientation is not None:
+            # Local (x, y, z) is (-x, y, -z) in the default orientation
+            self._RotateQuat(m3dQuatFromAxisAngle(_qScratch, -fAngle, -x, y, -z), True)
+            return
+
+        # Find the world axis and rotate around that
+        vWorld = self.LocalToWorld((x, y, z), _vScratch, True)
+        self._RotateAxes(fAngle, vWorld[0], vWorld[1], vWorld[2], True, True)
+
+    # Rotate around an arbitrary axis in world coordinates
+    def RotateWorld(self, fAngle, x, y, z):
+        self.Invalidate()
+        if self.qOrientation is not None:
+            self._RotateQuat(m3dQuatFromAxisAngle(_qScratch, -fAngle, x, y, z), False)
+            return
+
+        self._RotateAxes(fAngle, x, y, z, True, True)
+
+    # Convert a point (or with bRotationOnly, a direction) from the frame's
+    # local coordinates to world coordinates, into vWorld if given,
+    # otherwise a new vector. vWorld may be vLocal.
+    def LocalToWorld(self, vLocal, vWorld = None, bRotationOnly = False):
+        if vWorld is None:
+            vWorld = M3DVector3f()
+        f = self.vForward
+        u = self.vUp
+        l0 = vLocal[0]; l1 = vLocal[1]; l2 = vLocal[2]
+
+        # The columns of the rotation matrix are X (up cross forward), up
+        # and forward (inlined)
+        vWorld[0] = (u[1] * f[2] - f[1] * u[2]) * l0 + u[0] * l1 + f[0] * l2
+        vWorld[1] = (f[0] * u[2] - u[0] * f[2]) * l0 + u[1] * l1 + f[1] * l2
+        vWorld[2] = (u[0] * f[1] - f[0] * u[1]) * l0 + u[2] * l1 + f[2] * l2
+
+        if not bRotationOnly:
+            vWorld[0] += self.vOrigin[0]
+            vWorld[1] += self.vOrigin[1]
+            vWorld[2] += self.vOrigin[2]
+        return vWorld
+
+    # Convert a point from world coordinates to the frame's local
+    # coordinates, into vLocal if given, otherwise a new vector. vLocal
+    # may be vWorld.
+    def WorldToLocal(self, vWorld, vLocal = None):
+        if vLocal is None:
+            vLocal = M3DVector3f()
+        f = self.vForward
+        u = self.vUp
+
+        # Translate the point to the origin
+        w0 = vWorld[0] - self.vOrigin[0]
+        w1 = vWorld[1] - self.vOrigin[1]
+        w2 = vWorld[2] - self.vOrigin[2]
+
+        # The rotation is orthonormal, so its inverse is its transpose:
+        # dot with each of the axes
+        vLocal[0] = (u[1] * f[2] - f[1] * u[2]) * w0 + (f[0] * u[2] - u[0] * f[2]) * w1 + (u[0] * f[1] - f[0] * u[1]) * w2
+        vLocal[1] = u[0] * w0 + u[1] * w1 + u[2] * w2
+        vLocal[2] = f[0] * w0 + f[1] * w1 + f[2] * w2
+        return vLocal
+
+
+# Rotate v in place by the rotation matrix m (inlined 3x3 transform)
+def _RotateVector(m, v):
+    v0 = v[0]
+    v1 = v[1]
+    v2 = v[2]
+    v[0] = m[0] * v0 + m[4] * v1 + m[8] *  v2
+    v[1] = m[1] * v0 + m[5] * v1 + m[9] *  v2
+    v[2] = m[2] * v0 + m[6] * v1 + m[10] * v2
+
+# Many GLFrames stored together: the origins, forward and up vectors of all of
+# them live in three contiguous (N,3) float32 arrays, so whole crowds of
+# actors can be moved and turned with a few numpy operations instead of a
+# Python loop. The methods mirror GLFrame's, and take an optional indices
+# (anything numpy can index with: a slice, an array of indices or a boolean
+# mask) to act on only some of the frames. Amounts can be a single value or
+# one per frame.
+class FrameArray(object):
+    def __init__(self, count):
+        # The actor matrices for all the frames, as ctypes for GL and as an
+        # (N,4,4) numpy view of the same memory
+        (self.glMatrices, self.matrices) = m3dAllocArray(M3DMatrix44f, count)
+
+        # Default position and orientation, as for GLFrame
+        self.origins = numpy.zeros((count, 3), numpy.float32)
+        self.forwards = numpy.zeros((count, 3), numpy.float32)
+        self.forwards[:, 2] = -1.0
+        self.ups = numpy.zeros((count, 3), numpy.float32)
+        self.ups[:, 1] = 1.0
+
+        self.bDirty = True
+
+    def __len__(self):
+        return len(self.origins)
+
+    # A GLFrame for frame i whose vectors are views into the arrays, so it
+    # can be used anywhere a GLFrame can and changes go straight through.
+    # Changes made through it are not seen by the cached matrices here, so
+    # call Invalidate() afterwards; likewise make a new one after changing
+    # the arrays, as its own cached matrices will be out of date.
+    def __getitem__(self, i):
+        frame = GLFrame()
+        frame.vOrigin = M3DVector3f.from_buffer(self.origins[i])
+        frame.vForward = M3DVector3f.from_buffer(self.forwards[i])
+        frame.vUp = M3DVector3f.from_buffer(self.ups[i])
+        return frame
+
+    # Mark the cached matrices as out of date, after writing to the arrays
+    # directly
+    def Invalidate(self):
+        self.bDirty = True
+
+    def setOrigin(self, x, y, z, indices = None):
+        if indices is None:
+            indices = slice(None)
+        self.origins[indices, 0] = x
+        self.origins[indices, 1] = y
+        self.origins[indices, 2] = z
+        self.bDirty = True
+
+    # Move Forward (along Z axis)
+    def MoveForward(self, fDelta, indices = None):
+        if indices is None:
+            indices = slice(None)
+        fDelta = numpy.asarray(fDelta, dtype=numpy.float32)
+        if fDelta.ndim:
+            fDelta = fDelta[:, numpy.newaxis]
+        self.origins[indices] += self.forwards[indices] * fDelta
+        self.bDirty = True
+
+    # Rotate around local Y, turning the same way as GLFrame.RotateLocalY
+    def RotateLocalY(self, fAngle, indices = None):
+        if indices is None:
+            indices = slice(None)
+        fAngle = numpy.asarray(fAngle, dtype=numpy.float32)
+        if fAngle.ndim:
+            fAngle = fAngle[:, numpy.newaxis]
+
+        # Rotate forward around up by -fAngle (Rodrigues' formula). Forward
+        # is perpendicular to up, so the term along the axis drops out.
+        up = self.ups[indices]
+        forward = self.forwards[indices]
+        s = numpy.sin(-fAngle)
+        c = numpy.cos(-fAngle)
+        self.forwards[indices] = forward * c + m3dCrossProductArray(up, forward) * s
+        self.bDirty = True
+
+    # All the actor matrices as an (N,4,4) array (indexed [frame][column][row]),
+    # rebuilt only if something has moved. Don't modify it.
+    def GetMatrices(self):
+        if self.bDirty:
+            m = self.matrices
+            m3dCrossProductArray(self.ups, self.forwards, m[:, 0, :3])
+            m[:, 1, :3] = self.ups
+            m[:, 2, :3] = self.forwards
+            m[:, 3, :3] = self.origins
+            m[:, :, 3] = (0.0, 0.0, 0.0, 1.0)
+            self.bDirty = False
+        return self.matrices
+
+    # Position frame i as an actor, like GLFrame.ApplyActorTransform
+    def ApplyActorTransform(self, i):
+        if self.bDirty:
+            self.GetMatrices()
+        glMultMatrixf(self.glMatrices[i])
@@ -3,10 +3,57 @@ from pyglet.gl import *
 from math import sin, cos
 from math3d import M3DVector3f, M3D_PI, m3dNormalizeVector
 from fakeglut import glutSolidSphere
+from meshcache import meshCache, gltGridStrips, gltDrawMesh
+from fakeglu import gluNewQuadric, gluDeleteQuadric, gluQuadricDrawStyle, gluQuadricNormals
+from fakeglu import gluQuadricOrientation, gluQuadricTexture, gluSphere, gluCylinder, gluDisk, gluSphereMesh
+
+# Numpy is needed to build meshes; without it the primitives below are drawn
+# a vertex at a time
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Build a torus (doughnut) around the z axis, as one triangle strip (see
+# gltGridStrips). Returns a (vertices, indices) mesh from meshCache, so don't
+# modify it.
+def gltMakeTorus(majorRadius, minorRadius, numMajor, numMinor):
+    return meshCache.Get(('gltTorus', majorRadius, minorRadius, numMajor, numMinor),
+                         lambda: _MakeTorus(majorRadius, minorRadius, numMajor, numMinor))
+
+def _MakeTorus(majorRadius, minorRadius, numMajor, numMinor):
+    # One ring of numMinor + 1 vertices for each of the numMajor + 1 steps
+    # around; the last of each is the first again, with the texture
+    # coordinate wrapped round to 1
+    a = numpy.arange(numMajor + 1) * (2.0 * M3D_PI / numMajor)
+    b = numpy.arange(numMinor + 1) * (2.0 * M3D_PI / numMinor)
+    x = numpy.cos(a)[:, numpy.newaxis]
+    y = numpy.sin(a)[:, numpy.newaxis]
+    c = numpy.cos(b)
+    s = numpy.sin(b)
+    r = minorRadius * c + majorRadius
+
+    vertices = numpy.empty((numMajor + 1, numMinor + 1, 8), numpy.float32)
+    vertices[:, :, 0] = (numpy.arange(numMajor + 1) / float(numMajor))[:, numpy.newaxis]
+    vertices[:, :, 1] = numpy.arange(numMinor + 1) / float(numMinor)
+    # The normals are unit length already
+    vertices[:, :, 2] = x * c
+    vertices[:, :, 3] = y * c
+    vertices[:, :, 4] = s
+    vertices[:, :, 5] = x * r
+    vertices[:, :, 6] = y * r
+    vertices[:, :, 7] = minorRadius * s
+
+    # Strip i runs (i, j), (i + 1, j) for each j
+    return (vertices.reshape(-1, 8), gltGridStrips(numMajor + 1, numMinor + 1))
 
 # For best results, put this in a display list
 # Draw a torus (doughnut)  at z = fZVal... torus is in xy plane
 def gltDrawTorus(majorRadius, minorRadius, numMajor, numMinor):
+    if numpy is not None:
+        gltDrawMesh(gltMakeTorus(majorRadius, minorRadius, numMajor, numMinor))
+        return
+
     vNormal = M3DVector3f()
     majorStep = 2.0*M3D_PI / numMajor
     minorStep = 2.0*M3D_PI / numMinor
@@ -52,6 +99,15 @@ def gltDrawTorus(majorRadius, minorRadius, numMajor, numMinor):
 
 def gltDrawSphere(a, b, c):
     glutSolidSphere(a, b, c)
+
+# The mesh glutSolidSphere draws: a textured sphere as one triangle strip,
+# from meshCache, so don't modify it
+def gltMakeSphere(radius, slices, stacks):
+    sphere = gluNewQuadric()
+    gluQuadricTexture(sphere, True)
+    (mesh, mode) = gluSphereMesh(sphere, radius, slices, stacks)
+    gluDeleteQuadric(sphere)
+    return mesh
     
 # Draw a 3D unit Axis set
 # Draw the unit axis. A small white sphere represents the origin
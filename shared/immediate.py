@@ -0,0 +1,330 @@
+# Records immediate mode drawing (glBegin, glVertex3f, ..., glEnd) into
+# vertex arrays, so code written a vertex at a time is drawn with a few
+# glDrawElements calls after the first time through, without rewriting it.
+#
+# Import the functions here after pyglet.gl, to use them in place of GL's:
+#   from pyglet.gl import *
+#   from immediate import Recording, glBegin, glEnd, glVertex3f, glNormal3f
+#
+#   ground = Recording()
+#   ...
+#   ground.Draw(DrawGround)     # Records DrawGround the first time
+#
+# or around drawing code inline:
+#   if ground.Record():
+#       ...
+#       ground.End()
+#   ground.Draw()
+#
+# Outside a recording the functions just call GL's. Only the vertices are
+# recorded, with the normals, texture coordinates and colors set while
+# recording; other GL calls made while recording (binding textures, moving
+# the matrices) happen then and there and are not replayed, so make a
+# recording of each run of primitives drawn with the same state.
+#
+# Points and lines are drawn as they were, line strips and loops as lines,
+# and everything else as triangles. Each triangle ends with the vertex that
+# colors it when flat shaded, so flat shading looks the same. Polygons with
+# GL_LINE for their polygon mode will show the edges between the triangles,
+# though.
+
+from pyglet import gl
+from pyglet.gl import *
+
+# Numpy is needed to build the arrays; without it nothing is recorded, and
+# the drawing code is run every time
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_glBegin = gl.glBegin
+_glEnd = gl.glEnd
+_glVertex2f = gl.glVertex2f
+_glVertex3f = gl.glVertex3f
+_glNormal3f = gl.glNormal3f
+_glTexCoord2f = gl.glTexCoord2f
+_glTexCoord3f = gl.glTexCoord3f
+_glColor4f = gl.glColor4f
+_glColor3ub = gl.glColor3ub
+_glColor4ub = gl.glColor4ub
+
+# The recording being made, if any
+_recording = None
+
+# Each vertex is recorded as its texture coordinate, color, normal and
+# position: s, t, r, red, green, blue, alpha, nx, ny, nz, x, y, z
+_TEXCOORD = 0
+_COLOR = 3
+_NORMAL = 7
+_POSITION = 10
+_VERTEX_SIZE = 13
+
+class Recording(object):
+    def __init__(self):
+        self.vertices = None    # (N, 13) float32, once recorded
+        self.batches = []       # (mode, indices) to draw, in order
+        self.texCoordSize = 0   # Components of the texture coordinates used
+        self.bColors = False
+        self.bNormals = False
+
+    # Start recording, unless something is recorded already. Returns whether
+    # it did; if so, draw what is to be recorded and then call End.
+    def Record(self):
+        global _recording
+        if self.vertices is not None:
+            return False
+        if numpy is None:
+            return True
+
+        # Vertices sent before an attribute is set get GL's current value
+        current = (GLfloat * 4)()
+        self._current = [0.0] * _POSITION
+        glGetFloatv(GL_CURRENT_TEXTURE_COORDS, current)
+        self._current[_TEXCOORD:_COLOR] = current[0:3]
+        glGetFloatv(GL_CURRENT_COLOR, current)
+        self._current[_COLOR:_NORMAL] = current[0:4]
+        glGetFloatv(GL_CURRENT_NORMAL, current)
+        self._current[_NORMAL:_POSITION] = current[0:3]
+
+        self._data = []
+        self._primitives = []   # (mode, first, count)
+        self._mode = None
+        self.texCoordSize = 0
+        self.bColors = self.bNormals = False
+        _recording = self
+        return True
+
+    # Stop recording, and build the arrays
+    def End(self):
+        global _recording
+        if _recording is not self:
+            return
+        _recording = None
+
+        nVertices = len(self._data) // _VERTEX_SIZE
+        self.vertices = numpy.array(self._data, numpy.float32).reshape(nVertices, _VERTEX_SIZE)
+
+        # Primitives drawn the same way one after another go in one batch
+        self.batches = []
+        for (mode, first, count) in self._primitives:
+            (mode, indices) = _Indices(mode, count)
+            if len(indices) == 0:
+                continue
+            indices += first
+            if self.batches and self.batches[-1][0] == mode:
+                self.batches[-1][1].append(indices)
+            else:
+                self.batches.append((mode, [indices]))
+        self.batches = [(mode, numpy.concatenate(indices)) for (mode, indices) in self.batches]
+
+        # After drawing, leave GL's current values as drawing would have
+        self._final = tuple(self._current)
+        del self._data, self._primitives, self._current
+
+    # Throw out the recording, so the next Record or Draw makes it again
+    def Clear(self):
+        self.vertices = None
+        self.batches = []
+
+    # Draw the recording. If there isn't one yet and record is given, it is
+    # called to draw what is to be recorded first.
+    def Draw(self, record = None):
+        if record is not None and self.Record():
+            record()
+            self.End()
+        if self.vertices is None:
+            return
+
+        stride = self.vertices.strides[0]
+        address = self.vertices.ctypes.data
+        glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, stride, address + 4 * _POSITION)
+        if self.texCoordSize:
+            glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+            glTexCoordPointer(self.texCoordSize, GL_FLOAT, stride, address + 4 * _TEXCOORD)
+        if self.bColors:
+            glEnableClientState(GL_COLOR_ARRAY)
+            glColorPointer(4, GL_FLOAT, stride, address + 4 * _COLOR)
+        if self.bNormals:
+            glEnableClientState(GL_NORMAL_ARRAY)
+            glNormalPointer(GL_FLOAT, stride, address + 4 * _NORMAL)
+        for (mode, indices) in self.batches:
+            glDrawElements(mode, len(indices), GL_UNSIGNED_INT, indices.ctypes.data)
+        glPopClientAttrib()
+
+        # The current values are undefined after drawing from their arrays
+        final = self._final
+        if self.texCoordSize:
+            _glTexCoord3f(final[0], final[1], final[2])
+        if self.bColors:
+            _glColor4f(final[3], final[4], final[5], final[6])
+        if self.bNormals:
+            _glNormal3f(final[7], final[8], final[9])
+
+    def _Vertex(self, x, y, z):
+        self._data += self._current
+        self._data += (x, y, z)
+
+    def _TexCoord(self, s, t, r, size):
+        self._current[0:3] = (s, t, r)
+        if size > self.texCoordSize:
+            self.texCoordSize = size
+
+    def _Color(self, red, green, blue, alpha):
+        self._current[3:7] = (red, green, blue, alpha)
+        self.bColors = True
+
+    def _Normal(self, x, y, z):
+        self._current[7:10] = (x, y, z)
+        self.bNormals = True
+
+
+# The indices of a primitive of count vertices, as the mode to draw them with
+# and the indices from its first vertex
+def _Indices(mode, count):
+    builder = _builders[mode]
+    return (builder[0], numpy.asarray(builder[1](count), numpy.uint32).ravel())
+
+def _Points(count):
+    return numpy.arange(count)
+
+def _Lines(count):
+    return numpy.arange(count - count % 2)
+
+def _LineStrip(count):
+    i = numpy.arange(max(count - 1, 0))
+    return numpy.column_stack((i, i + 1))
+
+def _LineLoop(count):
+    i = numpy.arange(count if count > 1 else 0)
+    return numpy.column_stack((i, numpy.roll(i, -1)))
+
+def _Triangles(count):
+    return numpy.arange(count - count % 3)
+
+# Every other triangle of a strip goes round the other way, so swap its first
+# two vertices to keep them all facing the same way
+def _TriangleStrip(count):
+    i = numpy.arange(max(count - 2, 0))
+    triangles = numpy.column_stack((i, i + 1, i + 2))
+    triangles[1::2, 0:2] = triangles[1::2, 1::-1]
+    return triangles
+
+def _TriangleFan(count):
+    i = numpy.arange(max(count - 2, 0))
+    return numpy.column_stack((numpy.zeros_like(i), i + 1, i + 2))
+
+# A polygon is colored by its first vertex
+def _Polygon(count):
+    i = numpy.arange(max(count - 2, 0))
+    return numpy.column_stack((i + 1, i + 2, numpy.zeros_like(i)))
+
+def _Quads(count):
+    i = 4 * numpy.arange(count // 4)
+    return numpy.column_stack((i, i + 1, i + 3, i + 1, i + 2, i + 3))
+
+def _QuadStrip(count):
+    i = 2 * numpy.arange(max(count // 2 - 1, 0))
+    return numpy.column_stack((i, i + 1, i + 3, i + 2, i, i + 3))
+
+_builders = {GL_POINTS: (GL_POINTS, _Points),
+             GL_LINES: (GL_LINES, _Lines),
+             GL_LINE_STRIP: (GL_LINES, _LineStrip),
+             GL_LINE_LOOP: (GL_LINES, _LineLoop),
+             GL_TRIANGLES: (GL_TRIANGLES, _Triangles),
+             GL_TRIANGLE_STRIP: (GL_TRIANGLES, _TriangleStrip),
+             GL_TRIANGLE_FAN: (GL_TRIANGLES, _TriangleFan),
+             GL_POLYGON: (GL_TRIANGLES, _Polygon),
+             GL_QUADS: (GL_TRIANGLES, _Quads),
+             GL_QUAD_STRIP: (GL_TRIANGLES, _QuadStrip)}
+
+
+# The GL functions, recorded while there is a recording being made
+
+def glBegin(mode):
+    if _recording is None:
+        _glBegin(mode)
+    else:
+        _recording._mode = mode
+        _recording._first = len(_recording._data) // _VERTEX_SIZE
+
+def glEnd():
+    if _recording is None:
+        _glEnd()
+    else:
+        first = _recording._first
+        _recording._primitives.append((_recording._mode, first, len(_recording._data) // _VERTEX_SIZE - first))
+
+def glVertex2f(x, y):
+    if _recording is None:
+        _glVertex2f(x, y)
+    else:
+        _recording._Vertex(x, y, 0.0)
+
+def glVertex2fv(v):
+    glVertex2f(v[0], v[1])
+
+def glVertex2i(x, y):
+    glVertex2f(x, y)
+
+def glVertex2d(x, y):
+    glVertex2f(x, y)
+
+def glVertex3f(x, y, z):
+    if _recording is None:
+        _glVertex3f(x, y, z)
+    else:
+        _recording._Vertex(x, y, z)
+
+def glVertex3fv(v):
+    glVertex3f(v[0], v[1], v[2])
+
+def glNormal3f(x, y, z):
+    if _recording is None:
+        _glNormal3f(x, y, z)
+    else:
+        _recording._Normal(x, y, z)
+
+def glNormal3fv(v):
+    glNormal3f(v[0], v[1], v[2])
+
+def glTexCoord2f(s, t):
+    if _recording is None:
+        _glTexCoord2f(s, t)
+    else:
+        _recording._TexCoord(s, t, 0.0, 2)
+
+def glTexCoord3f(s, t, r):
+    if _recording is None:
+        _glTexCoord3f(s, t, r)
+    else:
+        _recording._TexCoord(s, t, r, 3)
+
+def glColor3f(red, green, blue):
+    glColor4f(red, green, blue, 1.0)
+
+def glColor3fv(v):
+    glColor4f(v[0], v[1], v[2], 1.0)
+
+def glColor4fv(v):
+    glColor4f(v[0], v[1], v[2], v[3])
+
+def glColor4f(red, green, blue, alpha):
+    if _recording is None:
+        _glColor4f(red, green, blue, alpha)
+    else:
+        _recording._Color(red, green, blue, alpha)
+
+def glColor3ub(red, green, blue):
+    if _recording is None:
+        _glColor3ub(red, green, blue)
+    else:
+        _recording._Color(red / 255.0, green / 255.0, blue / 255.0, 1.0)
+
+def glColor4ub(red, green, blue, alpha):
+    if _recording is None:
+        _glColor4ub(red, green, blue, alpha)
+    else:
+        _recording._Color(red / 255.0, green / 255.0, blue / 255.0, alpha / 255.0)
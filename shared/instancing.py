@@ -0,0 +1,127 @@
+# Draws many copies of one mesh, each placed by a frame of a FrameArray, in a
+# single call. The fixed function pipeline has no instancing, so the copies
+# are transformed into place with numpy and merged into one mesh:
+#
+#   spheres = FrameArray(10000)
+#   ...
+#   batch = InstanceBatch(gltMakeSphere(0.1, 13, 7), spheres, bStatic = True)
+#   ...
+#   batch.Draw()
+#
+# A static batch is transformed once, on its first Draw. Otherwise each Draw
+# looks for frames whose matrices have changed since, and transforms only
+# those copies again. With bBuffer the merged mesh is kept in a vertex buffer
+# object (which needs OpenGL 1.5), and only the span of copies that changed
+# is sent again.
+
+from pyglet.gl import *
+from meshcache import gltDrawMesh, MeshBuffer
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class InstanceBatch(object):
+    def __init__(self, mesh, frames, mode = GL_TRIANGLE_STRIP, bStatic = False, bBuffer = False):
+        (vertices, indices) = mesh
+        nInstances = len(frames)
+        self.frames = frames
+        self.mode = mode
+        self.bStatic = bStatic
+        self.bBuffer = bBuffer
+        self.buffer = None
+        self.bTransformed = False
+
+        # The copies' texture coordinates never change; the normals and
+        # positions are filled in by Update, from each vertex's normal,
+        # position and a 1 for the translation
+        self._local = numpy.ones((len(vertices), 7), numpy.float32)
+        self._local[:, 0:6] = vertices[:, 2:8]
+        self.vertices = numpy.empty((nInstances, len(vertices), 8), numpy.float32)
+        self.vertices[:, :, 0:2] = vertices[:, 0:2]
+        self.indices = _MergeIndices(indices, len(vertices), nInstances, mode)
+
+        # The matrices each copy was last transformed by. NaN never equals
+        # anything, so every copy is transformed the first time.
+        self._matrices = numpy.empty((nInstances, 4, 4), numpy.float32)
+        self._matrices[:] = numpy.nan
+        self._changed = None    # (first, last) copies changed since drawn
+
+    # Transform the copies of frames that have moved since the last time.
+    # Returns how many there were.
+    def Update(self):
+        matrices = self.frames.GetMatrices()
+        nInstances = len(matrices)
+        moved = numpy.flatnonzero((matrices.reshape(nInstances, 16) != self._matrices.reshape(nInstances, 16)).any(axis=1))
+        nMoved = len(moved)
+        if nMoved == 0:
+            return 0
+
+        # Remember the span to send to the buffer
+        changed = (moved[0], moved[-1])
+        if self._changed is not None:
+            changed = (min(changed[0], self._changed[0]), max(changed[1], self._changed[1]))
+        self._changed = changed
+
+        # The matrices are [frame][column][row], so the rotation R and
+        # translation t of each are ready to be multiplied by from the left.
+        # The normals and positions are transformed together, by one product
+        # of the vertices with [[R 0] [0 R] [0 t]] for each copy.
+        m = matrices[moved]
+        blocks = numpy.zeros((nMoved, 7, 6), numpy.float32)
+        blocks[:, 0:3, 0:3] = m[:, 0:3, 0:3]
+        blocks[:, 3:6, 3:6] = m[:, 0:3, 0:3]
+        blocks[:, 6, 3:6] = m[:, 3, 0:3]
+        if nMoved == nInstances:
+            # Straight into place
+            numpy.matmul(self._local, blocks, out=self.vertices[:, :, 2:8])
+        else:
+            self.vertices[moved, :, 2:8] = numpy.matmul(self._local, blocks)
+        self._matrices[moved] = m
+        self.bTransformed = True
+        return nMoved
+
+    # Draw all the copies. Static batches are only transformed the first
+    # time; call Update after moving any of their frames.
+    def Draw(self, bTexture = True, bNormals = True):
+        if not self.bStatic or not self.bTransformed:
+            self.Update()
+
+        if not self.bBuffer:
+            self._changed = None
+            gltDrawMesh((self.vertices.reshape(-1, 8), self.indices), self.mode, bTexture, bNormals)
+            return
+
+        if self.buffer is None:
+            self.buffer = MeshBuffer((self.vertices.reshape(-1, 8), self.indices), self.mode,
+                                     GL_STATIC_DRAW if self.bStatic else GL_DYNAMIC_DRAW)
+        elif self._changed is not None:
+            (first, last) = self._changed
+            self.buffer.SetVertices(self.vertices[first:last + 1], first * self.vertices.shape[1])
+        self._changed = None
+        self.buffer.Draw(bTexture, bNormals)
+
+    # Free the vertex buffer, if there is one
+    def Delete(self):
+        if self.buffer is not None:
+            self.buffer.Delete()
+            self.buffer = None
+
+
+# The indices of a mesh, repeated for each of nInstances copies of its
+# nVertices vertices. Triangle strips are joined as in gltGridStrips, with an
+# extra index to keep the next strip facing the same way after one of odd
+# length; other modes must be lists of separate primitives (GL_TRIANGLES,
+# GL_QUADS, GL_LINES or GL_POINTS).
+def _MergeIndices(indices, nVertices, nInstances, mode):
+    offsets = (numpy.arange(nInstances)[:, numpy.newaxis] * nVertices).astype(numpy.uint32)
+    if mode != GL_TRIANGLE_STRIP:
+        return (indices + offsets).ravel()
+
+    length = len(indices) + len(indices) % 2
+    strips = numpy.empty((nInstances, length + 2), numpy.uint32)
+    strips[:, 0:len(indices)] = indices + offsets
+    strips[:, len(indices):length + 1] = strips[:, len(indices) - 1:len(indices)]
+    strips[:, length + 1] = numpy.roll(strips[:, 0], -1)
+    return strips.ravel()[:-2]
@@ -0,0 +1,164 @@
+# Level of detail for the sphere, torus and cone: how finely each one is
+# tessellated is picked from how big it is on screen, so shapes in the
+# distance cost a few dozen triangles rather than thousands.
+#
+#   lod = LevelOfDetail(frameCamera)
+#
+#   # In on_resize, once the viewport and projection are set up
+#   lod.SetProjection()
+#
+#   # Then in place of glutSolidSphere(0.3, 21, 11) for an actor at vOrigin
+#   lod.DrawSphere(0.3, 21, 11, vOrigin)
+#
+#   # Or for a shape drawn with a modelview matrix already known, such as a
+#   # scene graph node's world matrix
+#   lod.DrawSphere(0.3, 21, 11, mModelView = node.GetWorldMatrix())
+#
+# The slices and stacks (or rings and sides) passed in are the finest level,
+# used close up, and each coarser level halves them, down to the COARSEST_
+# counts below. The levels of each shape are only worked out once, and the
+# mesh for each level is built the first time it is drawn and kept in
+# meshCache, so moving between levels costs nothing.
+
+from math import pi, acos, sqrt
+from pyglet.gl import *
+from math3d import M3DVector3f, M3DMatrix44f
+from fakeglut import glutSolidSphere, glutSolidCone
+from gltools import gltDrawTorus
+
+# The coarsest levels: (slices, stacks) for the sphere and cone, and
+# (numMajor, numMinor) for the torus
+COARSEST_SPHERE = (6, 4)
+COARSEST_TORUS = (6, 4)
+COARSEST_CONE = (6, 1)
+
+_INFINITY = float('inf')
+
+# The levels for the finest counts, finest first; each halves the counts of
+# the one before, but not below the coarsest (or the finest, if that's
+# coarser still)
+_levels = {}
+
+def _Levels(counts, coarsest):
+    key = (counts, coarsest)
+    levels = _levels.get(key)
+    if levels is None:
+        coarsest = tuple([min(n, c) for (n, c) in zip(counts, coarsest)])
+        levels = [counts]
+        while levels[-1] != coarsest:
+            levels.append(tuple([max(c, (n + 1) // 2) for (n, c) in zip(levels[-1], coarsest)]))
+        _levels[key] = levels
+    return levels
+
+# The coarsest of levels with at least the needed number of segments in each
+# count
+def _Pick(levels, needed):
+    for level in reversed(levels):
+        for (n, m) in zip(level, needed):
+            if n < m:
+                break
+        else:
+            return level
+    return levels[0]
+
+# Picks levels of detail for shapes seen from frameCamera. fTolerance is how
+# far, in pixels, the outline of a shape may be from its true curve.
+class LevelOfDetail(object):
+    def __init__(self, frameCamera = None, fTolerance = 1.0):
+        self.frameCamera = frameCamera
+        self.fTolerance = fTolerance
+        self.fPixelsPerUnit = 1.0       # On screen, at a distance of one unit
+        self.bOrthographic = False
+        self._mProjection = M3DMatrix44f()
+        self._mModelView = M3DMatrix44f()
+        self._vEye = M3DVector3f()
+
+    # Take the projection and the height of the viewport, from GL if they
+    # aren't given. Call it whenever either changes.
+    def SetProjection(self, mProjection = None, viewportHeight = None):
+        if mProjection is None:
+            mProjection = self._mProjection
+            glGetFloatv(GL_PROJECTION_MATRIX, mProjection)
+        if viewportHeight is None:
+            viewport = (GLint * 4)()
+            glGetIntegerv(GL_VIEWPORT, viewport)
+            viewportHeight = viewport[3]
+
+        # [5] scales y into the -1 to 1 of the viewport, before the divide by
+        # depth for a perspective projection ([11] is -1) and with none for
+        # an orthographic one ([11] is 0)
+        self.fPixelsPerUnit = mProjection[5] * viewportHeight * 0.5
+        self.bOrthographic = (mProjection[11] == 0.0)
+
+    # How many pixels a unit is on screen, for a shape that fits in a sphere
+    # of boundingRadius around vCenter. vCenter is in world coordinates and
+    # is seen from frameCamera; without it (or a camera), the center is the
+    # origin of the modelview matrix, mModelView if it is given and GL's
+    # current one, read back, if not. Shapes that reach in front of the
+    # camera are infinitely big, and ones wholly behind it nothing.
+    def PixelsPerUnit(self, boundingRadius, vCenter = None, mModelView = None):
+        if self.frameCamera is not None and vCenter is not None:
+            depth = self.frameCamera.WorldToLocal(vCenter, self._vEye)[2]
+            scale = 1.0
+        else:
+            m = mModelView
+            if m is None:
+                m = self._mModelView
+                glGetFloatv(GL_MODELVIEW_MATRIX, m)
+            if vCenter is None:
+                depth = -m[14]
+            else:
+                depth = -(m[2] * vCenter[0] + m[6] * vCenter[1] + m[10] * vCenter[2] + m[14])
+            # Allow for the modelview scaling the shape
+            scale = sqrt(m[0] * m[0] + m[1] * m[1] + m[2] * m[2])
+
+        if self.bOrthographic:
+            return self.fPixelsPerUnit * scale
+        boundingRadius *= scale
+        if depth <= boundingRadius:
+            if depth < -boundingRadius:
+                return 0.0
+            return _INFINITY
+        return self.fPixelsPerUnit * scale / depth
+
+    # The fewest segments for a circle of radius pixels to be within
+    # fTolerance of round: a segment misses by radius * (1 - cos(pi / n))
+    def Segments(self, pixels):
+        cosine = 1.0 - self.fTolerance / pixels if pixels > 0.0 else -1.0
+        if cosine <= -1.0:
+            return 0.0
+        if cosine >= 1.0:
+            return _INFINITY
+        return pi / acos(cosine)
+
+    # The (slices, stacks) to draw a sphere with, at most the ones given
+    def SphereLevel(self, radius, slices, stacks, vCenter = None, mModelView = None):
+        pixels = radius * self.PixelsPerUnit(radius, vCenter, mModelView)
+        # The stacks only go half way round, so halving them with the slices
+        # keeps them as fine
+        return _Pick(_Levels((slices, stacks), COARSEST_SPHERE), (self.Segments(pixels), 0))
+
+    # The (numMajor, numMinor) to draw a torus with, at most the ones given
+    def TorusLevel(self, majorRadius, minorRadius, numMajor, numMinor, vCenter = None, mModelView = None):
+        ppu = self.PixelsPerUnit(majorRadius + minorRadius, vCenter, mModelView)
+        return _Pick(_Levels((numMajor, numMinor), COARSEST_TORUS),
+                     (self.Segments(majorRadius * ppu), self.Segments(minorRadius * ppu)))
+
+    # The (slices, stacks) to draw a cone with, at most the ones given. The
+    # stacks only matter for lighting, so they are halved along with the
+    # slices.
+    def ConeLevel(self, base, height, slices, stacks, vCenter = None, mModelView = None):
+        ppu = self.PixelsPerUnit(sqrt(base * base + height * height), vCenter, mModelView)
+        return _Pick(_Levels((slices, stacks), COARSEST_CONE), (self.Segments(base * ppu), 0))
+
+    def DrawSphere(self, radius, slices, stacks, vCenter = None, mModelView = None):
+        (slices, stacks) = self.SphereLevel(radius, slices, stacks, vCenter, mModelView)
+        glutSolidSphere(radius, slices, stacks)
+
+    def DrawTorus(self, majorRadius, minorRadius, numMajor, numMinor, vCenter = None, mModelView = None):
+        (numMajor, numMinor) = self.TorusLevel(majorRadius, minorRadius, numMajor, numMinor, vCenter, mModelView)
+        gltDrawTorus(majorRadius, minorRadius, numMajor, numMinor)
+
+    def DrawCone(self, base, height, slices, stacks, vCenter = None, mModelView = None):
+        (slices, stacks) = self.ConeLevel(base, height, slices, stacks, vCenter, mModelView)
+        glutSolidCone(base, height, slices, stacks)
@@ -8,7 +8,14 @@
 # useful for graphics, simulation, and physics applications (3D stuff).
 # Richard S. Wright Jr.
 from pyglet.gl import *
-from math import sin, cos
+from math import sin, cos, acos
+import ctypes
+
+# Numpy is only needed by the batched (array) routines and the matrix inverse.
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 M3D_PI = 3.14159265358979323846
@@ -19,6 +26,7 @@ M3DVector2f = GLfloat * 2
 M3DVector3f = GLfloat * 3 # Vector of three floats (x, y, z)
 M3DVector4f = GLfloat * 4
 M3DMatrix44f = GLfloat * 16 # A 4 X 4 matrix, column major (floats) - OpenGL style
+M3DQuaternionf = GLfloat * 4 # A unit quaternion (x, y, z, w) for a rotation
 
 def m3dTransformVector3(vOut, v, m):
     vOut[0] = m[0] * v[0] + m[4] * v[1] + m[8] *  v[2] + m[12]
@@ -51,7 +59,7 @@ def m3dRotationMatrix44(m, angle, x, y, z):
     mag = float((x * x + y * y + z * z) ** 0.5)
     
     if mag == 0.0:
-        m3dLoadIdentity(m)
+        m3dLoadIdentity44(m)
         return
     
     x /= mag
@@ -120,34 +128,42 @@ def m3dRadToDeg(num):
 # We only need one version for floats, and one version for doubles. A 3 component
 # vector fits in a 4 component vector. If  M3DVector4d or M3DVector4f are passed
 # we will be OK because 4th component is not used.
-def m3dCrossProduct(u, v):
-    result = M3DVector3f()
-    result[0] = u[1]*v[2] - v[1]*u[2]
-    result[1] = -u[0]*v[2] + v[0]*u[2]
-    result[2] = u[0]*v[1] - v[0]*u[1]
-    return result
+# The result goes in out if it is given (it may be u or v), otherwise in a
+# new M3DVector3f.
+def m3dCrossProduct(u, v, out=None):
+    x = u[1]*v[2] - v[1]*u[2]
+    y = -u[0]*v[2] + v[0]*u[2]
+    z = u[0]*v[1] - v[0]*u[1]
+    if out is None:
+        out = M3DVector3f()
+    out[0] = x
+    out[1] = y
+    out[2] = z
+    return out
 
 # Calculates the normal of a triangle specified by the three points
 # p1, p2, and p3. Each pointer points to an array of three floats. The
 # triangle is assumed to be wound counter clockwise. 
-def m3dFindNormal(point1, point2, point3):
-    # Temporary vectors
-    v1 = M3DVector3f()
-    v2 = M3DVector3f()
-    
+# The normal goes in out if it is given, otherwise in a new M3DVector3f.
+def m3dFindNormal(point1, point2, point3, out=None):
     # Calculate two vectors from the three points. Assumes counter clockwise
     # winding!
-    v1[0] = point1[0] - point2[0]
-    v1[1] = point1[1] - point2[1]
-    v1[2] = point1[2] - point2[2]
+    v1x = point1[0] - point2[0]
+    v1y = point1[1] - point2[1]
+    v1z = point1[2] - point2[2]
 
-    v2[0] = point2[0] - point3[0]
-    v2[1] = point2[1] - point3[1]
-    v2[2] = point2[2] - point3[2]
+    v2x = point2[0] - point3[0]
+    v2y = point2[1] - point3[1]
+    v2z = point2[2] - point3[2]
 
     # Take the cross product of the two vectors to get
     # the normal vector.
-    return (m3dCrossProduct(v1, v2))
+    if out is None:
+        out = M3DVector3f()
+    out[0] = v1y*v2z - v2y*v1z
+    out[1] = -v1x*v2z + v2x*v1z
+    out[2] = v1x*v2y - v2x*v1y
+    return out
     
 def m3dSetMatrixColumn44(dst, src, col):
     dst[col * 4] = src[0]
@@ -176,40 +192,77 @@ def m3dGetVectorLength(u):
 def m3dNormalizeVector(u):
     m3dScaleVector3(u, 1.0 / m3dGetVectorLength(u))
     
-# Graceless, but duplicating the one from OpenGL SuperBible would be worse, I think?
-# Adds a dependency on numpy, also, which is a bummer.
+# Invert a general 4x4 matrix by cofactor expansion, writing the result to
+# dst. Everything is read out of src before dst is written, so dst and src
+# may be the same matrix. Returns False (and leaves dst alone) if src is
+# singular.
+# Transposing a matrix commutes with inverting it, so the expansion is the
+# same whether the 16 floats are read as rows or (as here) as columns.
 def m3dInvertMatrix44(dst, src):
-    try:
-        from numpy import matrix
-    except ImportError:
-        print "You need Numpy."
-        import sys
-        sys.exit(1)
-        
-    mat = matrix(   [[src[0], src[1], src[2], src[3]],
-                    [src[4], src[5], src[6], src[7]],
-                    [src[8], src[9], src[10], src[11]],
-                    [src[12], src[13], src[14], src[15]]])
-    mat = mat.I.tolist()                
-    dst[0] = mat[0][0]
-    dst[1] = mat[0][1]
-    dst[2] = mat[0][2]
-    dst[3] = mat[0][3]
-
-    dst[4] = mat[1][0]
-    dst[5] = mat[1][1]
-    dst[6] = mat[1][2]
-    dst[7] = mat[1][3]
-
-    dst[8] = mat[2][0]
-    dst[9] = mat[2][1]
-    dst[10] = mat[2][2]
-    dst[11] = mat[2][3]
-
-    dst[12] = mat[3][0]
-    dst[13] = mat[3][1]
-    dst[14] = mat[3][2]
-    dst[15] = mat[3][3]
+    a00 = src[0]; a01 = src[1]; a02 = src[2]; a03 = src[3]
+    a10 = src[4]; a11 = src[5]; a12 = src[6]; a13 = src[7]
+    a20 = src[8]; a21 = src[9]; a22 = src[10]; a23 = src[11]
+    a30 = src[12]; a31 = src[13]; a32 = src[14]; a33 = src[15]
+
+    # 2x2 determinants of the first two and last two rows
+    s0 = a00 * a11 - a10 * a01
+    s1 = a00 * a12 - a10 * a02
+    s2 = a00 * a13 - a10 * a03
+    s3 = a01 * a12 - a11 * a02
+    s4 = a01 * a13 - a11 * a03
+    s5 = a02 * a13 - a12 * a03
+
+    c5 = a22 * a33 - a32 * a23
+    c4 = a21 * a33 - a31 * a23
+    c3 = a21 * a32 - a31 * a22
+    c2 = a20 * a33 - a30 * a23
+    c1 = a20 * a32 - a30 * a22
+    c0 = a20 * a31 - a30 * a21
+
+    det = s0 * c5 - s1 * c4 + s2 * c3 + s3 * c2 - s4 * c1 + s5 * c0
+    if det == 0.0:
+        return False
+    invdet = 1.0 / det
+
+    dst[0] = (a11 * c5 - a12 * c4 + a13 * c3) * invdet
+    dst[1] = (-a01 * c5 + a02 * c4 - a03 * c3) * invdet
+    dst[2] = (a31 * s5 - a32 * s4 + a33 * s3) * invdet
+    dst[3] = (-a21 * s5 + a22 * s4 - a23 * s3) * invdet
+
+    dst[4] = (-a10 * c5 + a12 * c2 - a13 * c1) * invdet
+    dst[5] = (a00 * c5 - a02 * c2 + a03 * c1) * invdet
+    dst[6] = (-a30 * s5 + a32 * s2 - a33 * s1) * invdet
+    dst[7] = (a20 * s5 - a22 * s2 + a23 * s1) * invdet
+
+    dst[8] = (a10 * c4 - a11 * c2 + a13 * c0) * invdet
+    dst[9] = (-a00 * c4 + a01 * c2 - a03 * c0) * invdet
+    dst[10] = (a30 * s4 - a31 * s2 + a33 * s0) * invdet
+    dst[11] = (-a20 * s4 + a21 * s2 - a23 * s0) * invdet
+
+    dst[12] = (-a10 * c3 + a11 * c1 - a12 * c0) * invdet
+    dst[13] = (a00 * c3 - a01 * c1 + a02 * c0) * invdet
+    dst[14] = (-a30 * s3 + a31 * s1 - a32 * s0) * invdet
+    dst[15] = (a20 * s3 - a21 * s1 + a22 * s0) * invdet
+    return True
+
+# Fast inverse for a rigid body transform (rotation plus translation only,
+# no scaling), such as a camera or actor matrix from GLFrame. The rotation is
+# transposed and the translation is rotated back and negated. dst and src may
+# be the same matrix.
+def m3dInvertRigidMatrix44(dst, src):
+    r0 = src[0]; r1 = src[1]; r2 = src[2]
+    r4 = src[4]; r5 = src[5]; r6 = src[6]
+    r8 = src[8]; r9 = src[9]; r10 = src[10]
+    tx = src[12]; ty = src[13]; tz = src[14]
+
+    dst[0] = r0; dst[1] = r4; dst[2] = r8; dst[3] = 0.0
+    dst[4] = r1; dst[5] = r5; dst[6] = r9; dst[7] = 0.0
+    dst[8] = r2; dst[9] = r6; dst[10] = r10; dst[11] = 0.0
+
+    dst[12] = -(r0 * tx + r1 * ty + r2 * tz)
+    dst[13] = -(r4 * tx + r5 * ty + r6 * tz)
+    dst[14] = -(r8 * tx + r9 * ty + r10 * tz)
+    dst[15] = 1.0
 
 # Dot Product, only for three component vectors
 # return u dot v
@@ -221,28 +274,30 @@ def m3dDotProduct(u, v):
 # Calculate the plane equation of the plane that the three specified points lay in. The
 # points are given in clockwise winding order, with normal pointing out of clockwise face
 # planeEq contains the A,B,C, and D of the plane equation coefficients
-def m3dGetPlaneEquation(p1, p2, p3):
-    planeEq = M3DVector4f()
-    (v1, v2) = (M3DVector3f(), M3DVector3f())
-    
+# The result goes in planeEq if it is given, otherwise in a new M3DVector4f.
+def m3dGetPlaneEquation(p1, p2, p3, planeEq=None):
     # V1 = p3 - p1
-    v1[0] = p3[0] - p1[0]
-    v1[1] = p3[1] - p1[1]
-    v1[2] = p3[2] - p1[2]
+    v1x = p3[0] - p1[0]
+    v1y = p3[1] - p1[1]
+    v1z = p3[2] - p1[2]
 
     # V2 = P2 - p1
-    v2[0] = p2[0] - p1[0]
-    v2[1] = p2[1] - p1[1]
-    v2[2] = p2[2] - p1[2]
+    v2x = p2[0] - p1[0]
+    v2y = p2[1] - p1[1]
+    v2z = p2[2] - p1[2]
 
     # Unit normal to plane - Not sure which is the best way here
-    planeEq3 = m3dCrossProduct(v1, v2)
-    m3dNormalizeVector(planeEq3)
+    a = v1y*v2z - v2y*v1z
+    b = -v1x*v2z + v2x*v1z
+    c = v1x*v2y - v2x*v1y
+    scale = 1.0 / ((a * a + b * b + c * c) ** 0.5)
     
     # Back substitute to get D
-    planeEq[0] = planeEq3[0]
-    planeEq[1] = planeEq3[1]
-    planeEq[2] = planeEq3[2]
+    if planeEq is None:
+        planeEq = M3DVector4f()
+    planeEq[0] = a * scale
+    planeEq[1] = b * scale
+    planeEq[2] = c * scale
     
     planeEq[3] = -(planeEq[0] * p3[0] + planeEq[1] * p3[1] + planeEq[2] * p3[2])
     
@@ -252,9 +307,10 @@ def m3dGetPlaneEquation(p1, p2, p3):
 # Creae a projection to "squish" an object into the plane.
 # Use m3dGetPlaneEquationf( point1, point2, point3)
 # to get a plane equation.
-
-def m3dMakePlanarShadowMatrix(planeEq, vLightPos):
-    proj = M3DMatrix44f()
+# The matrix goes in proj if it is given, otherwise in a new M3DMatrix44f.
+def m3dMakePlanarShadowMatrix(planeEq, vLightPos, proj=None):
+    if proj is None:
+        proj = M3DMatrix44f()
     
     # these make the code below easier to read.
     a = planeEq[0]
@@ -288,4 +344,726 @@ def m3dMakePlanarShadowMatrix(planeEq, vLightPos):
     proj[15] = a * dx + b * dy + c * dz
     # Shadow matrix ready
     return proj
-    
\ No newline at end of file
+
+# A pool of scratch vectors and matrices to pass as the out arguments above,
+# so a frame can be drawn without allocating any new ctypes arrays. Take what
+# you need during the frame and call Reset() at the start of the next one;
+# the same arrays are then handed out again in the same order. Anything that
+# has to outlive the frame should not come from here.
+class M3DScratchPool(object):
+    def __init__(self):
+        self.pools = {}     # ctypes type -> [arrays, number in use]
+        self.allocated = 0  # How many arrays the pool has ever made
+
+    def Get(self, ctype):
+        pool = self.pools.get(ctype)
+        if pool is None:
+            pool = self.pools[ctype] = [[], 0]
+        (arrays, used) = pool
+        if used == len(arrays):
+            arrays.append(ctype())
+            self.allocated += 1
+        pool[1] = used + 1
+        return arrays[used]
+
+    def Vector3(self):
+        return self.Get(M3DVector3f)
+
+    def Vector4(self):
+        return self.Get(M3DVector4f)
+
+    def Matrix44(self):
+        return self.Get(M3DMatrix44f)
+
+    def Reset(self):
+        for pool in self.pools.values():
+            pool[1] = 0
+
+# Shared pool for single threaded code such as the demos
+m3dScratch = M3DScratchPool()
+
+###########################################################
+# Quaternions
+# Stored x, y, z, w in an M3DQuaternionf. Angles are in radians, and rotate
+# counter clockwise looking down the axis, like glRotatef. (Note that
+# m3dRotationMatrix44 above goes the other way.) The matrices are column
+# major, ready for glMultMatrixf.
+
+def m3dLoadIdentityQuat(q):
+    q[0] = q[1] = q[2] = 0.0
+    q[3] = 1.0
+
+# Make q a rotation of angle around the axis (x, y, z)
+def m3dQuatFromAxisAngle(q, angle, x, y, z):
+    mag = (x * x + y * y + z * z) ** 0.5
+    if mag == 0.0:
+        m3dLoadIdentityQuat(q)
+        return q
+    s = sin(angle * 0.5) / mag
+    q[0] = x * s
+    q[1] = y * s
+    q[2] = z * s
+    q[3] = cos(angle * 0.5)
+    return q
+
+# product = a * b, the rotation b followed by a. product may be a or b.
+def m3dQuatMultiply(product, a, b):
+    ax = a[0]; ay = a[1]; az = a[2]; aw = a[3]
+    bx = b[0]; by = b[1]; bz = b[2]; bw = b[3]
+    product[0] = aw * bx + ax * bw + ay * bz - az * by
+    product[1] = aw * by - ax * bz + ay * bw + az * bx
+    product[2] = aw * bz + ax * by - ay * bx + az * bw
+    product[3] = aw * bw - ax * bx - ay * by - az * bz
+    return product
+
+# Scale q back to unit length, to take out any drift from repeated updates
+def m3dQuatNormalize(q):
+    mag = (q[0] * q[0] + q[1] * q[1] + q[2] * q[2] + q[3] * q[3]) ** 0.5
+    if mag == 0.0:
+        m3dLoadIdentityQuat(q)
+        return q
+    mag = 1.0 / mag
+    q[0] *= mag
+    q[1] *= mag
+    q[2] *= mag
+    q[3] *= mag
+    return q
+
+# Rotate the vector v by q, into vOut (which may be v)
+def m3dQuatRotateVector3(vOut, q, v):
+    qx = q[0]; qy = q[1]; qz = q[2]; qw = q[3]
+    vx = v[0]; vy = v[1]; vz = v[2]
+    # t = 2 * (q x v), v' = v + w * t + q x t
+    tx = 2.0 * (qy * vz - qz * vy)
+    ty = 2.0 * (qz * vx - qx * vz)
+    tz = 2.0 * (qx * vy - qy * vx)
+    vOut[0] = vx + qw * tx + (qy * tz - qz * ty)
+    vOut[1] = vy + qw * ty + (qz * tx - qx * tz)
+    vOut[2] = vz + qw * tz + (qx * ty - qy * tx)
+    return vOut
+
+# Rotation matrix for the unit quaternion q. Only the rotation part of m is
+# written; the translation column is zeroed.
+def m3dQuatToMatrix44(m, q):
+    x = q[0]; y = q[1]; z = q[2]; w = q[3]
+    xx = x * x; yy = y * y; zz = z * z
+    xy = x * y; yz = y * z; zx = z * x
+    wx = w * x; wy = w * y; wz = w * z
+
+    m[0] = 1.0 - 2.0 * (yy + zz)
+    m[1] = 2.0 * (xy + wz)
+    m[2] = 2.0 * (zx - wy)
+    m[3] = 0.0
+
+    m[4] = 2.0 * (xy - wz)
+    m[5] = 1.0 - 2.0 * (xx + zz)
+    m[6] = 2.0 * (yz + wx)
+    m[7] = 0.0
+
+    m[8] = 2.0 * (zx + wy)
+    m[9] = 2.0 * (yz - wx)
+    m[10] = 1.0 - 2.0 * (xx + yy)
+    m[11] = 0.0
+
+    m[12] = 0.0
+    m[13] = 0.0
+    m[14] = 0.0
+    m[15] = 1.0
+    return m
+
+# Quaternion for the rotation part of m, which must be orthonormal
+def m3dMatrix44ToQuat(q, m):
+    # m[c * 4 + r] is row r, column c
+    trace = m[0] + m[5] + m[10]
+    if trace > 0.0:
+        s = 0.5 / ((trace + 1.0) ** 0.5)
+        q[3] = 0.25 / s
+        q[0] = (m[6] - m[9]) * s
+        q[1] = (m[8] - m[2]) * s
+        q[2] = (m[1] - m[4]) * s
+    elif m[0] > m[5] and m[0] > m[10]:
+        s = 2.0 * ((1.0 + m[0] - m[5] - m[10]) ** 0.5)
+        q[3] = (m[6] - m[9]) / s
+        q[0] = 0.25 * s
+        q[1] = (m[4] + m[1]) / s
+        q[2] = (m[8] + m[2]) / s
+    elif m[5] > m[10]:
+        s = 2.0 * ((1.0 + m[5] - m[0] - m[10]) ** 0.5)
+        q[3] = (m[8] - m[2]) / s
+        q[0] = (m[4] + m[1]) / s
+        q[1] = 0.25 * s
+        q[2] = (m[9] + m[6]) / s
+    else:
+        s = 2.0 * ((1.0 + m[10] - m[0] - m[5]) ** 0.5)
+        q[3] = (m[1] - m[4]) / s
+        q[0] = (m[8] + m[2]) / s
+        q[1] = (m[9] + m[6]) / s
+        q[2] = 0.25 * s
+    return q
+
+# Spherical linear interpolation from a (t = 0) to b (t = 1), the short way
+# around. The result goes in qOut, which may be a or b.
+def m3dQuatSlerp(qOut, a, b, t):
+    cosom = a[0] * b[0] + a[1] * b[1] + a[2] * b[2] + a[3] * b[3]
+    sign = 1.0
+    if cosom < 0.0:
+        cosom = -cosom
+        sign = -1.0
+
+    if cosom > 0.9995:
+        # Close enough that a straight line will do
+        s0 = 1.0 - t
+        s1 = t
+    else:
+        omega = acos(cosom)
+        sinom = sin(omega)
+        s0 = sin((1.0 - t) * omega) / sinom
+        s1 = sin(t * omega) / sinom
+    s1 *= sign
+
+    qOut[0] = s0 * a[0] + s1 * b[0]
+    qOut[1] = s0 * a[1] + s1 * b[1]
+    qOut[2] = s0 * a[2] + s1 * b[2]
+    qOut[3] = s0 * a[3] + s1 * b[3]
+    return m3dQuatNormalize(qOut)
+
+
+###########################################################
+# Batched versions of the vector routines above. These work on whole (N,3)
+# float32 numpy arrays in one call instead of one GLfloat * 3 at a time, so
+# they are the ones to use when pushing every vertex of a model through a
+# transform each frame. A single M3DVector3f is also accepted anywhere an
+# array is, and broadcasts against the others.
+
+def _m3dRequireNumpy():
+    if numpy is None:
+        print("You need Numpy.")
+        import sys
+        sys.exit(1)
+
+# View a ctypes GLfloat array (or anything array-like) as a float32 numpy
+# array. ctypes float arrays are wrapped without copying.
+def _m3dAsArray(a):
+    if isinstance(a, ctypes.Array):
+        t = type(a)
+        while issubclass(t, ctypes.Array):
+            t = t._type_
+        if t is GLfloat:
+            return numpy.frombuffer(a, numpy.float32)
+    return numpy.asarray(a, dtype=numpy.float32)
+
+# View a 4x4 matrix as a numpy (4,4) array. The matrix is column major, so
+# row i of the result is column i of the matrix (i.e. it is the transpose).
+def _m3dAsMatrix44(m):
+    return _m3dAsArray(m).reshape(4, 4)
+
+def _m3dAsVectors3(v):
+    v = _m3dAsArray(v)
+    if v.ndim == 1:
+        return v.reshape(-1, 3)
+    return v
+
+# Numpy views of the M3D types. These share memory with the ctypes arrays, so
+# nothing is copied in either direction and whatever is written through one
+# shows up in the other.
+
+# View M3DVector3f, M3DVector4f, M3DMatrix44f or an array of them as a float32
+# numpy array. Vectors come back as (3,) or (4,), and matrices as (4,4)
+# indexed [column][row], which is the transpose of the usual reading since
+# the storage is column major. An array of N of them gets a leading N axis.
+def m3dAsArray(a):
+    _m3dRequireNumpy()
+    shape = []
+    t = type(a)
+    while issubclass(t, ctypes.Array):
+        shape.append(t._length_)
+        t = t._type_
+    if t is not GLfloat:
+        raise TypeError("m3dAsArray: expected a GLfloat array, not %s" % type(a).__name__)
+    if shape[-1] == 16:
+        shape[-1:] = [4, 4]
+    return numpy.frombuffer(a, numpy.float32).reshape(shape)
+
+# The opposite of m3dAsArray: wrap a contiguous float32 numpy array in a ctypes
+# array of the given type (M3DMatrix44f, M3DVector4f, ...), without copying,
+# so it can be handed to glMultMatrixf, glLightfv, glTexGenfv and friends.
+# If ctype is None, a GLfloat array of the same size is used.
+def m3dAsCtypes(array, ctype=None):
+    if array.dtype != numpy.float32:
+        raise TypeError("m3dAsCtypes: expected a float32 array, not %s" % array.dtype)
+    if ctype is None:
+        ctype = GLfloat * array.size
+    return ctype.from_buffer(array)
+
+# Allocate n M3DMatrix44f (or whatever ctype is) that both GL and numpy can
+# use. Returns the ctypes array, whose items can be passed straight to GL, and
+# a numpy view of the same memory for doing the math on all of them at once.
+def m3dAllocArray(ctype, n):
+    data = (ctype * n)()
+    return data, m3dAsArray(data)
+
+# Transform every point in v (N,3) by the matrix m. The result goes in vOut
+# (an (N,3) numpy array or an array of M3DVector3f), which is allocated if
+# None, and is returned.
+def m3dTransformVector3Array(vOut, v, m):
+    _m3dRequireNumpy()
+    v = _m3dAsVectors3(v)
+    mt = _m3dAsMatrix44(m)
+    if vOut is None:
+        result = numpy.dot(v, mt[:3, :3])
+        result += mt[3, :3]
+        return result
+
+    # numpy.dot only writes straight into a contiguous array of its own
+    # dtype, so anything else gets a copy of the result
+    if isinstance(vOut, numpy.ndarray):
+        out = vOut.reshape(-1, 3)
+    else:
+        out = _m3dAsVectors3(vOut)
+    if out.dtype != v.dtype or not out.flags.c_contiguous or numpy.may_share_memory(out, v):
+        result = numpy.dot(v, mt[:3, :3])
+        result += mt[3, :3]
+        out[...] = result
+    else:
+        numpy.dot(v, mt[:3, :3], out=out)
+        out += mt[3, :3]
+    return vOut
+
+# u x v for each row. Returns a new (N,3) array unless out is given.
+def m3dCrossProductArray(u, v, out=None):
+    _m3dRequireNumpy()
+    u = _m3dAsVectors3(u)
+    v = _m3dAsVectors3(v)
+
+    x = u[:, 1] * v[:, 2] - v[:, 1] * u[:, 2]
+    y = -u[:, 0] * v[:, 2] + v[:, 0] * u[:, 2]
+    z = u[:, 0] * v[:, 1] - v[:, 0] * u[:, 1]
+
+    if out is None:
+        out = numpy.empty((len(x), 3), numpy.float32)
+    out[:, 0] = x
+    out[:, 1] = y
+    out[:, 2] = z
+    return out
+
+# u dot v for each row, returned as an (N,) array
+def m3dDotProductArray(u, v):
+    _m3dRequireNumpy()
+    u = _m3dAsVectors3(u)
+    v = _m3dAsVectors3(v)
+    return (u * v).sum(axis=1)
+
+# Scale every row of u to unit length, in place. Zero length rows are left
+# alone rather than turned into NaNs.
+def m3dNormalizeVectorArray(u):
+    _m3dRequireNumpy()
+    u = _m3dAsVectors3(u)
+    length = numpy.sqrt((u * u).sum(axis=1))
+    length[length == 0.0] = 1.0
+    u /= length[:, numpy.newaxis]
+    return u
+
+# Normals of a batch of triangles given as three (N,3) arrays of points,
+# wound counter clockwise. Like m3dFindNormal the normals are not unit length.
+def m3dFindNormalArray(point1, point2, point3, out=None):
+    _m3dRequireNumpy()
+    point1 = _m3dAsVectors3(point1)
+    point2 = _m3dAsVectors3(point2)
+    point3 = _m3dAsVectors3(point3)
+    return m3dCrossProductArray(point1 - point2, point2 - point3, out)
+
+# Invert a whole stack of matrices, (N,4,4) or (N,16), with the same cofactor
+# expansion as m3dInvertMatrix44. The result goes in dst (allocated if None)
+# and is returned. Singular matrices come back as all zeros.
+def m3dInvertMatrix44Array(dst, src):
+    _m3dRequireNumpy()
+    a = _m3dAsArray(src).reshape(-1, 16)
+    (a00, a01, a02, a03, a10, a11, a12, a13,
+     a20, a21, a22, a23, a30, a31, a32, a33) = a.T
+
+    s0 = a00 * a11 - a10 * a01
+    s1 = a00 * a12 - a10 * a02
+    s2 = a00 * a13 - a10 * a03
+    s3 = a01 * a12 - a11 * a02
+    s4 = a01 * a13 - a11 * a03
+    s5 = a02 * a13 - a12 * a03
+
+    c5 = a22 * a33 - a32 * a23
+    c4 = a21 * a33 - a31 * a23
+    c3 = a21 * a32 - a31 * a22
+    c2 = a20 * a33 - a30 * a23
+    c1 = a20 * a32 - a30 * a22
+    c0 = a20 * a31 - a30 * a21
+
+    det = s0 * c5 - s1 * c4 + s2 * c3 + s3 * c2 - s4 * c1 + s5 * c0
+    singular = (det == 0.0)
+    det[singular] = 1.0
+    invdet = 1.0 / det
+    invdet[singular] = 0.0
+
+    result = numpy.empty((len(a), 16), numpy.float32)
+    result[:, 0] = (a11 * c5 - a12 * c4 + a13 * c3) * invdet
+    result[:, 1] = (-a01 * c5 + a02 * c4 - a03 * c3) * invdet
+    result[:, 2] = (a31 * s5 - a32 * s4 + a33 * s3) * invdet
+    result[:, 3] = (-a21 * s5 + a22 * s4 - a23 * s3) * invdet
+
+    result[:, 4] = (-a10 * c5 + a12 * c2 - a13 * c1) * invdet
+    result[:, 5] = (a00 * c5 - a02 * c2 + a03 * c1) * invdet
+    result[:, 6] = (-a30 * s5 + a32 * s2 - a33 * s1) * invdet
+    result[:, 7] = (a20 * s5 - a22 * s2 + a23 * s1) * invdet
+
+    result[:, 8] = (a10 * c4 - a11 * c2 + a13 * c0) * invdet
+    result[:, 9] = (-a00 * c4 + a01 * c2 - a03 * c0) * invdet
+    result[:, 10] = (a30 * s4 - a31 * s2 + a33 * s0) * invdet
+    result[:, 11] = (-a20 * s4 + a21 * s2 - a23 * s0) * invdet
+
+    result[:, 12] = (-a10 * c3 + a11 * c1 - a12 * c0) * invdet
+    result[:, 13] = (a00 * c3 - a01 * c1 + a02 * c0) * invdet
+    result[:, 14] = (-a30 * s3 + a31 * s1 - a32 * s0) * invdet
+    result[:, 15] = (a20 * s3 - a21 * s1 + a22 * s0) * invdet
+
+    if dst is None:
+        return result.reshape(_m3dAsArray(src).shape)
+    _m3dAsArray(dst).reshape(-1, 16)[...] = result
+    return dst
+
+# Batched m3dInvertRigidMatrix44 for (N,4,4) or (N,16) stacks.
+def m3dInvertRigidMatrix44Array(dst, src):
+    _m3dRequireNumpy()
+    a = _m3dAsArray(src).reshape(-1, 4, 4)
+    result = numpy.zeros(a.shape, numpy.float32)
+    rot = a[:, :3, :3]
+    result[:, :3, :3] = rot.transpose(0, 2, 1)
+    result[:, 3, :3] = -numpy.einsum('nij,nj->ni', rot, a[:, 3, :3])
+    result[:, 3, 3] = 1.0
+
+    if dst is None:
+        return result.reshape(_m3dAsArray(src).shape)
+    _m3dAsArray(dst).reshape(-1, 4, 4)[...] = result
+    return dst
+
+# Multiply two stacks of 4x4 matrices, product = a * b for each pair, with
+# the same column major convention as m3dMatrixMultiply44. Either a or b may
+# be a single matrix, which is then used against every matrix in the other.
+# The result goes in product (allocated if None) and is returned.
+def m3dMatrixMultiply44Array(product, a, b):
+    _m3dRequireNumpy()
+    at = _m3dAsArray(a).reshape(-1, 4, 4)
+    bt = _m3dAsArray(b).reshape(-1, 4, 4)
+
+    # The arrays hold the transposes of the matrices, and
+    # transpose(a * b) = transpose(b) * transpose(a)
+    if product is None:
+        return numpy.matmul(bt, at)
+    out = _m3dAsArray(product).reshape(-1, 4, 4)
+    if numpy.may_share_memory(out, at) or numpy.may_share_memory(out, bt):
+        out[...] = numpy.matmul(bt, at)
+    else:
+        numpy.matmul(bt, at, out=out)
+    return product
+
+# Build a stack of rotation matrices, one per angle (in radians) around the
+# matching axis, like m3dRotationMatrix44. axes is (N,3), or a single axis to
+# use for every angle. The (N,4,4) result goes in m (allocated if None) and
+# is returned.
+def m3dRotationMatrix44Array(m, angles, axes):
+    _m3dRequireNumpy()
+    angles = numpy.asarray(angles, dtype=numpy.float32).ravel()
+    axes = _m3dAsVectors3(axes)
+    if len(axes) == 1:
+        axes = numpy.repeat(axes, len(angles), axis=0)
+
+    s = numpy.sin(angles)
+    c = numpy.cos(angles)
+    mag = numpy.sqrt((axes * axes).sum(axis=1))
+    degenerate = (mag == 0.0)
+    mag[degenerate] = 1.0
+    x = axes[:, 0] / mag
+    y = axes[:, 1] / mag
+    z = axes[:, 2] / mag
+
+    xx = x * x
+    yy = y * y
+    zz = z * z
+    xy = x * y
+    yz = y * z
+    zx = z * x
+    xs = x * s
+    ys = y * s
+    zs = z * s
+    one_c = 1.0 - c
+
+    if m is None:
+        m = numpy.empty((len(angles), 4, 4), numpy.float32)
+    out = _m3dAsArray(m).reshape(-1, 16)
+
+    out[:, 0] = (one_c * xx) + c
+    out[:, 1] = (one_c * xy) - zs
+    out[:, 2] = (one_c * zx) + ys
+    out[:, 3] = 0.0
+
+    out[:, 4] = (one_c * xy) + zs
+    out[:, 5] = (one_c * yy) + c
+    out[:, 6] = (one_c * yz) - xs
+    out[:, 7] = 0.0
+
+    out[:, 8] = (one_c * zx) - ys
+    out[:, 9] = (one_c * yz) + xs
+    out[:, 10] = (one_c * zz) + c
+    out[:, 11] = 0.0
+
+    out[:, 12:15] = 0.0
+    out[:, 15] = 1.0
+
+    # Zero length axes give the identity, as in m3dRotationMatrix44
+    out[degenerate] = (1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0,
+                        0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0)
+    return m
+
+###########################################################
+# View frustum culling
+
+# Pull the six clipping planes (left, right, bottom, top, near, far) out of a
+# projection matrix and a modelview matrix, such as the ones gluPerspective
+# and the camera transform leave in GL. The planes face inward, are
+# normalized, and are in the space the modelview takes its points from, so
+# objects can be tested where they are without transforming them. If
+# modelview is None, proj is taken to be the combined matrix already. The
+# (6,4) A,B,C,D result goes in planes (allocated if None) and is returned.
+def m3dExtractFrustumPlanes(planes, proj, modelview=None):
+    _m3dRequireNumpy()
+    if modelview is None:
+        mt = _m3dAsMatrix44(proj)
+    else:
+        mt = numpy.dot(_m3dAsMatrix44(modelview), _m3dAsMatrix44(proj))
+
+    # mt holds the transpose, so its columns are the rows of the clip matrix
+    row0 = mt[:, 0]
+    row1 = mt[:, 1]
+    row2 = mt[:, 2]
+    row3 = mt[:, 3]
+
+    if planes is None:
+        planes = numpy.empty((6, 4), numpy.float32)
+    out = _m3dAsArray(planes).reshape(6, 4)
+    out[0] = row3 + row0    # Left
+    out[1] = row3 - row0    # Right
+    out[2] = row3 + row1    # Bottom
+    out[3] = row3 - row1    # Top
+    out[4] = row3 + row2    # Near
+    out[5] = row3 - row2    # Far
+    out /= numpy.sqrt((out[:, :3] * out[:, :3]).sum(axis=1))[:, numpy.newaxis]
+    return planes
+
+# Test a batch of bounding spheres, centers (N,3) and radii (N,) or a single
+# radius for all of them, against frustum planes. Returns an (N,) boolean
+# array that is True for every sphere that is at least partly inside.
+def m3dSpheresInFrustum(planes, centers, radii):
+    _m3dRequireNumpy()
+    planes = _m3dAsArray(planes).reshape(6, 4)
+    centers = _m3dAsVectors3(centers)
+    radii = numpy.asarray(radii, dtype=numpy.float32)
+
+    # Signed distance of every center from every plane, (N,6)
+    distance = numpy.dot(centers, planes[:, :3].T) + planes[:, 3]
+    if radii.ndim:
+        radii = radii[:, numpy.newaxis]
+    return (distance >= -radii).all(axis=1)
+
+# Test a batch of axis aligned boxes, given by their minimum and maximum
+# corners (N,3), against frustum planes. Returns an (N,) boolean array that
+# is True for every box that is at least partly inside. Like any plane test
+# this is conservative: a big box just outside a corner of the frustum can
+# still come back True.
+def m3dBoxesInFrustum(planes, mins, maxs):
+    _m3dRequireNumpy()
+    planes = _m3dAsArray(planes).reshape(6, 4)
+    mins = _m3dAsVectors3(mins)
+    maxs = _m3dAsVectors3(maxs)
+
+    # A box is outside a plane when even its corner furthest along the
+    # plane normal is behind it. In center/half extent form that corner is
+    # center + extent * |normal| along the normal.
+    centers = (mins + maxs) * 0.5
+    extents = (maxs - mins) * 0.5
+    distance = numpy.dot(centers, planes[:, :3].T) + planes[:, 3]
+    reach = numpy.dot(extents, numpy.abs(planes[:, :3]).T)
+    return (distance >= -reach).all(axis=1)
+
+###########################################################
+# Batched quaternions, as (N,4) float32 arrays of x, y, z, w. A single
+# M3DQuaternionf is accepted anywhere an array is and broadcasts.
+
+def _m3dAsQuats(q):
+    q = _m3dAsArray(q)
+    if q.ndim == 1:
+        return q.reshape(-1, 4)
+    return q
+
+# Quaternions for N rotations of angles around axes (N,3), or a single axis
+# for all of them. The result goes in q (allocated if None) and is returned.
+def m3dQuatFromAxisAngleArray(q, angles, axes):
+    _m3dRequireNumpy()
+    angles = numpy.asarray(angles, dtype=numpy.float32).ravel()
+    axes = _m3dAsVectors3(axes)
+    mag = numpy.sqrt((axes * axes).sum(axis=1))
+    degenerate = (mag == 0.0)
+    mag[degenerate] = 1.0
+
+    if q is None:
+        q = numpy.empty((len(angles), 4), numpy.float32)
+    out = _m3dAsQuats(q)
+    out[:, :3] = axes * (numpy.sin(angles * 0.5) / mag)[:, numpy.newaxis]
+    out[:, 3] = numpy.cos(angles * 0.5)
+    out[degenerate] = (0.0, 0.0, 0.0, 1.0)
+    return q
+
+# product = a * b for each pair, or one quaternion against a whole array
+def m3dQuatMultiplyArray(product, a, b):
+    _m3dRequireNumpy()
+    a = _m3dAsQuats(a)
+    b = _m3dAsQuats(b)
+    (ax, ay, az, aw) = (a[:, 0], a[:, 1], a[:, 2], a[:, 3])
+    (bx, by, bz, bw) = (b[:, 0], b[:, 1], b[:, 2], b[:, 3])
+
+    x = aw * bx + ax * bw + ay * bz - az * by
+    y = aw * by - ax * bz + ay * bw + az * bx
+    z = aw * bz + ax * by - ay * bx + az * bw
+    w = aw * bw - ax * bx - ay * by - az * bz
+
+    if product is None:
+        product = numpy.empty((len(x), 4), numpy.float32)
+    out = _m3dAsQuats(product)
+    out[:, 0] = x
+    out[:, 1] = y
+    out[:, 2] = z
+    out[:, 3] = w
+    return product
+
+# Scale every quaternion in q back to unit length, in place
+def m3dQuatNormalizeArray(q):
+    _m3dRequireNumpy()
+    q = _m3dAsQuats(q)
+    mag = numpy.sqrt((q * q).sum(axis=1))
+    degenerate = (mag == 0.0)
+    mag[degenerate] = 1.0
+    q /= mag[:, numpy.newaxis]
+    q[degenerate] = (0.0, 0.0, 0.0, 1.0)
+    return q
+
+# Rotate vectors v (N,3) by quaternions q (N,4), either of which may be single
+def m3dQuatRotateVector3Array(vOut, q, v):
+    _m3dRequireNumpy()
+    q = _m3dAsQuats(q)
+    v = _m3dAsVectors3(v)
+    u = q[:, :3]
+    t = 2.0 * m3dCrossProductArray(u, v)
+    result = v + q[:, 3:4] * t + m3dCrossProductArray(u, t)
+    if vOut is None:
+        return result
+    vOut[...] = result
+    return vOut
+
+# (N,4,4) rotation matrices for the unit quaternions q, like m3dQuatToMatrix44
+def m3dQuatToMatrix44Array(m, q):
+    _m3dRequireNumpy()
+    q = _m3dAsQuats(q)
+    (x, y, z, w) = (q[:, 0], q[:, 1], q[:, 2], q[:, 3])
+    xx = x * x; yy = y * y; zz = z * z
+    xy = x * y; yz = y * z; zx = z * x
+    wx = w * x; wy = w * y; wz = w * z
+
+    if m is None:
+        m = numpy.empty((len(q), 4, 4), numpy.float32)
+    out = _m3dAsArray(m).reshape(-1, 16)
+    out[:, 0] = 1.0 - 2.0 * (yy + zz)
+    out[:, 1] = 2.0 * (xy + wz)
+    out[:, 2] = 2.0 * (zx - wy)
+    out[:, 4] = 2.0 * (xy - wz)
+    out[:, 5] = 1.0 - 2.0 * (xx + zz)
+    out[:, 6] = 2.0 * (yz + wx)
+    out[:, 8] = 2.0 * (zx + wy)
+    out[:, 9] = 2.0 * (yz - wx)
+    out[:, 10] = 1.0 - 2.0 * (xx + yy)
+    out[:, (3, 7, 11, 12, 13, 14)] = 0.0
+    out[:, 15] = 1.0
+    return m
+
+# Quaternions for the rotation parts of a stack of orthonormal matrices
+def m3dMatrix44ToQuatArray(q, m):
+    _m3dRequireNumpy()
+    a = _m3dAsArray(m).reshape(-1, 16)
+    (m0, m1, m2, m4, m5, m6, m8, m9, m10) = (a[:, 0], a[:, 1], a[:, 2], a[:, 4],
+                                             a[:, 5], a[:, 6], a[:, 8], a[:, 9], a[:, 10])
+
+    # Recover the magnitudes of all four components from the diagonal, then
+    # divide the off diagonal terms by the largest one to get the others
+    # (and their signs) without losing precision.
+    four = numpy.empty((len(a), 4), numpy.float32)
+    four[:, 0] = 1.0 + m0 - m5 - m10
+    four[:, 1] = 1.0 - m0 + m5 - m10
+    four[:, 2] = 1.0 - m0 - m5 + m10
+    four[:, 3] = 1.0 + m0 + m5 + m10
+    biggest = four.argmax(axis=1)
+    s = 0.5 * numpy.sqrt(numpy.maximum(four[numpy.arange(len(a)), biggest], 1e-12))
+    inv = 0.25 / s
+
+    result = numpy.empty((len(a), 4), numpy.float32)
+    cases = (
+        (s, (m4 + m1) * inv, (m8 + m2) * inv, (m6 - m9) * inv),
+        ((m4 + m1) * inv, s, (m9 + m6) * inv, (m8 - m2) * inv),
+        ((m8 + m2) * inv, (m9 + m6) * inv, s, (m1 - m4) * inv),
+        ((m6 - m9) * inv, (m8 - m2) * inv, (m1 - m4) * inv, s))
+    for (i, case) in enumerate(cases):
+        rows = (biggest == i)
+        for j in range(4):
+            result[rows, j] = case[j][rows]
+
+    if q is None:
+        return result
+    _m3dAsQuats(q)[...] = result
+    return q
+
+# Normalized linear interpolation from a to b by t, which is a scalar or (N,)
+# array. Cheaper than slerp and fine for small steps between orientations.
+def m3dQuatNlerpArray(qOut, a, b, t):
+    _m3dRequireNumpy()
+    a = _m3dAsQuats(a)
+    b = _m3dAsQuats(b)
+    t = numpy.asarray(t, dtype=numpy.float32).reshape(-1, 1)
+
+    # Go the short way around
+    sign = numpy.where((a * b).sum(axis=1) < 0.0, -1.0, 1.0).astype(numpy.float32)[:, numpy.newaxis]
+    result = a * (1.0 - t) + b * (t * sign)
+    m3dQuatNormalizeArray(result)
+    if qOut is None:
+        return result
+    _m3dAsQuats(qOut)[...] = result
+    return qOut
+
+# Spherical linear interpolation from a (t = 0) to b (t = 1) for whole arrays
+# of quaternions, like m3dQuatSlerp. t is a scalar or (N,) array.
+def m3dQuatSlerpArray(qOut, a, b, t):
+    _m3dRequireNumpy()
+    a = _m3dAsQuats(a)
+    b = _m3dAsQuats(b)
+    t = numpy.asarray(t, dtype=numpy.float32).ravel()
+
+    cosom = (a * b).sum(axis=1)
+    sign = numpy.where(cosom < 0.0, -1.0, 1.0).astype(numpy.float32)
+    cosom = numpy.minimum(numpy.abs(cosom), 1.0)
+
+    # Fall back to a straight line where the two are very close
+    close = cosom > 0.9995
+    omega = numpy.arccos(cosom)
+    sinom = numpy.sin(omega)
+    sinom[close] = 1.0
+    s0 = numpy.where(close, 1.0 - t, numpy.sin((1.0 - t) * omega) / sinom)
+    s1 = numpy.where(close, t, numpy.sin(t * omega) / sinom) * sign
+
+    result = a * s0[:, numpy.newaxis].astype(numpy.float32) + b * s1[:, numpy.newaxis].astype(numpy.float32)
+    m3dQuatNormalizeArray(result)
+    if qOut is None:
+        return result
+    _m3dAsQuats(qOut)[...] = result
+    return qOut
@@ -0,0 +1,157 @@
+# A process wide cache of the meshes built for the primitives in fakeglut and
+# gltools, so each one is only tessellated once however often it is drawn.
+
+from collections import OrderedDict
+from pyglet.gl import *
+
+# Numpy is needed to build meshes
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Meshes are (vertices, indices) pairs of numpy arrays: vertices is (N,8)
+# float32, each texture coordinate, normal and position (s, t, nx, ny, nz, x,
+# y, z, the layout of GL_T2F_N3F_V3F), and indices is uint32.
+#
+# The cache holds meshes up to a budget of bytes, throwing out the least
+# recently used ones to stay under it. The newest mesh is always kept, even
+# if it is bigger than the whole budget. The arrays of cached meshes are made
+# read only, as they are shared.
+class MeshCache(object):
+    def __init__(self, budget = 16 * 1024 * 1024):
+        self.budget = budget
+        self.size = 0           # Bytes held
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._meshes = OrderedDict()    # Least recently used first
+
+    def __len__(self):
+        return len(self._meshes)
+
+    def __contains__(self, key):
+        return key in self._meshes
+
+    # The mesh for key, a tuple of the primitive's name and parameters. If
+    # it is not cached, build() is called to make it.
+    def Get(self, key, build):
+        mesh = self._meshes.pop(key, None)
+        if mesh is not None:
+            # Put it back at the most recently used end
+            self._meshes[key] = mesh
+            self.hits += 1
+            return mesh
+
+        self.misses += 1
+        mesh = build()
+        for array in mesh:
+            array.flags.writeable = False
+        self._meshes[key] = mesh
+        self.size += _MeshSize(mesh)
+        self._Evict()
+        return mesh
+
+    # Change the budget, evicting meshes if it has shrunk
+    def SetBudget(self, budget):
+        self.budget = budget
+        self._Evict()
+
+    # Throw out every mesh. The counters are left alone.
+    def Clear(self):
+        self._meshes.clear()
+        self.size = 0
+
+    def _Evict(self):
+        while self.size > self.budget and len(self._meshes) > 1:
+            (key, mesh) = self._meshes.popitem(last = False)
+            self.size -= _MeshSize(mesh)
+            self.evictions += 1
+
+def _MeshSize(mesh):
+    return sum([array.nbytes for array in mesh])
+
+# The cache used by all the primitives
+meshCache = MeshCache()
+
+# Indices for a (rows, cols) grid of vertices as one triangle strip. Strip s
+# runs (s, c), (s + 1, c) for each column c, and the strips are joined by
+# repeating the last index of one and the first of the next, which makes
+# degenerate triangles that are not drawn. Put a seam at the last column (the
+# same positions as the first) and the joins are between vertices in the
+# same place, so they don't show as lines in wireframe either.
+def gltGridStrips(rows, cols):
+    stripLength = 2 * cols
+    first = numpy.arange(rows - 1, dtype=numpy.uint32)[:, numpy.newaxis] * cols
+    column = numpy.arange(cols, dtype=numpy.uint32)
+    strips = numpy.empty((rows - 1, stripLength + 2), numpy.uint32)
+    strips[:, 0:stripLength:2] = first + column
+    strips[:, 1:stripLength:2] = first + column + cols
+    strips[:, stripLength] = strips[:, stripLength - 1]
+    strips[:, stripLength + 1] = numpy.roll(strips[:, 0], -1)
+    return strips.ravel()[:-2]
+
+# Point the vertex arrays at vertices laid out as in a mesh, stride bytes
+# apart from address (in memory, or in the bound buffer object). Leave out
+# the texture coordinates with bTexture False, and the normals with bNormals
+# False.
+def _SetPointers(stride, address, bTexture, bNormals):
+    if not bNormals:
+        glInterleavedArrays(GL_V3F, stride, address + 20)
+        if bTexture:
+            glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+            glTexCoordPointer(2, GL_FLOAT, stride, address)
+    elif bTexture:
+        glInterleavedArrays(GL_T2F_N3F_V3F, stride, address)
+    else:
+        glInterleavedArrays(GL_N3F_V3F, stride, address + 8)
+
+# Draw a mesh in one call. Leave out the texture coordinates with bTexture
+# False, and the normals with bNormals False.
+def gltDrawMesh(mesh, mode = GL_TRIANGLE_STRIP, bTexture = True, bNormals = True):
+    (vertices, indices) = mesh
+    glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+    _SetPointers(vertices.strides[0], vertices.ctypes.data, bTexture, bNormals)
+    glDrawElements(mode, len(indices), GL_UNSIGNED_INT, indices.ctypes.data)
+    glPopClientAttrib()
+
+# A mesh copied into vertex and index buffer objects, so drawing it doesn't
+# send the vertices to GL every time. Needs OpenGL 1.5 (or
+# GL_ARB_vertex_buffer_object) and a current context; call Delete to free
+# the buffers. Use GL_DYNAMIC_DRAW for usage if the vertices will be changed
+# with SetVertices.
+class MeshBuffer(object):
+    def __init__(self, mesh, mode = GL_TRIANGLE_STRIP, usage = GL_STATIC_DRAW):
+        (vertices, indices) = mesh
+        self.mode = mode
+        self.count = len(indices)
+        self.stride = vertices.strides[0]
+
+        self.buffers = (GLuint * 2)()
+        glGenBuffers(2, self.buffers)
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffers[0])
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices.ctypes.data, usage)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.buffers[1])
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices.ctypes.data, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    # Replace the vertices from first on with vertices, laid out as before
+    def SetVertices(self, vertices, first = 0):
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffers[0])
+        glBufferSubData(GL_ARRAY_BUFFER, first * self.stride, vertices.nbytes, vertices.ctypes.data)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    # As gltDrawMesh, from the buffers
+    def Draw(self, bTexture = True, bNormals = True):
+        glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffers[0])
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.buffers[1])
+        _SetPointers(self.stride, 0, bTexture, bNormals)
+        glDrawElements(self.mode, self.count, GL_UNSIGNED_INT, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glPopClientAttrib()
+
+    def Delete(self):
+        glDeleteBuffers(2, self.buffers)
@@ -0,0 +1,211 @@
+# Picking by casting the mouse's ray through the scene on the CPU, in place of
+# drawing the scene again in GL_SELECT mode through gluPickMatrix:
+#
+#   picker = Picker()
+#   picker.AddSphere((EARTH,), (-100.0, 0.0, -300.0), 30.0)
+#   picker.AddSphere((EARTH, MOON1), (-55.0, 0.0, -300.0), 5.0)
+#   ...
+#   # In on_resize, once the viewport and projection are set up
+#   picker.SetMatrices()
+#   ...
+#   names = picker.Pick(x, y)      # (EARTH, MOON1), or None
+#
+# Each object has a tuple of names, like the name stack when it would have
+# been drawn, and the names of the nearest object under the mouse are
+# returned. Objects are found with a bounding volume hierarchy and then hit
+# exactly, so a pick among 100000 objects takes a fraction of a millisecond.
+# Add objects where they are in the space the modelview matrix given to
+# SetMatrices takes points from; the hierarchy is built again on the next
+# pick after any are added.
+
+from math import sqrt
+from pyglet.gl import *
+from math3d import M3DMatrix44f, m3dLoadIdentity44, m3dMatrixMultiply44, m3dInvertMatrix44
+from bvh import BoundingVolumeHierarchy
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Kinds of shape
+_SPHERE = 0
+_TORUS = 1
+
+class Picker(object):
+    def __init__(self, leafSize = 4):
+        self.leafSize = leafSize
+        self.names = []         # The names of each object
+        self.bvh = None
+        self._shapes = []       # (kind, values...) of each object
+        self._mins = []
+        self._maxs = []
+        # What the objects are seen through, as last given to SetMatrices
+        self.mProjection = M3DMatrix44f()
+        self.mModelView = M3DMatrix44f()
+        m3dLoadIdentity44(self.mProjection)
+        m3dLoadIdentity44(self.mModelView)
+        self.viewport = (0, 0, 1, 1)
+        # From window coordinates back to the objects', in doubles
+        self._mInverse = [0.0] * 16
+        m3dLoadIdentity44(self._mInverse)
+
+    def __len__(self):
+        return len(self.names)
+
+    # Take the projection, modelview and viewport the objects are seen
+    # through, reading the ones not given from GL. Call it whenever any of
+    # them change.
+    def SetMatrices(self, mProjection = None, mModelView = None, viewport = None):
+        if mProjection is None:
+            glGetFloatv(GL_PROJECTION_MATRIX, self.mProjection)
+        else:
+            self.mProjection[:] = mProjection[0:16]
+        if mModelView is None:
+            glGetFloatv(GL_MODELVIEW_MATRIX, self.mModelView)
+        else:
+            self.mModelView[:] = mModelView[0:16]
+        if viewport is None:
+            viewport = (GLint * 4)()
+            glGetIntegerv(GL_VIEWPORT, viewport)
+        self.viewport = tuple(viewport)
+
+        m = [0.0] * 16
+        m3dMatrixMultiply44(m, self.mProjection, self.mModelView)
+        m3dInvertMatrix44(self._mInverse, m)
+
+    def AddSphere(self, names, vCenter, radius):
+        (x, y, z) = (float(vCenter[0]), float(vCenter[1]), float(vCenter[2]))
+        self._Add(names, (_SPHERE, x, y, z, float(radius)),
+                  (x - radius, y - radius, z - radius), (x + radius, y + radius, z + radius))
+
+    # Many spheres at once: a list of names for each, their (N,3) centers
+    # and (N,) radii
+    def AddSpheres(self, names, centers, radii):
+        centers = numpy.asarray(centers, numpy.float64).reshape(-1, 3)
+        radii = numpy.broadcast_to(numpy.asarray(radii, numpy.float64), (len(centers),))
+        self.names.extend([tuple(n) for n in names])
+        self._shapes.extend([(_SPHERE, x, y, z, r) for ((x, y, z), r) in zip(centers.tolist(), radii.tolist())])
+        self._mins.extend((centers - radii[:, numpy.newaxis]).tolist())
+        self._maxs.extend((centers + radii[:, numpy.newaxis]).tolist())
+        self.bvh = None
+
+    # A torus as gltDrawTorus draws it, around the z axis, placed by
+    # mTransform (a rotation and translation)
+    def AddTorus(self, names, majorRadius, minorRadius, mTransform):
+        mInverse = [0.0] * 16
+        m3dInvertMatrix44(mInverse, mTransform)
+        (x, y, z) = (mTransform[12], mTransform[13], mTransform[14])
+        radius = majorRadius + minorRadius
+        self._Add(names, (_TORUS, tuple(mInverse), float(majorRadius), float(minorRadius)),
+                  (x - radius, y - radius, z - radius), (x + radius, y + radius, z + radius))
+
+    def Clear(self):
+        self.names = []
+        self._shapes = []
+        self._mins = []
+        self._maxs = []
+        self.bvh = None
+
+    def _Add(self, names, shape, vMin, vMax):
+        self.names.append(tuple(names))
+        self._shapes.append(shape)
+        self._mins.append(vMin)
+        self._maxs.append(vMax)
+        self.bvh = None
+
+    # The ray under window coordinates (x, y) (from the bottom left, as
+    # pyglet gives them), as its origin on the near plane and its direction,
+    # of length one
+    def Ray(self, x, y):
+        (left, bottom, width, height) = self.viewport
+        nx = 2.0 * (x - left) / width - 1.0
+        ny = 2.0 * (y - bottom) / height - 1.0
+        near = _UnProject(self._mInverse, nx, ny, -1.0)
+        far = _UnProject(self._mInverse, nx, ny, 1.0)
+        direction = (far[0] - near[0], far[1] - near[1], far[2] - near[2])
+        length = sqrt(direction[0] * direction[0] + direction[1] * direction[1] + direction[2] * direction[2])
+        return (near, (direction[0] / length, direction[1] / length, direction[2] / length))
+
+    # The names of the nearest object along a ray and how far along it is
+    # hit, or None if nothing is. vDirection must be of length one.
+    def PickRay(self, vOrigin, vDirection):
+        if self.bvh is None:
+            self.bvh = BoundingVolumeHierarchy(self._mins, self._maxs, self.leafSize)
+        shapes = self._shapes
+        (ox, oy, oz) = (vOrigin[0], vOrigin[1], vOrigin[2])
+        (dx, dy, dz) = (vDirection[0], vDirection[1], vDirection[2])
+
+        def hit(item):
+            shape = shapes[item]
+            if shape[0] == _SPHERE:
+                return _RaySphere(ox, oy, oz, dx, dy, dz, shape)
+            return _RayTorus(ox, oy, oz, dx, dy, dz, shape)
+
+        result = self.bvh.Raycast(vOrigin, vDirection, hit)
+        if result is None:
+            return None
+        return (self.names[result[0]], result[1])
+
+    # The names of the nearest object under window coordinates (x, y), or
+    # None if there isn't one
+    def Pick(self, x, y):
+        (vOrigin, vDirection) = self.Ray(x, y)
+        result = self.PickRay(vOrigin, vDirection)
+        if result is None:
+            return None
+        return result[0]
+
+
+# Normalized device coordinates back to the objects' coordinates
+def _UnProject(m, x, y, z):
+    w = m[3] * x + m[7] * y + m[11] * z + m[15]
+    return ((m[0] * x + m[4] * y + m[8] * z + m[12]) / w,
+            (m[1] * x + m[5] * y + m[9] * z + m[13]) / w,
+            (m[2] * x + m[6] * y + m[10] * z + m[14]) / w)
+
+# Where a ray of unit direction first hits a sphere, if in front of it. From
+# inside, that is on the way out.
+def _RaySphere(ox, oy, oz, dx, dy, dz, shape):
+    lx = shape[1] - ox
+    ly = shape[2] - oy
+    lz = shape[3] - oz
+    b = lx * dx + ly * dy + lz * dz
+    c = lx * lx + ly * ly + lz * lz - shape[4] * shape[4]
+    discriminant = b * b - c
+    if discriminant < 0.0:
+        return None
+    s = sqrt(discriminant)
+    if b - s >= 0.0:
+        return b - s
+    if b + s >= 0.0:
+        return b + s
+    return None
+
+# Where a ray first hits a torus, from the smallest real root of the quartic
+# you get putting the ray into the torus's equation,
+#   (|p|^2 + R^2 - r^2)^2 = 4 R^2 (px^2 + py^2)
+# with the ray moved into the torus's own coordinates
+def _RayTorus(ox, oy, oz, dx, dy, dz, shape):
+    (m, major, minor) = shape[1:4]
+    px = m[0] * ox + m[4] * oy + m[8] * oz + m[12]
+    py = m[1] * ox + m[5] * oy + m[9] * oz + m[13]
+    pz = m[2] * ox + m[6] * oy + m[10] * oz + m[14]
+    (ox, oy, oz) = (px, py, pz)
+    (dx, dy, dz) = (m[0] * dx + m[4] * dy + m[8] * dz,
+                    m[1] * dx + m[5] * dy + m[9] * dz,
+                    m[2] * dx + m[6] * dy + m[10] * dz)
+
+    a = dx * dx + dy * dy + dz * dz
+    b = 2.0 * (ox * dx + oy * dy + oz * dz)
+    c = ox * ox + oy * oy + oz * oz + major * major - minor * minor
+    k = 4.0 * major * major
+    roots = numpy.roots((a * a, 2.0 * a * b, b * b + 2.0 * a * c - k * (dx * dx + dy * dy),
+                         2.0 * b * c - 2.0 * k * (ox * dx + oy * dy), c * c - k * (ox * ox + oy * oy)))
+
+    # A ray just grazing the surface gives a pair of roots a little off the
+    # real line
+    t = [root.real for root in roots if abs(root.imag) <= 1e-6 * (1.0 + abs(root.real)) and root.real >= 0.0]
+    if not t:
+        return None
+    return min(t)
@@ -0,0 +1,197 @@
+# A queue of things to draw, each with the texture, material and blending it
+# needs, drawn sorted so each state is set as few times as possible:
+#
+#   queue = RenderQueue()
+#   ...
+#   queue.Submit(DrawFloor, texture = textures[TEXTURE_FLOOR])
+#   queue.Submit(DrawTorus, textures[TORUS_TEXTURE], ((GL_SPECULAR, (1.0, 1.0, 1.0, 1.0)),))
+#   ...
+#   queue.Flush()
+#   print(queue.Report())
+#
+# Submit records the modelview matrix as it is, so items can be submitted
+# from inside the usual glPushMatrix/glPopMatrix nesting, and are drawn in
+# the same place when the queue is flushed.
+#
+# Each state is given a small number the first time it is seen, and the
+# numbers are packed into one key to sort on: blending outermost, then
+# texture, then material. Items with the same state are drawn in the order
+# they were submitted. Items given a blend are drawn after all the others,
+# but are sorted among themselves too, so only give one to items whose order
+# doesn't matter (such as stencilled shadows).
+#
+# A state of None means the state GL was in when Flush was called, and GL is
+# put back in it afterwards:
+#   texture     a texture object to bind to GL_TEXTURE_2D
+#   material    glMaterialfv settings for GL_FRONT, as ((pname, values), ...)
+#   blend       (sfactor, dfactor) for glBlendFunc, with GL_BLEND enabled, or
+#               False for blending off
+
+from operator import itemgetter
+from pyglet.gl import *
+from math3d import M3DMatrix44f
+
+_BITS = 21
+
+class RenderQueue(object):
+    def __init__(self):
+        self.items = []         # (key, draw, texture, material, blend, matrix)
+        # The number given each state, with None first
+        self._numbers = ({None: 0}, {None: 0}, {None: 0})
+        self._materials = {}    # Each material as ctypes arrays, ready for GL
+
+        # What the last Flush did, and the totals over all of them
+        self.nItems = 0
+        self.nChanges = 0
+        self.nChangesUnsorted = 0
+        self.nFlushes = 0
+        self.totalChanges = 0
+        self.totalChangesUnsorted = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    # Queue draw, called with no arguments, to be drawn with texture,
+    # material and blend. The modelview matrix to draw it with is read from
+    # GL, unless given as mModelView.
+    def Submit(self, draw, texture = None, material = None, blend = None, mModelView = None):
+        if mModelView is None:
+            mModelView = M3DMatrix44f()
+            glGetFloatv(GL_MODELVIEW_MATRIX, mModelView)
+        key = ((self._Number(2, blend) << (2 * _BITS)) | (self._Number(0, texture) << _BITS) |
+               self._Number(1, material))
+        self.items.append((key, draw, texture, material, blend, mModelView))
+
+    def _Number(self, kind, state):
+        numbers = self._numbers[kind]
+        number = numbers.get(state)
+        if number is None:
+            number = numbers[state] = len(numbers)
+            if kind == 1:
+                self._materials[state] = [(pname, (GLfloat * len(values))(*values)) for (pname, values) in state]
+        return number
+
+    # Draw everything queued, sorted by state, and empty the queue. Returns
+    # the number of state changes made.
+    def Flush(self):
+        items = self.items
+        self.items = []
+        self.nItems = len(items)
+
+        # What None means for each state
+        initial = (_GetTexture(), self._GetMaterial(items), _GetBlend())
+        self.nChangesUnsorted = _CountChanges(items, initial)
+        items.sort(key = itemgetter(0))
+
+        glPushMatrix()
+        current = [initial[0], initial[1], initial[2]]
+        nChanges = 0
+        for (key, draw, texture, material, blend, mModelView) in items:
+            nChanges += self._Apply(current, initial, texture, material, blend)
+            glLoadMatrixf(mModelView)
+            draw()
+        glPopMatrix()
+
+        # Back to how GL was
+        self._Apply(current, initial, None, None, None)
+
+        self.nChanges = nChanges
+        self.nFlushes += 1
+        self.totalChanges += nChanges
+        self.totalChangesUnsorted += self.nChangesUnsorted
+        return nChanges
+
+    # Set the states that differ from current, updating it. Returns how many
+    # there were.
+    def _Apply(self, current, initial, texture, material, blend):
+        nChanges = 0
+        if texture is None:
+            texture = initial[0]
+        if texture != current[0]:
+            glBindTexture(GL_TEXTURE_2D, texture)
+            current[0] = texture
+            nChanges += 1
+
+        if material is None:
+            material = initial[1]
+        if material != current[1]:
+            for (pname, values) in self._materials[material]:
+                glMaterialfv(GL_FRONT, pname, values)
+            current[1] = material
+            nChanges += 1
+
+        if blend is None:
+            blend = initial[2]
+        if blend != current[2]:
+            if blend is False:
+                glDisable(GL_BLEND)
+            else:
+                if current[2] is False:
+                    glEnable(GL_BLEND)
+                glBlendFunc(blend[0], blend[1])
+            current[2] = blend
+            nChanges += 1
+        return nChanges
+
+    # The material of GL's current values for each pname set by the
+    # materials of items, so setting it puts them back
+    def _GetMaterial(self, items):
+        pnames = set()
+        for item in items:
+            if item[3] is not None:
+                pnames.update([pname for (pname, values) in item[3]])
+        if not pnames:
+            return None
+        material = []
+        values = (GLfloat * 4)()
+        for pname in sorted(pnames):
+            glGetMaterialfv(GL_FRONT, pname, values)
+            material.append((pname, tuple(values[0:_MaterialSize(pname)])))
+        material = tuple(material)
+        self._Number(1, material)
+        return material
+
+    # How the last flush went, and the average over every flush so far
+    def Report(self):
+        if self.nFlushes == 0:
+            return "Nothing drawn"
+        return ("%d items, %d state changes (%d unsorted); on average %.1f per flush, %.1f saved by sorting" %
+                (self.nItems, self.nChanges, self.nChangesUnsorted, float(self.totalChanges) / self.nFlushes,
+                 float(self.totalChangesUnsorted - self.totalChanges) / self.nFlushes))
+
+
+# The state changes drawing items in the order given would make, counting as
+# Flush does from the initial state
+def _CountChanges(items, initial):
+    nChanges = 0
+    current = list(initial)
+    for item in items:
+        for kind in range(3):
+            state = item[2 + kind]
+            if state is None:
+                state = initial[kind]
+            if state != current[kind]:
+                current[kind] = state
+                nChanges += 1
+    return nChanges
+
+def _GetTexture():
+    texture = GLint()
+    glGetIntegerv(GL_TEXTURE_BINDING_2D, texture)
+    return texture.value
+
+# The blend state as the queue keeps it: False if blending is off, or
+# (sfactor, dfactor)
+def _GetBlend():
+    if not glIsEnabled(GL_BLEND):
+        return False
+    (src, dst) = (GLint(), GLint())
+    glGetIntegerv(GL_BLEND_SRC, src)
+    glGetIntegerv(GL_BLEND_DST, dst)
+    return (src.value, dst.value)
+
+# The number of values of a material parameter
+def _MaterialSize(pname):
+    if pname == GL_SHININESS:
+        return 1
+    return 4
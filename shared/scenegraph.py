@@ -0,0 +1,199 @@
+# A scene graph for hierarchies built with nested glPushMatrix, glRotatef and
+# glTranslatef, such as a moon going round a planet going round the sun:
+#
+#   sun = SceneNode(DrawSun)
+#   earth = sun.AddChild(SceneNode(DrawEarth))
+#   iEarthOrbit = earth.Rotate(0.0, 0.0, 1.0, 0.0)
+#   earth.Translate(105.0, 0.0, 0.0)
+#   ...
+#   earth.SetRotation(iEarthOrbit, fEarthRot)     # Each frame
+#   DrawScene(sun)
+#
+# Each node keeps its own transforms and the world matrix they make with its
+# parents', which is only worked out again after one of them changes. Turning
+# the earth's orbit recomputes the earth and the moon, and leaves the sun's
+# matrix alone. The world matrices are relative to the root of the graph (so
+# put the viewing transformation there, or leave it to the modelview matrix),
+# and can be used for picking and culling without reading GL's matrices back.
+
+from math import radians
+from pyglet.gl import *
+from math3d import M3DMatrix44f, M3DVector3f, m3dLoadIdentity44, m3dRotationMatrix44, m3dMatrixMultiply44
+
+# The kinds of transform, first in each of a node's transforms
+_TRANSLATE = 0
+_ROTATE = 1
+_SCALE = 2
+
+# Scratch space for building local matrices
+_mRotation = M3DMatrix44f()
+_mProduct = M3DMatrix44f()
+
+# A node of the graph. draw is called with no arguments to draw it, with its
+# world matrix multiplied onto the modelview matrix; nodes without one just
+# place their children. name, if given, is the GL selection name to draw it
+# with, pushed after the names of the nodes above it.
+class SceneNode(object):
+    def __init__(self, draw = None, name = None):
+        self.draw = draw
+        self.name = name
+        self.parent = None
+        self.children = []
+        self.bVisible = True            # Invisible nodes hide their children too
+        self.transforms = []            # [kind, values...], in the order they are applied
+        self.mLocal = M3DMatrix44f()
+        self.mWorld = M3DMatrix44f()
+        self.bLocalDirty = True
+        self.bWorldDirty = True
+
+    # Add node as the last child of this one, taking it from its old parent.
+    # Returns node.
+    def AddChild(self, node):
+        if node.parent is not None:
+            node.parent.children.remove(node)
+        node.parent = self
+        self.children.append(node)
+        node._Invalidate()
+        return node
+
+    def RemoveChild(self, node):
+        self.children.remove(node)
+        node.parent = None
+        node._Invalidate()
+
+    # Add transforms after the ones already there, as glTranslatef,
+    # glRotatef (angle in degrees) and glScalef would be called to draw the
+    # node. Each returns the index of the transform, for changing it later
+    # with the Set functions below.
+    def Translate(self, x, y, z):
+        return self._Add([_TRANSLATE, x, y, z])
+
+    def Rotate(self, angle, x, y, z):
+        return self._Add([_ROTATE, angle, x, y, z])
+
+    def Scale(self, x, y, z):
+        return self._Add([_SCALE, x, y, z])
+
+    def SetTranslation(self, i, x, y, z):
+        self.transforms[i][1:4] = (x, y, z)
+        self._Changed()
+
+    # Change the angle of rotation i, keeping its axis
+    def SetRotation(self, i, angle):
+        self.transforms[i][1] = angle
+        self._Changed()
+
+    def SetScale(self, i, x, y, z):
+        self.transforms[i][1:4] = (x, y, z)
+        self._Changed()
+
+    def _Add(self, transform):
+        self.transforms.append(transform)
+        self._Changed()
+        return len(self.transforms) - 1
+
+    def _Changed(self):
+        self.bLocalDirty = True
+        self._Invalidate()
+
+    # Mark the world matrices of this node and all below it out of date. A
+    # node's world matrix is never up to date when its parent's isn't, so
+    # there is no need to go below a node that is already out of date.
+    def _Invalidate(self):
+        nodes = [self]
+        while nodes:
+            node = nodes.pop()
+            if not node.bWorldDirty:
+                node.bWorldDirty = True
+                nodes.extend(node.children)
+
+    # The node's transforms, all in one matrix
+    def GetLocalMatrix(self):
+        if self.bLocalDirty:
+            m = self.mLocal
+            m3dLoadIdentity44(m)
+            for t in self.transforms:
+                if t[0] == _TRANSLATE:
+                    # Move the origin along the axes so far
+                    for r in range(3):
+                        m[12 + r] += m[r] * t[1] + m[4 + r] * t[2] + m[8 + r] * t[3]
+                elif t[0] == _SCALE:
+                    for r in range(3):
+                        m[r] *= t[1]
+                        m[4 + r] *= t[2]
+                        m[8 + r] *= t[3]
+                else:
+                    # m3dRotationMatrix44 turns the opposite way to glRotatef
+                    m3dRotationMatrix44(_mRotation, -radians(t[1]), t[2], t[3], t[4])
+                    m3dMatrixMultiply44(_mProduct, m, _mRotation)
+                    m[:] = _mProduct
+            self.bLocalDirty = False
+        return self.mLocal
+
+    # The node's matrix relative to the root, worked out again only if it or
+    # one of its parents has changed since the last time
+    def GetWorldMatrix(self):
+        if self.bWorldDirty:
+            if self.parent is None:
+                self.mWorld[:] = self.GetLocalMatrix()
+            else:
+                m3dMatrixMultiply44(self.mWorld, self.parent.GetWorldMatrix(), self.GetLocalMatrix())
+            self.bWorldDirty = False
+        return self.mWorld
+
+    # Where the node's origin is, relative to the root
+    def GetWorldPosition(self, vPosition = None):
+        if vPosition is None:
+            vPosition = M3DVector3f()
+        m = self.GetWorldMatrix()
+        vPosition[0] = m[12]
+        vPosition[1] = m[13]
+        vPosition[2] = m[14]
+        return vPosition
+
+    # The selection names of the node and the nodes above it, root first
+    def GetNames(self):
+        names = []
+        node = self
+        while node is not None:
+            if node.name is not None:
+                names.append(node.name)
+            node = node.parent
+        names.reverse()
+        return tuple(names)
+
+    # The nodes to draw in the graph from this node down, as (node, world
+    # matrix) pairs, parents before children. Invisible nodes are left out,
+    # with everything below them, as are nodes for which cull(node, world
+    # matrix) is True, if given.
+    def Traverse(self, cull = None):
+        items = []
+        nodes = [self]
+        while nodes:
+            node = nodes.pop()
+            if not node.bVisible:
+                continue
+            mWorld = node.GetWorldMatrix()
+            if cull is not None and cull(node, mWorld):
+                continue
+            if node.draw is not None:
+                items.append((node, mWorld))
+            nodes.extend(reversed(node.children))
+        return items
+
+
+# Draw the graph from root down, on top of the current modelview matrix. The
+# name stack is only touched for graphs with selection names.
+def DrawScene(root, cull = None):
+    names = ()
+    for (node, mWorld) in root.Traverse(cull):
+        nodeNames = node.GetNames()
+        if nodeNames != names:
+            glInitNames()
+            for name in nodeNames:
+                glPushName(name)
+            names = nodeNames
+        glPushMatrix()
+        glMultMatrixf(mWorld)
+        node.draw()
+        glPopMatrix()
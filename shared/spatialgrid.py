@@ -0,0 +1,297 @@
+# A uniform grid over the origins of many frames, for finding the ones near a
+# point or inside the view without looking at every one of them:
+#
+#   grid = SpatialGrid(2.0, spheres)        # A FrameArray or a list of GLFrames
+#   ...
+#   near = grid.QueryRadius(frameCamera.vOrigin, 5.0)
+#   (i, distance) = grid.Nearest(frameCamera.vOrigin)
+#   visible = grid.QueryFrustum(frustumPlanes, SPHERE_RADIUS)
+#   ...
+#   spheres.MoveForward(0.1, movers)
+#   grid.Update(movers)                     # Only the frames that moved
+#
+# Space is cut into cubes cellSize across, and each cube holds a list of the
+# frames whose origins are in it; empty cubes take no room. A query looks
+# only at the cubes it could reach, so with the cells about the size of the
+# queries the cost goes with the number of frames nearby rather than all of
+# them. Moving a frame only touches the grid when it crosses into another
+# cube.
+#
+# Cell coordinates are packed 21 bits each into one integer, so the grid
+# covers a million cells along each axis either side of the origin.
+
+from math import floor
+from math3d import m3dBoxesInFrustum, m3dSpheresInFrustum
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_INFINITY = float('inf')
+
+_BITS = 21
+_OFFSET = 1 << (_BITS - 1)
+
+# The key of an item that has been removed; no cell has it
+_NOWHERE = -1
+
+class SpatialGrid(object):
+    def __init__(self, cellSize, frames = None):
+        self.cellSize = float(cellSize)
+        self.frames = frames
+        self.cells = {}             # Key of each occupied cell -> its items
+        self.nItems = 0             # Items ever added, including removed ones
+        self._count = 0             # Items still in the grid
+        self._positions = numpy.zeros((0, 3))
+        self._keys = numpy.zeros(0, numpy.int64)
+        self._occupied = None       # (keys, coordinates) of the occupied cells
+        if frames is not None:
+            self.Build(_Origins(frames))
+
+    def __len__(self):
+        return self._count
+
+    # Where each item is, as last added, moved or updated; item i is row i.
+    # Don't modify it.
+    def GetPositions(self):
+        return self._positions[:self.nItems]
+
+    # Put points (N,3) in the grid as items 0 to N - 1, in place of anything
+    # there already. Much quicker than adding them one at a time.
+    def Build(self, points):
+        points = numpy.asarray(points, numpy.float64).reshape(-1, 3)
+        nItems = len(points)
+        self._positions = points.copy()
+        self._keys = self._Keys(points)
+        self.nItems = nItems
+        self._count = nItems
+
+        # Sort the items by cell and cut the sorted list where the cell changes
+        order = numpy.argsort(self._keys, kind='mergesort')
+        keys = self._keys[order]
+        bounds = numpy.flatnonzero(keys[1:] != keys[:-1]) + 1
+        firsts = keys[numpy.concatenate(([0], bounds))] if nItems else keys
+        self.cells = dict(zip(firsts.tolist(), [items.tolist() for items in numpy.split(order, bounds)]))
+        self._occupied = None
+
+    # Add an item at vPosition, returning its number
+    def Add(self, vPosition):
+        item = self.nItems
+        if item == len(self._positions):
+            # Room for twice as many, so adding is quick on average
+            size = max(16, 2 * item)
+            positions = numpy.zeros((size, 3))
+            positions[:item] = self._positions[:item]
+            keys = numpy.full(size, _NOWHERE, numpy.int64)
+            keys[:item] = self._keys[:item]
+            (self._positions, self._keys) = (positions, keys)
+        self.nItems += 1
+        self._count += 1
+        self._positions[item] = vPosition[0:3]
+        key = self._Key(vPosition)
+        self._keys[item] = key
+        self._Insert(item, key)
+        return item
+
+    # Take item out of the grid. Its number is not used again.
+    def Remove(self, item):
+        key = int(self._keys[item])
+        if key != _NOWHERE:
+            self._Discard(item, key)
+            self._keys[item] = _NOWHERE
+            self._count -= 1
+
+    # Move item to vPosition
+    def Move(self, item, vPosition):
+        self._positions[item] = vPosition[0:3]
+        old = int(self._keys[item])
+        key = self._Key(vPosition)
+        if key != old and old != _NOWHERE:
+            self._Discard(item, old)
+            self._Insert(item, key)
+            self._keys[item] = key
+
+    # Read the origins of the frames the grid was made with again, all of
+    # them or just those in indices, and move the items of any that have
+    # gone into another cell. Returns how many did. If frames have been
+    # added to the list since, the grid is built again.
+    def Update(self, indices = None):
+        if len(self.frames) != self.nItems:
+            self.Build(_Origins(self.frames))
+            return self.nItems
+        if indices is None:
+            indices = numpy.arange(self.nItems)
+            points = _Origins(self.frames)
+        else:
+            indices = numpy.asarray(indices, numpy.intp).reshape(-1)
+            if hasattr(self.frames, 'origins'):
+                points = self.frames.origins[indices]
+            else:
+                points = _Origins([self.frames[i] for i in indices.tolist()])
+
+        self._positions[indices] = points
+        old = self._keys[indices]
+        keys = self._Keys(numpy.asarray(points, numpy.float64))
+        moved = numpy.flatnonzero((keys != old) & (old != _NOWHERE))
+        for (item, oldKey, key) in zip(indices[moved].tolist(), old[moved].tolist(), keys[moved].tolist()):
+            self._Discard(item, oldKey)
+            self._Insert(item, key)
+        self._keys[indices[moved]] = keys[moved]
+        return len(moved)
+
+    def _Insert(self, item, key):
+        cell = self.cells.get(key)
+        if cell is None:
+            self.cells[key] = [item]
+            self._occupied = None
+        else:
+            cell.append(item)
+
+    def _Discard(self, item, key):
+        cell = self.cells[key]
+        cell.remove(item)
+        if not cell:
+            del self.cells[key]
+            self._occupied = None
+
+    # The cell coordinates of a point, and the key they pack into
+    def _Cell(self, vPoint):
+        size = self.cellSize
+        return (int(floor(vPoint[0] / size)), int(floor(vPoint[1] / size)), int(floor(vPoint[2] / size)))
+
+    def _Key(self, vPoint):
+        return _PackKey(*self._Cell(vPoint))
+
+    def _Keys(self, points):
+        cells = numpy.floor(points / self.cellSize).astype(numpy.int64) + _OFFSET
+        return (cells[:, 0] << (2 * _BITS)) | (cells[:, 1] << _BITS) | cells[:, 2]
+
+    # The keys of the occupied cells and their (M,3) coordinates, kept until
+    # a cell is emptied or filled
+    def _Occupied(self):
+        if self._occupied is None:
+            keys = numpy.array(sorted(self.cells), numpy.int64)
+            mask = (1 << _BITS) - 1
+            coordinates = numpy.column_stack((keys >> (2 * _BITS), (keys >> _BITS) & mask, keys & mask)) - _OFFSET
+            self._occupied = (keys, coordinates)
+        return self._occupied
+
+    # All the items in the cells from lo to hi (both included), as an array.
+    # When there are more cells in the box than occupied ones, it is quicker
+    # to go through the occupied ones instead.
+    def _Gather(self, lo, hi):
+        cells = self.cells
+        items = []
+        nCells = (hi[0] - lo[0] + 1) * (hi[1] - lo[1] + 1) * (hi[2] - lo[2] + 1)
+        if nCells <= len(cells):
+            for x in range(lo[0], hi[0] + 1):
+                for y in range(lo[1], hi[1] + 1):
+                    for z in range(lo[2], hi[2] + 1):
+                        cell = cells.get(_PackKey(x, y, z))
+                        if cell is not None:
+                            items.extend(cell)
+        else:
+            (keys, coordinates) = self._Occupied()
+            bInside = ((coordinates >= lo) & (coordinates <= hi)).all(axis=1)
+            for key in keys[bInside].tolist():
+                items.extend(cells[key])
+        return numpy.array(items, numpy.intp)
+
+    # The items within radius of vCenter, as an array in no particular order
+    def QueryRadius(self, vCenter, radius):
+        center = numpy.array(vCenter[0:3], numpy.float64)
+        lo = self._Cell(center - radius)
+        hi = self._Cell(center + radius)
+        items = self._Gather(lo, hi)
+        offsets = self._positions[items] - center
+        return items[(offsets * offsets).sum(axis=1) <= radius * radius]
+
+    # The nearest item to vPoint and how far away it is, as (item,
+    # distance), or None if there are none within maxDistance. Pass an
+    # item as exclude to find the nearest other than it.
+    #
+    # Cells are searched in rings around the one vPoint is in. Everything
+    # in ring r is at least r - 1 cells away, so once something has been
+    # found closer than that the rings further out can't hold anything
+    # nearer.
+    def Nearest(self, vPoint, maxDistance = _INFINITY, exclude = None):
+        if not self.cells:
+            return None
+        point = numpy.array(vPoint[0:3], numpy.float64)
+        center = self._Cell(point)
+        (keys, coordinates) = self._Occupied()
+        lo = coordinates.min(axis=0).tolist()
+        hi = coordinates.max(axis=0).tolist()
+
+        # Start at the first ring that reaches an occupied cell, and stop
+        # at the last
+        first = max([0] + [lo[a] - center[a] for a in range(3)] + [center[a] - hi[a] for a in range(3)])
+        last = max([abs(lo[a] - center[a]) for a in range(3)] + [abs(hi[a] - center[a]) for a in range(3)])
+        best = None
+        bestDistance = maxDistance
+        for r in range(first, last + 1):
+            if (r - 1) * self.cellSize > bestDistance:
+                break
+            items = self._Ring(center, r, lo, hi)
+            if exclude is not None:
+                items = items[items != exclude]
+            if len(items) == 0:
+                continue
+            offsets = self._positions[items] - point
+            distances = numpy.sqrt((offsets * offsets).sum(axis=1))
+            i = numpy.argmin(distances)
+            if distances[i] <= bestDistance:
+                (best, bestDistance) = (int(items[i]), float(distances[i]))
+        if best is None:
+            return None
+        return (best, bestDistance)
+
+    # The items in the cells r cells from center along at least one axis,
+    # leaving out any outside lo to hi
+    def _Ring(self, center, r, lo, hi):
+        cells = self.cells
+        items = []
+        (cx, cy, cz) = center
+        for x in range(max(cx - r, lo[0]), min(cx + r, hi[0]) + 1):
+            for y in range(max(cy - r, lo[1]), min(cy + r, hi[1]) + 1):
+                if abs(x - cx) == r or abs(y - cy) == r:
+                    zs = range(max(cz - r, lo[2]), min(cz + r, hi[2]) + 1)
+                elif r > 0:
+                    # Only the two ends along z
+                    zs = [z for z in (cz - r, cz + r) if lo[2] <= z <= hi[2]]
+                else:
+                    zs = [cz]
+                for z in zs:
+                    cell = cells.get(_PackKey(x, y, z))
+                    if cell is not None:
+                        items.extend(cell)
+        return numpy.array(items, numpy.intp)
+
+    # The items inside the frustum planes (as from m3dExtractFrustumPlanes)
+    # as spheres of radius around their positions, as an array in no
+    # particular order. Only the items of cells the frustum reaches are
+    # tested.
+    def QueryFrustum(self, planes, radius = 0.0):
+        if not self.cells:
+            return numpy.zeros(0, numpy.intp)
+        (keys, coordinates) = self._Occupied()
+        mins = coordinates * self.cellSize - radius
+        maxs = mins + (self.cellSize + 2.0 * radius)
+        cells = self.cells
+        items = []
+        for key in keys[m3dBoxesInFrustum(planes, mins, maxs)].tolist():
+            items.extend(cells[key])
+        items = numpy.array(items, numpy.intp)
+        return items[m3dSpheresInFrustum(planes, self._positions[items], radius)]
+
+
+# The key of the cell at x, y, z, as _Keys packs them
+def _PackKey(x, y, z):
+    return ((x + _OFFSET) << (2 * _BITS)) | ((y + _OFFSET) << _BITS) | (z + _OFFSET)
+
+# The origins of a FrameArray or a list of GLFrames, as an (N,3) array
+def _Origins(frames):
+    if hasattr(frames, 'origins'):
+        return frames.origins
+    return numpy.array([frame.vOrigin[0:3] for frame in frames], numpy.float64).reshape(-1, 3)
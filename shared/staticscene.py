@@ -0,0 +1,128 @@
+# Geometry that never moves, such as the walls of a long tunnel, kept as
+# many small meshes in a bounding volume hierarchy so only the ones in view
+# are drawn:
+#
+#   scene = StaticScene()
+#   for z in ...:
+#       scene.Add(MakeFloor(z), GL_QUADS, textures[TEXTURE_FLOOR])
+#   scene.Build('tunnel.npz')       # Loads the tree if it was saved before
+#   ...
+#   (planes, vEye) = gltViewFrustum()
+#   scene.Draw(planes, vEye)
+#
+# Each piece's box is found from its mesh, the tree is built over the boxes,
+# and Draw goes down it nearest first, leaving out the parts outside the
+# view, so the depth test throws away as much of what is behind as it can.
+# The tree can be saved, so a big scene needn't be built every time it is
+# loaded.
+#
+# It pays when most of the scene is out of view at any time. Something small
+# that is mostly in view, like the sphereworld ground, is quicker drawn whole
+# in one batch than cut up into pieces drawn one call each.
+
+import os
+from pyglet.gl import *
+from math3d import M3DMatrix44f, m3dExtractFrustumPlanes, m3dInvertMatrix44
+from meshcache import gltDrawMesh
+from bvh import BoundingVolumeHierarchy, LoadBoundingVolumeHierarchy, BoxesHash
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class StaticScene(object):
+    def __init__(self, leafSize = 1):
+        self.leafSize = leafSize
+        self.pieces = []        # (mesh, mode, texture) of each piece
+        self.bvh = None
+        self._mins = []
+        self._maxs = []
+
+    def __len__(self):
+        return len(self.pieces)
+
+    # Add a piece: a mesh drawn with mode, with texture bound if it isn't
+    # None. Returns its number.
+    def Add(self, mesh, mode = GL_TRIANGLE_STRIP, texture = None):
+        (vMin, vMax) = gltMeshBounds(mesh)
+        self.pieces.append((mesh, mode, texture))
+        self._mins.append(vMin)
+        self._maxs.append(vMax)
+        self.bvh = None
+        return len(self.pieces) - 1
+
+    # Build the tree over the pieces. With file, the tree saved there is
+    # read instead if it is for the same pieces, and the new one saved
+    # there if not.
+    def Build(self, file = None):
+        mins = numpy.array(self._mins, numpy.float64).reshape(-1, 3)
+        maxs = numpy.array(self._maxs, numpy.float64).reshape(-1, 3)
+        if file is not None and os.path.exists(file):
+            bvh = LoadBoundingVolumeHierarchy(file)
+            if _Matches(bvh, mins, maxs):
+                self.bvh = bvh
+                return
+        self.bvh = BoundingVolumeHierarchy(mins, maxs, self.leafSize)
+        if file is not None:
+            # Through an open file, so numpy doesn't add .npz to the name
+            f = open(file, 'wb')
+            self.bvh.Save(f)
+            f.close()
+
+    # The pieces in view of the frustum planes, nearest vEye first
+    def Visible(self, planes, vEye = None):
+        if self.bvh is None:
+            self.Build()
+        return self.bvh.QueryFrustum(planes, vEye)
+
+    # Draw the pieces in view, nearest first. Returns how many were drawn.
+    # With queue, a RenderQueue, they are submitted to it to be drawn when
+    # it is flushed instead, all with the modelview matrix as it is now.
+    def Draw(self, planes, vEye = None, bTexture = True, bNormals = True, queue = None):
+        texture = None
+        visible = self.Visible(planes, vEye)
+        if queue is not None and len(visible) > 0:
+            # Read once for all the pieces, rather than by Submit for each
+            mModelView = M3DMatrix44f()
+            glGetFloatv(GL_MODELVIEW_MATRIX, mModelView)
+        for i in visible:
+            (mesh, mode, pieceTexture) = self.pieces[i]
+            if queue is not None:
+                queue.Submit(lambda mesh = mesh, mode = mode: gltDrawMesh(mesh, mode, bTexture, bNormals), pieceTexture,
+                             mModelView = mModelView)
+                continue
+            if pieceTexture is not None and pieceTexture != texture:
+                glBindTexture(GL_TEXTURE_2D, pieceTexture)
+                texture = pieceTexture
+            gltDrawMesh(mesh, mode, bTexture, bNormals)
+        return len(visible)
+
+
+# The corners (vMin, vMax) of the box around the vertices a mesh uses
+def gltMeshBounds(mesh):
+    (vertices, indices) = mesh
+    positions = vertices[numpy.unique(indices), 5:8]
+    return (positions.min(axis=0).tolist(), positions.max(axis=0).tolist())
+
+# The frustum planes of GL's projection and modelview matrices as they are
+# now, in the space the modelview matrix takes points from, and where the eye
+# is in that space. Returns (planes, vEye).
+def gltViewFrustum(planes = None):
+    if planes is None:
+        planes = numpy.zeros((6, 4), numpy.float32)
+    mProjection = M3DMatrix44f()
+    mModelView = M3DMatrix44f()
+    glGetFloatv(GL_PROJECTION_MATRIX, mProjection)
+    glGetFloatv(GL_MODELVIEW_MATRIX, mModelView)
+    m3dExtractFrustumPlanes(planes, mProjection, mModelView)
+
+    # The eye is at the origin of eye space
+    mInverse = M3DMatrix44f()
+    m3dInvertMatrix44(mInverse, mModelView)
+    return (planes, (mInverse[12], mInverse[13], mInverse[14]))
+
+# Whether a saved tree is for the boxes mins and maxs: it has as many items,
+# and was built over the very same boxes
+def _Matches(bvh, mins, maxs):
+    return len(bvh) == len(mins) and bvh.boxHash == BoxesHash(mins, maxs)